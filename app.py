@@ -1,31 +1,75 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash
+from flask.cli import with_appcontext
+from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-import os
-from datetime import datetime
-import json
-import csv
-import io
-from jinja2 import select_autoescape
 
 # 从database.py导入db和login_manager
-from database import db, login_manager
+from database import db, login_manager, init_db
 
-# 创建应用
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'  # 在生产环境中应该使用一个更复杂的密钥
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///school_schedule.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# 禁用模板缓存，确保开发时能看到最新的模板
-app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+# 引入模型
+from models import User
+from static_assets import init_assets
+from reference_cache import init_cache
+from schedule_snapshots import init_snapshots
+from schedule_events import init_events
+from schedule_sandbox import init_sandboxes
+from timetable_cli import timetable_cli
+from db_audit import audit_db_command
+from timetable_publish import publish_timetables_command
+from schema_migrations import upgrade, upgrade_db_command, check_query_plans_command
+
+
+def create_app(config=None):
+    """
+    创建并配置Flask应用
+
+    创建应用时不访问数据库：建表和初始化管理员账户由 `flask init-db` 完成。
+    pandas、xlsxwriter 等较重的依赖由导入/导出接口在第一次调用时才加载
+
+    Args:
+        config: 额外配置，可以是字典或配置对象（如测试配置），会覆盖 config.py 中的设置
+
+    Returns:
+        Flask: 应用实例
+    """
+    app = Flask(__name__)
+    # 密钥、数据库地址和连接池设置见 config.py，可通过环境变量覆盖
+    app.config.from_pyfile('config.py')
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    # 禁用模板缓存，确保开发时能看到最新的模板
+    app.config.setdefault('TEMPLATES_AUTO_RELOAD', True)
+    app.config.setdefault('SEND_FILE_MAX_AGE_DEFAULT', 0)
+
+    # 启用Jinja2循环控制扩展，以支持break/continue等标签
+    app.jinja_env.add_extension('jinja2.ext.loopcontrols')
+    app.add_template_filter(grade_to_text, 'grade_to_text')
+
+    # 初始化db和login_manager
+    init_db(app)
+    login_manager.init_app(app)
+
+    init_cache(app)
+    init_assets(app)
+    init_snapshots(app)
+    init_events(app)
+    init_sandboxes(app)
+    register_core_routes(app)
+    register_blueprints(app)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(timetable_cli)
+    app.cli.add_command(audit_db_command)
+    app.cli.add_command(publish_timetables_command)
+    return app
 
-# 启用Jinja2循环控制扩展，以支持break/continue等标签
-app.jinja_env.add_extension('jinja2.ext.loopcontrols')
 
 # 添加自定义过滤器
-@app.template_filter('grade_to_text')
 def grade_to_text(grade):
     """将年级数字转换为中文显示"""
     grade_map = {
@@ -42,75 +86,115 @@ def grade_to_text(grade):
     except (ValueError, TypeError):
         return str(grade)
 
-# 初始化db和login_manager
-db.init_app(app)
-login_manager.init_app(app)
-
-# 引入模型
-from models import User, Teacher, Subject, Class, ClassCombination, TeachingPlan, Schedule, ScheduleSetting, SelfStudyPlan, SubstitutionArrangement, TemporarySubstitution
-
-# 创建数据库表并初始化管理员账户
-with app.app_context():
-    db.create_all()
-    
-    # 检查是否已存在管理员用户
-    if not User.query.filter_by(role='admin').first():
-        admin = User(
-            username='admin',
-            password=generate_password_hash('admin123'),
-            name='系统管理员',
-            role='admin'
-        )
-        db.session.add(admin)
-        db.session.commit()
-        print('已创建管理员账户')
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-# 首页路由
-@app.route('/')
-def index():
-    if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
-
-# 登录页面
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
-        
-        user = User.query.filter_by(username=username).first()
-        
-        if user and check_password_hash(user.password, password):
-            login_user(user)
+
+def register_core_routes(app):
+    """注册首页、登录、注销和仪表板路由"""
+
+    # 首页路由
+    @app.route('/')
+    def index():
+        if current_user.is_authenticated:
             return redirect(url_for('dashboard'))
-        else:
-            flash('用户名或密码错误!', 'danger')
-    
-    return render_template('login.html')
-
-# 注销
-@app.route('/logout')
-@login_required
-def logout():
-    logout_user()
-    return redirect(url_for('login'))
-
-# 仪表板
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    return render_template('dashboard.html')
-
-# 初始化数据库
-@app.cli.command('init-db')
+        return redirect(url_for('login'))
+
+    # 登录页面
+    @app.route('/login', methods=['GET', 'POST'])
+    def login():
+        if request.method == 'POST':
+            username = request.form.get('username')
+            password = request.form.get('password')
+
+            user = User.query.filter_by(username=username).first()
+
+            if user and check_password_hash(user.password, password):
+                login_user(user)
+                return redirect(url_for('dashboard'))
+            else:
+                flash('用户名或密码错误!', 'danger')
+
+        return render_template('login.html')
+
+    # 注销
+    @app.route('/logout')
+    @login_required
+    def logout():
+        logout_user()
+        return redirect(url_for('login'))
+
+    # 仪表板
+    @app.route('/dashboard')
+    @login_required
+    def dashboard():
+        return render_template('dashboard.html')
+
+
+def register_blueprints(app):
+    """导入并注册所有蓝图（在创建应用时才导入，导入 app 模块本身不加载路由）"""
+    from routes.users import users_bp
+    from routes.teachers import teachers_bp
+    from routes.subjects import subjects_bp
+    from routes.classes import classes_bp
+    from routes.class_combinations import combinations_bp
+    from routes.plans import plans_bp
+    from routes.schedule import schedule_bp
+    from routes.selfstudy import selfstudy_bp
+    from routes.substitution import substitution_bp
+    from routes.non_routine_sub import non_routine_bp
+    from routes.bulk_schedule import bulk_schedule_bp
+    from routes.imports import imports_bp
+    from routes.monitoring import monitoring_bp
+    from routes.analytics import analytics_bp
+    from routes.schedule_quality import schedule_quality_bp
+    from routes.snapshots import snapshots_bp
+    from routes.solver import solver_bp
+    from routes.selfstudy_grid import selfstudy_grid_bp
+    from routes.schedule_events import schedule_events_bp
+    from routes.sandbox import sandbox_bp
+    from routes.lists import lists_bp
+    from routes.search import search_bp
+    from routes.publish import publish_bp
+    from routes.subject_days import subject_days_bp
+
+    # 注册蓝图
+    app.register_blueprint(users_bp)
+    app.register_blueprint(teachers_bp)
+    app.register_blueprint(subjects_bp)
+    app.register_blueprint(classes_bp)
+    app.register_blueprint(combinations_bp)
+    app.register_blueprint(plans_bp)
+    app.register_blueprint(schedule_bp)
+    app.register_blueprint(selfstudy_bp)
+    app.register_blueprint(substitution_bp)
+    app.register_blueprint(non_routine_bp)
+    app.register_blueprint(bulk_schedule_bp)
+    app.register_blueprint(imports_bp)
+    app.register_blueprint(monitoring_bp)
+    app.register_blueprint(analytics_bp)
+    app.register_blueprint(schedule_quality_bp)
+    app.register_blueprint(snapshots_bp)
+    app.register_blueprint(solver_bp)
+    app.register_blueprint(selfstudy_grid_bp)
+    app.register_blueprint(schedule_events_bp)
+    app.register_blueprint(sandbox_bp)
+    app.register_blueprint(lists_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(publish_bp)
+    app.register_blueprint(subject_days_bp)
+
+
+# 初始化数据库：建表并创建默认管理员账户
+@click.command('init-db')
+@with_appcontext
 def init_db_command():
     db.create_all()
-    
+    # 记录结构版本，并为旧数据库补充缺失的列和索引
+    upgrade()
+
     # 检查是否已存在管理员用户
     if not User.query.filter_by(role='admin').first():
         admin = User(
@@ -121,32 +205,18 @@ def init_db_command():
         )
         db.session.add(admin)
         db.session.commit()
-    
+        print('已创建管理员账户')
+
     print('数据库初始化完成!')
 
-# 导入所有蓝图
-from routes.users import users_bp
-from routes.teachers import teachers_bp
-from routes.subjects import subjects_bp
-from routes.classes import classes_bp
-from routes.class_combinations import combinations_bp
-from routes.plans import plans_bp
-from routes.schedule import schedule_bp
-from routes.selfstudy import selfstudy_bp
-from routes.substitution import substitution_bp
-from routes.non_routine_sub import non_routine_bp
-
-# 注册蓝图
-app.register_blueprint(users_bp)
-app.register_blueprint(teachers_bp)
-app.register_blueprint(subjects_bp)
-app.register_blueprint(classes_bp)
-app.register_blueprint(combinations_bp)
-app.register_blueprint(plans_bp)
-app.register_blueprint(schedule_bp)
-app.register_blueprint(selfstudy_bp)
-app.register_blueprint(substitution_bp)
-app.register_blueprint(non_routine_bp)
+
+def __getattr__(name):
+    # 兼容 `from app import app` 的脚本和 flask 命令：第一次访问 app 时才创建应用
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    create_app().run(debug=True, port=5001)
@@ -0,0 +1,997 @@
+"""
+批量导入模块
+教师、班级、学科、授课计划（含早晚自习授课计划）共用的导入流程：
+直接从内存读取上传文件，按实体预加载一次"名称->ID"映射，
+用pandas向量化操作校验各列，最后在同一个事务中批量写入，并返回逐行的错误报告
+"""
+
+import hashlib
+import io
+import json
+from datetime import datetime
+from typing import Dict, List
+
+import chardet
+import pandas as pd
+from sqlalchemy import func
+
+from database import db
+from models import (Teacher, Subject, Class, ClassCombination, TeachingPlan, SelfStudyPlan,
+                    Schedule, SelfStudySchedule, teacher_subject, class_combination_detail)
+import reference_cache
+
+
+# CSV文件依次尝试的编码
+CSV_ENCODINGS = ['utf-8', 'gbk', 'gb18030', 'gb2312', 'latin1']
+
+# 年级名称到数字的映射
+GRADE_MAPPING = {
+    '初一': 7, '七年级': 7, '7': 7,
+    '初二': 8, '八年级': 8, '8': 8,
+    '初三': 9, '九年级': 9, '9': 9,
+    '高一': 10, '十年级': 10, '10': 10,
+    '高二': 11, '十一年级': 11, '11': 11,
+    '高三': 12, '十二年级': 12, '12': 12
+}
+
+TRUE_VALUES = {'是', '1', 'true', 'True', 'TRUE', 'yes', 'Y', 'y'}
+
+# 星期名称到数字的映射（学科的固定排课日）
+DAY_MAPPING = {
+    '1': 1, '周一': 1, '星期一': 1,
+    '2': 2, '周二': 2, '星期二': 2,
+    '3': 3, '周三': 3, '星期三': 3,
+    '4': 4, '周四': 4, '星期四': 4,
+    '5': 5, '周五': 5, '星期五': 5,
+    '6': 6, '周六': 6, '星期六': 6,
+    '7': 7, '周日': 7, '星期日': 7, '星期天': 7
+}
+
+
+class UploadError(ValueError):
+    """上传文件无法读取或缺少必要的列"""
+
+
+class ImportReport:
+    """
+    导入结果报告
+
+    逐行记录错误（行号按Excel显示的行号，即数据行索引+2），
+    每行只记录第一条错误，出错的行不会写入数据库
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.total = len(df)
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.notes: List[str] = []
+        self.errors: List[Dict] = []
+        self.valid = pd.Series(True, index=df.index)
+
+    def reject(self, mask: pd.Series, message):
+        """
+        将mask为True且尚未出错的行标记为失败
+
+        Args:
+            mask: 布尔Series，与数据行对齐
+            message: 错误信息，可以是字符串或与数据行对齐的字符串Series
+        """
+        mask = mask.fillna(False).astype(bool) & self.valid
+        if not mask.any():
+            return
+        if isinstance(message, pd.Series):
+            messages = message[mask].astype(str)
+        else:
+            messages = pd.Series(message, index=mask.index)[mask]
+        self.errors.extend(
+            {'row': int(index) + 2, 'message': text}
+            for index, text in messages.items()
+        )
+        self.valid &= ~mask
+
+    def reject_duplicates(self, keys, message):
+        """
+        在尚未出错的行中查找重复的键，保留第一次出现的行，其余标记为失败
+
+        Args:
+            keys: 与数据行对齐的Series或DataFrame（多列组成联合键）
+            message: 错误信息
+        """
+        duplicated = keys[self.valid].duplicated()
+        self.reject(duplicated.reindex(self.valid.index, fill_value=False), message)
+
+    @property
+    def failed(self) -> int:
+        return len(self.errors)
+
+    def to_dict(self) -> Dict:
+        return {
+            'total': self.total,
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'notes': self.notes,
+            'errors': sorted(self.errors, key=lambda e: e['row'])
+        }
+
+    def summary(self, limit: int = 5) -> str:
+        """生成用于flash提示的摘要信息"""
+        message = f'新增 {self.created} 条，更新 {self.updated} 条'
+        if self.skipped:
+            message += f'，跳过 {self.skipped} 条'
+        if self.errors:
+            sample = sorted(self.errors, key=lambda e: e['row'])[:limit]
+            message += f'，{self.failed} 条记录导入失败!<br>错误样本:<br>'
+            message += '<br>'.join(f"第{e['row']}行: {e['message']}" for e in sample)
+            if self.failed > limit:
+                message += f'<br>... 以及其他 {self.failed - limit} 个错误'
+        if self.notes:
+            message = '<br>'.join(self.notes) + '<br><br>' + message
+        return message
+
+
+def read_upload(file, allowed=('.csv', '.xls', '.xlsx')) -> pd.DataFrame:
+    """
+    直接从内存读取上传的CSV/Excel文件，不再写入临时目录
+
+    Args:
+        file: werkzeug的FileStorage或任何带filename和read()的文件对象
+        allowed: 允许的扩展名
+
+    Returns:
+        pd.DataFrame: 读取到的数据
+    """
+    filename = (file.filename or '').lower()
+    if not filename.endswith(tuple(allowed)):
+        raise UploadError(f'文件格式不支持，请上传 {"/".join(allowed)} 文件!')
+
+    content = file.read()
+
+    if filename.endswith('.csv'):
+        detected = chardet.detect(content[:65536]).get('encoding')
+        encodings = ([detected] if detected else []) + CSV_ENCODINGS
+        for encoding in encodings:
+            try:
+                return pd.read_csv(io.BytesIO(content), encoding=encoding)
+            except (UnicodeDecodeError, LookupError):
+                continue
+        raise UploadError('无法识别文件编码，请尝试保存为UTF-8编码格式!')
+
+    return pd.read_excel(io.BytesIO(content))
+
+
+def _require_columns(df: pd.DataFrame, columns: List[str]):
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise UploadError(f'文件中缺少必要的列: {", ".join(missing)}')
+
+
+def _text(df: pd.DataFrame, column: str) -> pd.Series:
+    """把一列规范化为去掉首尾空白的字符串，空单元格为None；数字形式的编号去掉多余的'.0'"""
+    if column not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    raw = df[column]
+    text = raw.astype(str).str.strip().str.replace(r'^(\d+)\.0$', r'\1', regex=True)
+    return text.where(raw.notna() & (text != ''), None)
+
+
+def _flag(df: pd.DataFrame, column: str) -> pd.Series:
+    """把"是/否"类型的列转换为布尔值"""
+    return _text(df, column).isin(TRUE_VALUES)
+
+
+def _name_map(model, column=None) -> Dict[str, int]:
+    """一次查询得到 名称 -> ID 映射；重名时取ID最小的记录"""
+    column = column if column is not None else model.name
+    mapping = {}
+    for name, id_ in db.session.query(column, model.id).order_by(model.id):
+        mapping.setdefault(name, id_)
+    return mapping
+
+
+def _create_subjects(names, report) -> Dict[str, int]:
+    """批量创建缺失的学科，返回最新的学科映射"""
+    subject_map = _name_map(Subject)
+    missing = sorted(set(names) - set(subject_map))
+    if missing:
+        db.session.bulk_insert_mappings(Subject, [{'name': name} for name in missing])
+        subject_map = _name_map(Subject)
+        report.notes.append(f'自动创建了 {len(missing)} 个新学科: ' + ', '.join(missing[:5])
+                            + ('...' if len(missing) > 5 else ''))
+    return subject_map
+
+
+def _create_teachers(names, report) -> Dict[str, int]:
+    """批量创建缺失的教师（自动生成工号），返回最新的教师映射"""
+    teacher_map = _name_map(Teacher)
+    missing = sorted(set(names) - set(teacher_map))
+    if missing:
+        db.session.bulk_insert_mappings(Teacher, [
+            {'name': name, 'staff_id': staff_id, 'gender': '未知', 'max_hours_per_day': 6}
+            for name, staff_id in zip(missing, _next_staff_ids(len(missing)))
+        ])
+        teacher_map = _name_map(Teacher)
+        report.notes.append(f'自动创建了 {len(missing)} 名教师: ' + ', '.join(missing[:5])
+                            + ('...' if len(missing) > 5 else ''))
+    return teacher_map
+
+
+def _next_staff_ids(count: int) -> List[str]:
+    """生成count个新教师工号（格式：T + 年份 + 3位序号），只查询一次当前最大工号"""
+    prefix = f'T{datetime.now().year}'
+    latest = db.session.query(func.max(Teacher.staff_id)) \
+        .filter(Teacher.staff_id.like(f'{prefix}%')).scalar()
+    try:
+        seq = int(latest[len(prefix):]) if latest else 0
+    except ValueError:
+        seq = 0
+    return [f'{prefix}{seq + i:03d}' for i in range(1, count + 1)]
+
+
+def _link_teacher_subjects(pairs):
+    """为(教师ID, 学科ID)补充教授关系，已存在的关系不重复插入"""
+    pairs = set(pairs)
+    if not pairs:
+        return
+    existing = set(db.session.query(teacher_subject.c.teacher_id, teacher_subject.c.subject_id))
+    missing = pairs - existing
+    if missing:
+        db.session.execute(
+            teacher_subject.insert(),
+            [{'teacher_id': t, 'subject_id': s} for t, s in sorted(missing)]
+        )
+
+
+def import_subjects(df: pd.DataFrame) -> ImportReport:
+    """
+    导入学科：按名称新增或更新（提供"是否主科"、"固定排课日"列时更新对应的字段）
+
+    固定排课日只取自"固定排课日"列，不按学科名称推断；没有这一列时新学科不固定排课日
+
+    Args:
+        df: 包含 name/学科名称 列，可选 is_major/是否主科、fixed_day/固定排课日（1-7 或 周一~周日）列
+
+    Returns:
+        ImportReport: 导入报告
+    """
+    df = df.rename(columns={'学科名称': 'name', '学科': 'name', '是否主科': 'is_major', '固定排课日': 'fixed_day'})
+    _require_columns(df, ['name'])
+    report = ImportReport(df)
+
+    names = _text(df, 'name')
+    report.reject(names.isna(), '学科名称为空')
+    report.reject_duplicates(names, '学科 ' + names.fillna('') + ' 在文件中重复')
+
+    has_major = 'is_major' in df.columns
+    is_major = _flag(df, 'is_major')
+    has_fixed_day = 'fixed_day' in df.columns
+    fixed_day_text = _text(df, 'fixed_day')
+    fixed_days = fixed_day_text.map(DAY_MAPPING)
+    report.reject(fixed_day_text.notna() & fixed_days.isna(),
+                  '固定排课日 ' + fixed_day_text.fillna('') + ' 无效，应为1-7或周一至周日')
+
+    def fixed_day(index):
+        if not has_fixed_day or pd.isna(fixed_days[index]):
+            return None
+        return int(fixed_days[index])
+
+    try:
+        subject_map = _name_map(Subject)
+        valid_names = names[report.valid]
+        existing_ids = valid_names.map(subject_map)
+
+        new_rows = valid_names[existing_ids.isna()]
+        db.session.bulk_insert_mappings(Subject, [
+            {'name': name, 'is_major': bool(is_major[index]), 'fixed_day': fixed_day(index)}
+            for index, name in new_rows.items()
+        ])
+        report.created = len(new_rows)
+
+        old_rows = existing_ids.dropna()
+        if has_major or has_fixed_day:
+            updates = []
+            for index, id_ in old_rows.items():
+                values = {'id': int(id_)}
+                if has_major:
+                    values['is_major'] = bool(is_major[index])
+                if has_fixed_day:
+                    values['fixed_day'] = fixed_day(index)
+                updates.append(values)
+            db.session.bulk_update_mappings(Subject, updates)
+            report.updated = len(old_rows)
+        else:
+            report.skipped = len(old_rows)
+
+        db.session.commit()
+        # 批量写入不触发ORM事件，需要手动使基础数据缓存失效
+        reference_cache.invalidate('subjects', 'teacher_subjects')
+    except Exception:
+        db.session.rollback()
+        raise
+    return report
+
+
+def import_classes(df: pd.DataFrame) -> ImportReport:
+    """
+    导入班级：按班级名称新增或更新年级和班主任
+
+    Args:
+        df: 包含 班级名称/name、年级/grade 列，可选 班主任姓名 或 head_teacher_staff_id 列
+
+    Returns:
+        ImportReport: 导入报告
+    """
+    df = df.rename(columns={
+        '班级名称': 'name',
+        '年级': 'grade',
+        '班主任姓名': 'head_teacher_name',
+        '班主任工号': 'head_teacher_staff_id'
+    })
+    _require_columns(df, ['name', 'grade'])
+    report = ImportReport(df)
+
+    names = _text(df, 'name')
+    grades = _text(df, 'grade').map(GRADE_MAPPING)
+    report.reject(names.isna(), '班级名称为空')
+    report.reject_duplicates(names, '班级 ' + names.fillna('') + ' 在文件中重复')
+    report.reject(grades.isna(), '年级 ' + _text(df, 'grade').fillna('') + ' 无效')
+
+    # 班主任：优先按姓名查找，其次按工号查找（兼容旧版）
+    head_names = _text(df, 'head_teacher_name')
+    head_staff = _text(df, 'head_teacher_staff_id')
+    head_ids = head_names.map(_name_map(Teacher))
+    head_ids = head_ids.fillna(head_staff.map(_name_map(Teacher, Teacher.staff_id)))
+    report.reject(head_names.notna() & head_ids.isna(), '班主任 ' + head_names.fillna('') + ' 不存在')
+
+    try:
+        class_map = _name_map(Class)
+        valid = report.valid
+        existing_ids = names[valid].map(class_map)
+        records = pd.DataFrame({
+            'name': names[valid],
+            'grade': grades[valid].astype(int),
+            'head_teacher_id': head_ids[valid],
+            'id': existing_ids
+        })
+
+        def to_mapping(row, with_id):
+            mapping = {'name': row.name, 'grade': int(row.grade)}
+            if pd.notna(row.head_teacher_id):
+                mapping['head_teacher_id'] = int(row.head_teacher_id)
+            if with_id:
+                mapping['id'] = int(row.id)
+            return mapping
+
+        new_rows = records[records['id'].isna()]
+        old_rows = records[records['id'].notna()]
+        db.session.bulk_insert_mappings(Class, [to_mapping(r, False) for r in new_rows.itertuples()])
+        db.session.bulk_update_mappings(Class, [to_mapping(r, True) for r in old_rows.itertuples()])
+        report.created = len(new_rows)
+        report.updated = len(old_rows)
+
+        db.session.commit()
+        # 批量写入不触发ORM事件，需要手动使基础数据缓存失效
+        reference_cache.invalidate('classes')
+    except Exception:
+        db.session.rollback()
+        raise
+    return report
+
+
+def import_teachers(df: pd.DataFrame, auto_create_subjects: bool = False) -> ImportReport:
+    """
+    导入教师：有工号且工号已存在时更新姓名，否则新增；同时补充教授学科关系
+
+    Args:
+        df: 包含 姓名、教授学科 列，可选 工号、每天最大课时 列
+        auto_create_subjects: 是否自动创建文件中出现但系统中不存在的学科
+
+    Returns:
+        ImportReport: 导入报告
+    """
+    _require_columns(df, ['姓名', '教授学科'])
+    report = ImportReport(df)
+
+    names = _text(df, '姓名')
+    staff_ids = _text(df, '工号')
+    max_hours = pd.to_numeric(df['每天最大课时'], errors='coerce') \
+        if '每天最大课时' in df.columns else pd.Series(float('nan'), index=df.index)
+
+    report.reject(names.isna(), '姓名为空')
+    report.reject(staff_ids.notna() & staff_ids.duplicated(),
+                  '工号 ' + staff_ids.fillna('') + ' 在文件中重复')
+
+    # 拆分"教授学科"：一行一个(行, 学科)
+    subject_cells = _text(df, '教授学科').fillna('')
+    subject_pairs = subject_cells.str.split(r'[,，、]').explode().str.strip()
+    subject_pairs = subject_pairs[subject_pairs != '']
+
+    try:
+        if auto_create_subjects:
+            subject_map = _create_subjects(subject_pairs[report.valid.loc[subject_pairs.index].values].unique(), report)
+        else:
+            subject_map = _name_map(Subject)
+
+        subject_pair_ids = subject_pairs.map(subject_map).dropna().astype(int)
+        matched_rows = pd.Series(False, index=df.index)
+        matched_rows[subject_pair_ids.index.unique()] = True
+        report.reject(subject_cells.ne('') & ~matched_rows,
+                      names.fillna('') + ' - 未找到任何匹配的学科 (' + subject_cells + ')')
+
+        valid = report.valid
+        staff_map = _name_map(Teacher, Teacher.staff_id)
+
+        # 没有工号的行自动生成工号
+        need_ids = valid & staff_ids.isna()
+        staff_ids = staff_ids.copy()
+        staff_ids[need_ids] = _next_staff_ids(int(need_ids.sum()))
+
+        existing_ids = staff_ids[valid].map(staff_map)
+        new_index = existing_ids[existing_ids.isna()].index
+        old_index = existing_ids.dropna().index
+
+        def teacher_mapping(index):
+            mapping = {'name': names[index], 'staff_id': staff_ids[index]}
+            if pd.notna(max_hours[index]):
+                mapping['max_hours_per_day'] = int(max_hours[index])
+            return mapping
+
+        inserts = []
+        for index in new_index:
+            mapping = teacher_mapping(index)
+            mapping.setdefault('gender', '未知')
+            mapping.setdefault('max_hours_per_day', 6)
+            inserts.append(mapping)
+        db.session.bulk_insert_mappings(Teacher, inserts)
+        db.session.bulk_update_mappings(Teacher, [
+            {**teacher_mapping(index), 'id': int(existing_ids[index])} for index in old_index
+        ])
+        report.created = len(new_index)
+        report.updated = len(old_index)
+
+        # 重新加载工号映射以取得新教师ID，然后批量补充教授学科
+        staff_map = _name_map(Teacher, Teacher.staff_id)
+        teacher_ids = staff_ids[valid].map(staff_map)
+        valid_pairs = subject_pair_ids[subject_pair_ids.index.isin(teacher_ids.index)]
+        _link_teacher_subjects(
+            (int(teacher_ids[index]), int(subject_id)) for index, subject_id in valid_pairs.items()
+        )
+
+        db.session.commit()
+        # 批量写入不触发ORM事件，需要手动使基础数据缓存失效
+        reference_cache.invalidate('teachers', 'subjects', 'teacher_subjects')
+    except Exception:
+        db.session.rollback()
+        raise
+    return report
+
+
+def import_plans(df: pd.DataFrame, plan_model=TeachingPlan, upsert: bool = True,
+                 clear_existing: bool = False) -> ImportReport:
+    """
+    导入授课计划（正课或早晚自习），班级+学科作为唯一键
+
+    缺失的学科和教师会自动创建，并自动为教师补充该学科的教授关系，与原导入功能一致
+
+    Args:
+        df: 包含 班级、学科、教师、周课时 列，可选 是否合班、合班名称、周类型、额外课时、额外周类型 列
+        plan_model: TeachingPlan 或 SelfStudyPlan
+        upsert: 已存在同班级同学科的计划时是否更新（False时该行报错）
+        clear_existing: 导入前是否清空该类授课计划
+
+    Returns:
+        ImportReport: 导入报告
+    """
+    _require_columns(df, ['班级', '学科', '教师', '周课时'])
+    report = ImportReport(df)
+
+    class_names = _text(df, '班级')
+    subject_names = _text(df, '学科')
+    teacher_names = _text(df, '教师')
+    hours = pd.to_numeric(df['周课时'], errors='coerce')
+    extra_hours = pd.to_numeric(df['额外课时'], errors='coerce') \
+        if '额外课时' in df.columns else pd.Series(float('nan'), index=df.index)
+    is_combined = _flag(df, '是否合班')
+    combination_names = _text(df, '合班名称')
+    week_types = _text(df, '周类型')
+    extra_week_types = _text(df, '额外周类型')
+
+    report.reject(class_names.isna(), '班级为空')
+    report.reject(subject_names.isna(), '学科为空')
+    report.reject(teacher_names.isna(), '教师为空')
+    report.reject(hours.isna() | (hours % 1 != 0) | ~hours.between(1, 20),
+                  '周课时 ' + df['周课时'].astype(str) + ' 无效')
+
+    class_ids = class_names.map(_name_map(Class))
+    report.reject(class_ids.isna(), "班级 '" + class_names.fillna('') + "' 不存在")
+    report.reject_duplicates(pd.concat([class_names, subject_names], axis=1),
+                             '班级 ' + class_names.fillna('') + ' 的 ' + subject_names.fillna('') + ' 在文件中重复')
+
+    try:
+        valid = report.valid
+        subject_map = _create_subjects(subject_names[valid].unique(), report)
+        subject_ids = subject_names.map(subject_map)
+
+        teacher_ids = teacher_names.map(_create_teachers(teacher_names[valid].unique(), report))
+
+        # 合班校验：合班存在、学科一致、班级属于该合班
+        combination_ids = pd.Series(float('nan'), index=df.index)
+        wants_combination = is_combined & combination_names.notna()
+        if wants_combination.any():
+            combinations = {
+                name: (id_, subject_id)
+                for id_, name, subject_id in db.session.query(
+                    ClassCombination.id, ClassCombination.name, ClassCombination.subject_id)
+            }
+            members = set(db.session.query(class_combination_detail.c.combination_id,
+                                           class_combination_detail.c.class_id))
+            combination_ids = combination_names.map(lambda n: combinations.get(n, (None,))[0])
+            combination_subjects = combination_names.map(lambda n: combinations.get(n, (None, None))[1])
+            report.reject(wants_combination & combination_ids.isna(),
+                          '合班 ' + combination_names.fillna('') + ' 不存在')
+            report.reject(wants_combination & (combination_subjects != subject_ids),
+                          '合班 ' + combination_names.fillna('') + ' 的学科与所选学科 '
+                          + subject_names.fillna('') + ' 不匹配')
+            is_member = pd.Series(
+                [(c, k) in members for c, k in zip(combination_ids, class_ids)], index=df.index)
+            report.reject(wants_combination & ~is_member,
+                          '班级 ' + class_names.fillna('') + ' 不在合班 ' + combination_names.fillna('') + ' 中')
+
+        if clear_existing:
+            plan_model.query.delete()
+            existing = {}
+        else:
+            existing = {
+                (class_id, subject_id): id_
+                for id_, class_id, subject_id in db.session.query(
+                    plan_model.id, plan_model.class_id, plan_model.subject_id)
+            }
+        plan_ids = pd.Series(
+            [existing.get((c, s)) for c, s in zip(class_ids, subject_ids)], index=df.index, dtype=object)
+
+        if not upsert:
+            report.reject(plan_ids.notna(),
+                          '班级 ' + class_names.fillna('') + ' 的 ' + subject_names.fillna('') + ' 已有授课计划')
+
+        valid = report.valid
+        inserts, updates = [], []
+        pairs = set()
+        for index in df.index[valid]:
+            combined = bool(wants_combination[index])
+            mapping = {
+                'class_id': int(class_ids[index]),
+                'subject_id': int(subject_ids[index]),
+                'teacher_id': int(teacher_ids[index]),
+                'hours_per_week': int(hours[index]),
+                'is_combined': combined,
+                'combination_id': int(combination_ids[index]) if combined else None,
+                'week_type': week_types[index] or 'all',
+                'extra_hours': int(extra_hours[index]) if pd.notna(extra_hours[index]) else None,
+                'extra_week_type': extra_week_types[index]
+            }
+            pairs.add((mapping['teacher_id'], mapping['subject_id']))
+            if plan_ids[index] is not None:
+                mapping['id'] = plan_ids[index]
+                updates.append(mapping)
+            else:
+                inserts.append(mapping)
+
+        db.session.bulk_insert_mappings(plan_model, inserts)
+        db.session.bulk_update_mappings(plan_model, updates)
+        _link_teacher_subjects(pairs)
+        report.created = len(inserts)
+        report.updated = len(updates)
+
+        db.session.commit()
+        # 批量写入不触发ORM事件，需要手动使基础数据缓存失效
+        reference_cache.invalidate('subjects', 'teachers', 'teacher_subjects')
+    except Exception:
+        db.session.rollback()
+        raise
+    return report
+
+
+# ---------------------------------------------------------------------------
+# 矩阵式授课计划导入（课时安排 / 教师安排 两个工作表）的预览与差异应用
+# ---------------------------------------------------------------------------
+
+MATRIX_SHEETS = ('课时安排', '教师安排')
+
+# 课时格式：4、4.0、s1(单周1节)、d2(双周2节)、f2(随机单双周)、4s1(每周4节+单周1节)、2d1(每周2节+双周1节)
+_HOURS_PATTERN = (r'^(?:(?P<base>\d+)(?P<extra_type>[sd])(?P<extra>\d+)'
+                  r'|(?P<type>[sdf])(?P<typed>\d+)'
+                  r'|(?P<plain>\d+(?:\.\d+)?))$')
+
+# 比较授课计划是否变化时使用的字段
+PLAN_FIELDS = ['teacher_id', 'hours_per_week', 'week_type', 'extra_hours', 'extra_week_type',
+               'is_combined', 'combination_id']
+
+
+class StaleChangesetError(ValueError):
+    """应用时重新计算的变更与预览时不一致（预览后数据已被修改）"""
+
+
+def parse_hours(values: pd.Series) -> pd.DataFrame:
+    """
+    向量化解析课时单元格，格式与原矩阵导入的 parse_hours 一致
+
+    Args:
+        values: 课时单元格
+
+    Returns:
+        pd.DataFrame: hours, week_type, extra_hours, extra_week_type, invalid 五列；
+                      空单元格的 hours 为0，无法解析的单元格 invalid 为True
+    """
+    text = values.astype(str).str.strip().str.lower()
+    empty = values.isna() | (text == '')
+    parts = text.str.extract(_HOURS_PATTERN)
+
+    hours = pd.to_numeric(parts['base'], errors='coerce') \
+        .fillna(pd.to_numeric(parts['typed'], errors='coerce')) \
+        .fillna(pd.to_numeric(parts['plain'], errors='coerce') // 1)
+
+    return pd.DataFrame({
+        'hours': hours.where(~empty, 0),
+        'week_type': parts['type'].fillna('all'),
+        'extra_hours': pd.to_numeric(parts['extra'], errors='coerce'),
+        'extra_week_type': parts['extra_type'].where(parts['extra_type'].notna(), None),
+        'invalid': ~empty & hours.isna()
+    }, index=values.index)
+
+
+def read_matrix(file) -> pd.DataFrame:
+    """
+    读取矩阵式授课计划并展开为"每个班级-学科一行"的规范化数据
+
+    Returns:
+        pd.DataFrame: row, class_name, subject_name, teacher_name, is_combined,
+                      hours, week_type, extra_hours, extra_week_type, invalid
+    """
+    filename = (file.filename or '').lower()
+    if not filename.endswith(('.xlsx', '.xls')):
+        raise UploadError('请上传Excel文件(.xlsx或.xls格式)!')
+
+    xl = pd.ExcelFile(io.BytesIO(file.read()))
+    if any(sheet not in xl.sheet_names for sheet in MATRIX_SHEETS):
+        raise UploadError('Excel文件必须包含"课时安排"和"教师安排"两个工作表!')
+
+    hours_df = xl.parse(MATRIX_SHEETS[0])
+    teachers_df = xl.parse(MATRIX_SHEETS[1])
+
+    if '班级' not in hours_df.columns or '班级' not in teachers_df.columns:
+        raise UploadError('工作表必须包含"班级"列!')
+    if not hours_df.columns.equals(teachers_df.columns):
+        raise UploadError('两个工作表的列名（学科）必须完全一致!')
+
+    # 排除说明文本行（以"数字+顿号/点号"开头）
+    hours_classes = _text(hours_df, '班级')
+    valid_rows = hours_classes.notna() & ~hours_classes.fillna('').str.match(r'^\d[、.]')
+    hours_df = hours_df[valid_rows]
+    teachers_df = teachers_df.reindex(hours_df.index)
+
+    hours_classes = _text(hours_df, '班级')
+    teacher_classes = _text(teachers_df, '班级')
+    mismatch = hours_classes != teacher_classes
+    if mismatch.any():
+        diff = [f"行{index + 2}: '{hours_classes[index]}' vs '{teacher_classes[index]}'"
+                for index in hours_classes.index[mismatch][:5]]
+        raise UploadError('两个工作表的班级名称不一致!<br>具体差异:<br>' + '<br>'.join(diff))
+
+    subjects = [column for column in hours_df.columns if column != '班级']
+    hours_long = hours_df.assign(班级=hours_classes).melt(
+        id_vars='班级', value_vars=subjects, var_name='subject_name', value_name='hours_raw',
+        ignore_index=False)
+    teachers_long = teachers_df.assign(班级=hours_classes).melt(
+        id_vars='班级', value_vars=subjects, var_name='subject_name', value_name='teacher_raw',
+        ignore_index=False)
+
+    frame = pd.DataFrame({
+        'row': hours_long.index + 2,
+        'class_name': hours_long['班级'].values,
+        'subject_name': hours_long['subject_name'].astype(str).str.strip().values
+    })
+    parsed = parse_hours(hours_long['hours_raw'].reset_index(drop=True))
+    teacher_text = _text(teachers_long.reset_index(drop=True), 'teacher_raw')
+    frame['is_combined'] = teacher_text.fillna('').str.endswith('*')
+    frame['teacher_name'] = teacher_text.str.rstrip('*').str.strip()
+    frame = pd.concat([frame, parsed], axis=1)
+
+    # 与原导入一致：无课时或无教师的单元格视为该班级不开设此学科
+    keep = frame['invalid'] | ((frame['hours'] > 0) & frame['teacher_name'].notna() & (frame['teacher_name'] != ''))
+    frame = frame[keep].reset_index(drop=True)
+    frame.attrs['classes'] = sorted(set(hours_classes))
+    frame.attrs['subjects'] = [str(subject).strip() for subject in subjects]
+    return frame
+
+
+class MatrixChangeset:
+    """矩阵导入的变更集：新增、修改、删除的授课计划以及受影响的已排课程"""
+
+    def __init__(self, plan_model):
+        self.plan_model = plan_model
+        self.inserts: List[Dict] = []
+        self.updates: List[Dict] = []
+        self.deletes: List[Dict] = []
+        self.unchanged = 0
+        self.invalidated: List[Dict] = []
+        self.errors: List[Dict] = []
+        self.notes: List[str] = []
+        self.new_subjects: List[str] = []
+        self.new_teachers: List[str] = []
+
+    @property
+    def fingerprint(self) -> str:
+        """只基于名称和计划ID计算的摘要，预览和应用时结果一致即可确认数据未被他人修改"""
+        def strip_ids(items):
+            return [{k: v for k, v in item.items() if not k.endswith('_id') or k == 'plan_id'} for item in items]
+        payload = json.dumps([strip_ids(self.inserts), strip_ids(self.updates), strip_ids(self.deletes)],
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def to_dict(self) -> Dict:
+        return {
+            'fingerprint': self.fingerprint,
+            'inserts': self.inserts,
+            'updates': self.updates,
+            'deletes': self.deletes,
+            'unchanged': self.unchanged,
+            'invalidated': self.invalidated,
+            'errors': self.errors,
+            'notes': self.notes,
+            'new_subjects': self.new_subjects,
+            'new_teachers': self.new_teachers
+        }
+
+
+def _normalize_plan_fields(df: pd.DataFrame) -> pd.DataFrame:
+    """把可比较字段统一成相同的表示（None/NaN、'all'/空、非合班的合班ID）"""
+    normalized = pd.DataFrame(index=df.index)
+    normalized['teacher_id'] = df['teacher_id'].astype(float).fillna(-1)
+    normalized['hours_per_week'] = df['hours_per_week'].astype(float)
+    normalized['week_type'] = df['week_type'].fillna('all')
+    normalized['extra_hours'] = df['extra_hours'].astype(float).fillna(0)
+    normalized['extra_week_type'] = df['extra_week_type'].where(df['extra_hours'].astype(float).fillna(0) > 0, None).fillna('')
+    normalized['is_combined'] = df['is_combined'].fillna(False).astype(bool)
+    normalized['combination_id'] = df['combination_id'].astype(float).where(normalized['is_combined'], -1).fillna(-1)
+    return normalized
+
+
+def diff_matrix(frame: pd.DataFrame, plan_model=TeachingPlan) -> MatrixChangeset:
+    """
+    将规范化的矩阵数据与现有授课计划按(班级, 学科)比较，生成变更集
+
+    只比较矩阵中出现的班级和学科：矩阵中有而数据库中没有的计划为新增，
+    两边都有但字段不同的为修改，矩阵覆盖范围内数据库有而矩阵中为空的为删除
+
+    Args:
+        frame: read_matrix 的结果
+        plan_model: TeachingPlan 或 SelfStudyPlan
+
+    Returns:
+        MatrixChangeset: 变更集（不修改数据库）
+    """
+    changeset = MatrixChangeset(plan_model)
+    frame = frame.copy()
+
+    class_map = _name_map(Class)
+    subject_map = _name_map(Subject)
+    teacher_map = _name_map(Teacher)
+    teacher_names = {id_: name for name, id_ in teacher_map.items()}
+    teacher_names.update(dict(db.session.query(Teacher.id, Teacher.name)))
+
+    def add_errors(mask, messages):
+        for row, subject, message in zip(frame.loc[mask, 'row'], frame.loc[mask, 'subject_name'], messages[mask]):
+            changeset.errors.append({'row': int(row), 'subject': subject, 'message': message})
+
+    frame['class_id'] = frame['class_name'].map(class_map)
+    frame['subject_id'] = frame['subject_name'].map(subject_map)
+    frame['teacher_id'] = frame['teacher_name'].map(teacher_map)
+
+    missing_class = frame['class_id'].isna()
+    for row, class_name in frame.loc[missing_class, ['row', 'class_name']].drop_duplicates().itertuples(index=False):
+        changeset.errors.append({'row': int(row), 'subject': None, 'message': f"班级 '{class_name}' 不存在"})
+    add_errors(~missing_class & frame['invalid'],
+               '无法解析课时格式: ' + frame['subject_name'])
+
+    # 合班：查找包含该班级且学科一致的合班设置
+    combinations = {
+        (subject_id, class_id): combination_id
+        for combination_id, subject_id, class_id in db.session.query(
+            ClassCombination.id, ClassCombination.subject_id, class_combination_detail.c.class_id
+        ).join(class_combination_detail, class_combination_detail.c.combination_id == ClassCombination.id)
+    }
+    frame['combination_id'] = [
+        combinations.get((s, c)) if combined else None
+        for s, c, combined in zip(frame['subject_id'], frame['class_id'], frame['is_combined'])
+    ]
+    no_combination = frame['is_combined'] & frame['combination_id'].isna() & ~missing_class & ~frame['invalid']
+    add_errors(no_combination, frame['class_name'] + '-' + frame['subject_name'] + ': 找不到合适的合班设置')
+
+    # 出错的单元格保持现有计划不变，不能当作删除
+    skipped = frame[~missing_class & (frame['invalid'] | no_combination)]
+    skipped_keys = set(zip(skipped['class_id'], skipped['subject_id']))
+
+    frame = frame[~missing_class & ~frame['invalid'] & ~no_combination].copy()
+    frame['hours_per_week'] = frame['hours'].astype(int)
+    frame['week_type'] = frame['week_type'].where(frame['week_type'] != '', 'all')
+
+    changeset.new_subjects = sorted(set(frame.loc[frame['subject_id'].isna(), 'subject_name']))
+    changeset.new_teachers = sorted(set(frame.loc[frame['teacher_id'].isna(), 'teacher_name']))
+
+    # 矩阵覆盖范围内的现有计划
+    scope_classes = [class_map[name] for name in frame.attrs.get('classes', []) if name in class_map]
+    scope_subjects = [subject_map[name] for name in frame.attrs.get('subjects', []) if name in subject_map]
+    columns = ['id', 'class_id', 'subject_id'] + PLAN_FIELDS
+    existing = pd.DataFrame(
+        db.session.query(*[getattr(plan_model, column) for column in columns]).filter(
+            plan_model.class_id.in_(scope_classes or [-1]),
+            plan_model.subject_id.in_(scope_subjects or [-1])
+        ).all(),
+        columns=columns
+    )
+    class_names = {id_: name for name, id_ in class_map.items()}
+    subject_names = {id_: name for name, id_ in subject_map.items()}
+
+    merged = frame.merge(existing, on=['class_id', 'subject_id'], how='outer',
+                         suffixes=('', '_old'), indicator=True)
+
+    def describe(row, prefix=''):
+        teacher_id = row[f'teacher_id{prefix}']
+        return {
+            'teacher': teacher_names.get(teacher_id) if pd.notna(teacher_id) else row.get('teacher_name'),
+            'hours_per_week': int(row[f'hours_per_week{prefix}']),
+            'week_type': row[f'week_type{prefix}'] or 'all',
+            'extra_hours': int(row[f'extra_hours{prefix}']) if pd.notna(row[f'extra_hours{prefix}']) else None,
+            'extra_week_type': row[f'extra_week_type{prefix}'] if pd.notna(row[f'extra_week_type{prefix}']) else None,
+            'is_combined': bool(row[f'is_combined{prefix}']),
+        }
+
+    def key_of(row):
+        return {
+            'class_id': int(row['class_id']),
+            'class': class_names.get(row['class_id'], row.get('class_name')),
+            'subject_id': int(row['subject_id']) if pd.notna(row['subject_id']) else None,
+            'subject': subject_names.get(row['subject_id'], row.get('subject_name')),
+        }
+
+    added = merged[merged['_merge'] == 'left_only']
+    removed = merged[merged['_merge'] == 'right_only']
+    removed = removed[[key not in skipped_keys for key in zip(removed['class_id'], removed['subject_id'])]]
+    both = merged[merged['_merge'] == 'both']
+
+    new_fields = _normalize_plan_fields(both[PLAN_FIELDS])
+    old_fields = _normalize_plan_fields(both[[f'{field}_old' for field in PLAN_FIELDS]]
+                                        .set_axis(PLAN_FIELDS, axis=1))
+    changed = (new_fields != old_fields).any(axis=1)
+    changeset.unchanged = int((~changed).sum())
+
+    for _, row in added.iterrows():
+        changeset.inserts.append({**key_of(row), **describe(row),
+                                  'teacher_id': int(row['teacher_id']) if pd.notna(row['teacher_id']) else None,
+                                  'combination_id': int(row['combination_id']) if pd.notna(row['combination_id']) else None})
+
+    for index, row in both[changed].iterrows():
+        fields = [field for field in PLAN_FIELDS if new_fields.at[index, field] != old_fields.at[index, field]]
+        changeset.updates.append({
+            **key_of(row),
+            'plan_id': int(row['id']),
+            'changed': fields,
+            'old': describe(row, '_old'),
+            'new': describe(row),
+            'teacher_id': int(row['teacher_id']) if pd.notna(row['teacher_id']) else None,
+            'combination_id': int(row['combination_id']) if pd.notna(row['combination_id']) else None
+        })
+
+    for _, row in removed.iterrows():
+        changeset.deletes.append({**key_of(row), 'plan_id': int(row['id']), 'old': describe(row, '_old')})
+
+    changeset.invalidated = _invalidated_lessons(changeset, plan_model)
+    return changeset
+
+
+def _invalidated_lessons(changeset: MatrixChangeset, plan_model) -> List[Dict]:
+    """列出变更集会使之失效的已排课程"""
+    reasons = {}
+    for item in changeset.deletes:
+        reasons[(item['class_id'], item['subject_id'], item['plan_id'])] = '授课计划被删除'
+    for item in changeset.updates:
+        changed = set(item['changed'])
+        if changed & {'teacher_id', 'is_combined', 'combination_id'}:
+            reasons[(item['class_id'], item['subject_id'], item['plan_id'])] = '任课教师或合班设置变化'
+        elif changed & {'hours_per_week', 'extra_hours', 'week_type', 'extra_week_type'} \
+                and item['new']['hours_per_week'] + (item['new']['extra_hours'] or 0) \
+                < item['old']['hours_per_week'] + (item['old']['extra_hours'] or 0):
+            reasons[(item['class_id'], item['subject_id'], item['plan_id'])] = '课时减少'
+    if not reasons:
+        return []
+
+    lessons = []
+    if plan_model is SelfStudyPlan:
+        plan_reasons = {plan_id: reason for (_, _, plan_id), reason in reasons.items()}
+        rows = db.session.query(
+            SelfStudySchedule.id, SelfStudySchedule.class_id, SelfStudySchedule.day,
+            SelfStudySchedule.period, SelfStudySchedule.plan_id
+        ).filter(SelfStudySchedule.plan_id.in_(list(plan_reasons)))
+        for id_, class_id, day, period, plan_id in rows:
+            lessons.append({'id': id_, 'class_id': class_id, 'day': day, 'period': period,
+                            'plan_id': plan_id, 'reason': plan_reasons[plan_id]})
+    else:
+        key_reasons = {(class_id, subject_id): reason for (class_id, subject_id, _), reason in reasons.items()}
+        rows = db.session.query(
+            Schedule.id, Schedule.class_id, Schedule.subject_id, Schedule.teacher_id,
+            Schedule.day_of_week, Schedule.period
+        ).filter(Schedule.class_id.in_({class_id for class_id, _ in key_reasons}))
+        for id_, class_id, subject_id, teacher_id, day, period in rows:
+            reason = key_reasons.get((class_id, subject_id))
+            if reason:
+                lessons.append({'id': id_, 'class_id': class_id, 'subject_id': subject_id,
+                                'teacher_id': teacher_id, 'day': day, 'period': period, 'reason': reason})
+    return lessons
+
+
+def apply_matrix(frame: pd.DataFrame, plan_model=TeachingPlan, expected_fingerprint: str = None,
+                 drop_invalidated: bool = True) -> MatrixChangeset:
+    """
+    只把变更集写入数据库：未变化的授课计划及其已排课程保持不动
+
+    缺失的学科和教师先自动创建，然后重新计算变更集；如果与预览时的摘要不一致则放弃应用
+
+    Args:
+        frame: read_matrix 的结果
+        plan_model: TeachingPlan 或 SelfStudyPlan
+        expected_fingerprint: 预览时返回的摘要，为空时不校验
+        drop_invalidated: 是否同时删除被修改计划的失效课程（被删除计划的课程总是删除）
+
+    Returns:
+        MatrixChangeset: 已应用的变更集
+    """
+    try:
+        notes = MatrixChangeset(plan_model)
+        _create_subjects(frame.loc[~frame['invalid'], 'subject_name'].unique(), notes)
+        _create_teachers(frame.loc[~frame['invalid'], 'teacher_name'].dropna().unique(), notes)
+
+        changeset = diff_matrix(frame, plan_model)
+        changeset.notes = notes.notes
+        if expected_fingerprint and changeset.fingerprint != expected_fingerprint:
+            raise StaleChangesetError('预览后授课计划或导入文件已发生变化，请重新预览后再应用!')
+
+        def plan_mapping(item):
+            return {
+                'class_id': item['class_id'],
+                'subject_id': item['subject_id'],
+                'teacher_id': item['teacher_id'],
+                'hours_per_week': item['hours_per_week'],
+                'week_type': item['week_type'],
+                'extra_hours': item['extra_hours'],
+                'extra_week_type': item['extra_week_type'],
+                'is_combined': item['is_combined'],
+                'combination_id': item['combination_id']
+            }
+
+        db.session.bulk_insert_mappings(plan_model, [plan_mapping(item) for item in changeset.inserts])
+        db.session.bulk_update_mappings(plan_model, [
+            {**plan_mapping({**item, **item['new']}), 'id': item['plan_id']} for item in changeset.updates
+        ])
+
+        deleted_plan_ids = [item['plan_id'] for item in changeset.deletes]
+        lesson_model = SelfStudySchedule if plan_model is SelfStudyPlan else Schedule
+        dropped = [lesson['id'] for lesson in changeset.invalidated
+                   if drop_invalidated or lesson['reason'] == '授课计划被删除']
+        if dropped:
+            lesson_model.query.filter(lesson_model.id.in_(dropped)).delete(synchronize_session=False)
+        if deleted_plan_ids:
+            plan_model.query.filter(plan_model.id.in_(deleted_plan_ids)).delete(synchronize_session=False)
+
+        _link_teacher_subjects(
+            (item['teacher_id'], item['subject_id'])
+            for item in changeset.inserts + [{**u, **u['new']} for u in changeset.updates]
+        )
+        db.session.commit()
+        # 批量写入不触发ORM事件，需要手动使基础数据缓存失效
+        reference_cache.invalidate('subjects', 'teachers', 'teacher_subjects')
+    except Exception:
+        db.session.rollback()
+        raise
+    return changeset
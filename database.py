@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy import event
 
 # 初始化数据库
 db = SQLAlchemy()
@@ -7,4 +8,64 @@ db = SQLAlchemy()
 # 初始化登录管理器
 login_manager = LoginManager()
 login_manager.login_view = 'login'
-login_manager.login_message = '请先登录!' 
\ No newline at end of file
+login_manager.login_message = '请先登录!'
+
+
+def engine_options(config) -> dict:
+    """
+    按数据库地址生成引擎参数
+
+    Args:
+        config: 应用配置（已应用 create_app 传入的覆盖）
+
+    Returns:
+        dict: SQLALCHEMY_ENGINE_OPTIONS
+    """
+    if config.get('SQLALCHEMY_DATABASE_URI', '').startswith('sqlite'):
+        # SQLite使用默认连接池，sqlite3驱动层的等待时间与busy_timeout保持一致
+        busy_timeout = (config.get('SQLITE_PRAGMAS') or {}).get('busy_timeout', 5000)
+        return {'connect_args': {'timeout': int(busy_timeout) / 1000}}
+    # 服务器数据库：排课长事务只占用一个连接，查看和导出请求从连接池获取其他连接
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+def init_db(app):
+    """
+    初始化数据库，并为SQLite连接注册连接参数（PRAGMA）
+
+    Args:
+        app: Flask应用，SQLite连接参数从 app.config['SQLITE_PRAGMAS'] 读取；
+            没有设置 SQLALCHEMY_ENGINE_OPTIONS 时按数据库地址生成（见 engine_options）
+    """
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    db.init_app(app)
+
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    if not pragmas:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                _register_sqlite_pragmas(engine, pragmas)
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """在一个sqlite3连接上执行PRAGMA语句（内存数据库会忽略 journal_mode 等不适用的设置）"""
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def _register_sqlite_pragmas(engine, pragmas):
+    """在引擎创建的每个新连接上执行PRAGMA语句"""
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
@@ -0,0 +1,278 @@
+"""
+整库一致性检查
+用少量集合式SQL（GROUP BY/HAVING 和连接）一次检查全校的课表和基础数据，不把课表逐行读进Python：
+班级和教师的时间冲突（包括早晚自习，以及与正课同一时间的早晚自习时段）、排在禁排或公共课程时段的课程、
+合班课在成员班级中缺失、已排课时与授课计划总课时（含额外课时）不一致、教师超过每天课时上限，
+以及指向已删除的班级、学科、教师、授课计划或合班的孤立记录。
+
+结果是一份结构化报告，由 `flask audit-db` 命令和 GET /api/monitoring/audit 接口返回。
+取代以前临时编写的 check_data.py、recheck.py 等检查脚本。
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, case, func, literal, or_, select, union_all
+from sqlalchemy.orm import aliased
+
+from models import (db, Class, ClassCombination, CommonCourse, Schedule, SelfStudyPlan, SelfStudySchedule,
+                    Subject, SubjectBlock, Teacher, TeachingPlan, TemporarySubstitution, class_combination_detail)
+from selfstudy_grid import REGULAR_PERIOD_OVERLAPS
+
+DEFAULT_MAX_HOURS_PER_DAY = 6
+
+
+def _lesson_group(model):
+    """同一节合班课在各成员班级各有一行，按合班归为一组；非合班课每个班级单独一组（用负的班级ID区分）"""
+    return case((and_(model.is_combined.is_(True), model.combination_id.isnot(None)), model.combination_id),
+                else_=-model.class_id)
+
+
+def _class_double_booking():
+    """同一班级同一时段有多节课（单周课和双周课可以共用一个时段）"""
+    odd = func.sum(case((Schedule.week_type.in_(('all', 's')), 1), else_=0))
+    even = func.sum(case((Schedule.week_type.in_(('all', 'd')), 1), else_=0))
+    return (select(Schedule.class_id, Schedule.day_of_week.label('day'), Schedule.period,
+                   func.count().label('lessons'))
+            .group_by(Schedule.class_id, Schedule.day_of_week, Schedule.period)
+            .having(or_(odd > 1, even > 1)))
+
+
+def _teacher_double_booking():
+    """同一教师同一时段在不同班级有课（同一节合班课不算，单双周分别判断）"""
+    group = _lesson_group(Schedule)
+    odd = func.count(func.distinct(case((Schedule.week_type.in_(('all', 's')), group))))
+    even = func.count(func.distinct(case((Schedule.week_type.in_(('all', 'd')), group))))
+    return (select(Schedule.teacher_id, Schedule.day_of_week.label('day'), Schedule.period,
+                   func.count().label('lessons'))
+            .where(Schedule.teacher_id.isnot(None))
+            .group_by(Schedule.teacher_id, Schedule.day_of_week, Schedule.period)
+            .having(or_(odd > 1, even > 1)))
+
+
+def _selfstudy_class_double_booking():
+    """同一班级同一早晚自习时段有多条记录"""
+    return (select(SelfStudySchedule.class_id, SelfStudySchedule.day, SelfStudySchedule.period,
+                   func.count().label('lessons'))
+            .group_by(SelfStudySchedule.class_id, SelfStudySchedule.day, SelfStudySchedule.period)
+            .having(func.count() > 1))
+
+
+def _selfstudy_teacher_double_booking():
+    """同一教师同一早晚自习时段在不同班级值班（同一合班计划不算）"""
+    group = _lesson_group(SelfStudyPlan)
+    return (select(SelfStudyPlan.teacher_id, SelfStudySchedule.day, SelfStudySchedule.period,
+                   func.count().label('lessons'))
+            .join(SelfStudyPlan, SelfStudyPlan.id == SelfStudySchedule.plan_id)
+            .where(SelfStudyPlan.teacher_id.isnot(None))
+            .group_by(SelfStudyPlan.teacher_id, SelfStudySchedule.day, SelfStudySchedule.period)
+            .having(func.count(func.distinct(group)) > 1))
+
+
+def _selfstudy_regular_overlap():
+    """教师在 REGULAR_PERIOD_OVERLAPS 配置的同一时间既有早晚自习又有正课；没有配置时不检查"""
+    if not REGULAR_PERIOD_OVERLAPS:
+        return None
+    overlaps = or_(*[and_(SelfStudySchedule.period == label, Schedule.period.in_(periods))
+                     for label, periods in REGULAR_PERIOD_OVERLAPS.items()])
+    return (select(SelfStudyPlan.teacher_id, SelfStudySchedule.day, SelfStudySchedule.period.label('selfstudy_period'),
+                   Schedule.period.label('regular_period'), SelfStudySchedule.class_id.label('selfstudy_class_id'),
+                   Schedule.class_id.label('regular_class_id'))
+            .join(SelfStudyPlan, SelfStudyPlan.id == SelfStudySchedule.plan_id)
+            .join(Schedule, and_(Schedule.teacher_id == SelfStudyPlan.teacher_id,
+                                 Schedule.day_of_week == SelfStudySchedule.day, overlaps)))
+
+
+def _blocked_slot_lessons():
+    """排在禁排时段的课程（禁排所有学科，或禁排该学科）"""
+    return (select(Schedule.id.label('schedule_id'), Schedule.class_id, Schedule.subject_id,
+                   Schedule.day_of_week.label('day'), Schedule.period)
+            .join(SubjectBlock, and_(SubjectBlock.day_of_week == Schedule.day_of_week,
+                                     SubjectBlock.period == Schedule.period,
+                                     or_(SubjectBlock.is_block_all.is_(True), SubjectBlock.subject_id.is_(None),
+                                         SubjectBlock.subject_id == Schedule.subject_id)))
+            .distinct())
+
+
+def _common_course_lessons():
+    """排在公共课程时段的课程（公共课程应用于所有班级，或应用于该班级）"""
+    return (select(Schedule.id.label('schedule_id'), Schedule.class_id, Schedule.subject_id,
+                   Schedule.day_of_week.label('day'), Schedule.period, CommonCourse.name.label('common_course'))
+            .join(CommonCourse, and_(CommonCourse.day_of_week == Schedule.day_of_week,
+                                     CommonCourse.period == Schedule.period,
+                                     or_(CommonCourse.apply_to_all_classes.is_(True),
+                                         CommonCourse.class_id == Schedule.class_id))))
+
+
+def _combined_lessons_missing():
+    """合班课在某个成员班级的同一时段没有对应的课程"""
+    member = aliased(Schedule)
+    return (select(Schedule.combination_id, class_combination_detail.c.class_id,
+                   Schedule.day_of_week.label('day'), Schedule.period)
+            .join(class_combination_detail, class_combination_detail.c.combination_id == Schedule.combination_id)
+            .outerjoin(member, and_(member.class_id == class_combination_detail.c.class_id,
+                                    member.combination_id == Schedule.combination_id,
+                                    member.day_of_week == Schedule.day_of_week,
+                                    member.period == Schedule.period))
+            .where(Schedule.is_combined.is_(True), member.id.is_(None))
+            .distinct())
+
+
+def planned_hours():
+    """各班级各学科授课计划的总课时（每周课时 + 额外课时），每节课（不论单双周）对应一条课程记录"""
+    return (select(TeachingPlan.class_id, TeachingPlan.subject_id,
+                   func.sum(TeachingPlan.hours_per_week + func.coalesce(TeachingPlan.extra_hours, 0)).label('hours'))
+            .group_by(TeachingPlan.class_id, TeachingPlan.subject_id))
+
+
+def _plan_hours_mismatch():
+    """各班级各学科已排课时与授课计划总课时（每周课时 + 额外课时）不一致，包括没有授课计划的课程"""
+    planned = planned_hours().subquery()
+    scheduled = (select(Schedule.class_id, Schedule.subject_id, func.count().label('hours'))
+                 .group_by(Schedule.class_id, Schedule.subject_id).subquery())
+    # SQLite 不支持 FULL OUTER JOIN，用两个方向的左连接合并
+    with_plan = (select(planned.c.class_id, planned.c.subject_id, planned.c.hours.label('planned'),
+                        func.coalesce(scheduled.c.hours, 0).label('scheduled'))
+                 .outerjoin(scheduled, and_(scheduled.c.class_id == planned.c.class_id,
+                                            scheduled.c.subject_id == planned.c.subject_id))
+                 .where(planned.c.hours != func.coalesce(scheduled.c.hours, 0)))
+    without_plan = (select(scheduled.c.class_id, scheduled.c.subject_id, literal(0).label('planned'),
+                           scheduled.c.hours.label('scheduled'))
+                    .outerjoin(planned, and_(planned.c.class_id == scheduled.c.class_id,
+                                             planned.c.subject_id == scheduled.c.subject_id))
+                    .where(planned.c.class_id.is_(None)))
+    return union_all(with_plan, without_plan)
+
+
+def _selfstudy_hours_mismatch():
+    """早晚自习授课计划已排课时与总课时不一致"""
+    scheduled = (select(SelfStudySchedule.plan_id, func.count().label('hours'))
+                 .where(SelfStudySchedule.plan_id.isnot(None))
+                 .group_by(SelfStudySchedule.plan_id).subquery())
+    total = SelfStudyPlan.hours_per_week + func.coalesce(SelfStudyPlan.extra_hours, 0)
+    return (select(SelfStudyPlan.id.label('plan_id'), SelfStudyPlan.class_id, SelfStudyPlan.subject_id,
+                   total.label('planned'), func.coalesce(scheduled.c.hours, 0).label('scheduled'))
+            .outerjoin(scheduled, scheduled.c.plan_id == SelfStudyPlan.id)
+            .where(total != func.coalesce(scheduled.c.hours, 0)))
+
+
+def _teacher_over_daily_max():
+    """教师某天的正课节数超过每天最大课时数（同一时段的合班课算一节）"""
+    daily = (select(Schedule.teacher_id, Schedule.day_of_week.label('day'),
+                    func.count(func.distinct(Schedule.period)).label('hours'))
+             .where(Schedule.teacher_id.isnot(None))
+             .group_by(Schedule.teacher_id, Schedule.day_of_week).subquery())
+    limit = func.coalesce(Teacher.max_hours_per_day, DEFAULT_MAX_HOURS_PER_DAY)
+    return (select(daily.c.teacher_id, daily.c.day, daily.c.hours, limit.label('max_hours'))
+            .join(Teacher, Teacher.id == daily.c.teacher_id)
+            .where(daily.c.hours > limit))
+
+
+# 孤立记录：(表, 外键列, 被引用的表)
+ORPHAN_REFERENCES = [
+    (Schedule, 'class_id', Class), (Schedule, 'subject_id', Subject), (Schedule, 'teacher_id', Teacher),
+    (Schedule, 'combination_id', ClassCombination),
+    (TeachingPlan, 'class_id', Class), (TeachingPlan, 'subject_id', Subject), (TeachingPlan, 'teacher_id', Teacher),
+    (TeachingPlan, 'combination_id', ClassCombination),
+    (SelfStudySchedule, 'class_id', Class), (SelfStudySchedule, 'plan_id', SelfStudyPlan),
+    (SelfStudyPlan, 'class_id', Class), (SelfStudyPlan, 'subject_id', Subject), (SelfStudyPlan, 'teacher_id', Teacher),
+    (SelfStudyPlan, 'combination_id', ClassCombination),
+    (TemporarySubstitution, 'original_teacher_id', Teacher), (TemporarySubstitution, 'substitute_teacher_id', Teacher),
+    (TemporarySubstitution, 'class_id', Class),
+]
+
+
+def _orphan_rows():
+    """外键指向已删除记录的行，所有引用关系合并为一条 UNION ALL 查询"""
+    queries = []
+    for model, column_name, target in ORPHAN_REFERENCES:
+        column = getattr(model, column_name)
+        queries.append(select(literal(model.__tablename__).label('table'), literal(column_name).label('column'),
+                              model.id.label('row_id'), column.label('missing_id'))
+                       .outerjoin(target, target.id == column)
+                       .where(column.isnot(None), target.id.is_(None)))
+    detail = class_combination_detail.c
+    queries.append(select(literal('class_combination_detail').label('table'), literal('class_id').label('column'),
+                          detail.combination_id.label('row_id'), detail.class_id.label('missing_id'))
+                   .outerjoin(Class, Class.id == detail.class_id).where(Class.id.is_(None)))
+    queries.append(select(literal('class_combination_detail').label('table'),
+                          literal('combination_id').label('column'),
+                          detail.class_id.label('row_id'), detail.combination_id.label('missing_id'))
+                   .outerjoin(ClassCombination, ClassCombination.id == detail.combination_id)
+                   .where(ClassCombination.id.is_(None)))
+    return union_all(*queries)
+
+
+# 检查项名称 -> (说明, 生成查询的函数)
+CHECKS = OrderedDict([
+    ('class_double_booking', ('班级同一时段有多节课', _class_double_booking)),
+    ('teacher_double_booking', ('教师同一时段在不同班级有课', _teacher_double_booking)),
+    ('selfstudy_class_double_booking', ('班级同一早晚自习时段有多条记录', _selfstudy_class_double_booking)),
+    ('selfstudy_teacher_double_booking', ('教师同一早晚自习时段在不同班级值班', _selfstudy_teacher_double_booking)),
+    ('selfstudy_regular_overlap', ('教师同一时间既有早晚自习又有正课', _selfstudy_regular_overlap)),
+    ('blocked_slot_lessons', ('课程排在禁排时段', _blocked_slot_lessons)),
+    ('common_course_lessons', ('课程排在公共课程时段', _common_course_lessons)),
+    ('combined_lessons_missing', ('合班课在成员班级中缺失', _combined_lessons_missing)),
+    ('plan_hours_mismatch', ('已排课时与授课计划总课时不一致', _plan_hours_mismatch)),
+    ('selfstudy_hours_mismatch', ('早晚自习已排课时与授课计划总课时不一致', _selfstudy_hours_mismatch)),
+    ('teacher_over_daily_max', ('教师超过每天最大课时数', _teacher_over_daily_max)),
+    ('orphan_rows', ('引用已删除记录的孤立数据', _orphan_rows)),
+])
+
+
+def run_audit(checks: List[str] = None, limit: int = 100) -> Dict:
+    """
+    执行一致性检查
+
+    Args:
+        checks: 要执行的检查项名称，默认全部执行
+        limit: 每个检查项最多返回的明细行数，count 始终是全部问题数
+
+    Returns:
+        Dict: ok（没有发现问题）、problems（问题总数）、elapsed_ms，
+              以及 checks：检查项名称 -> {description, count, elapsed_ms, rows}
+    """
+    names = list(CHECKS) if checks is None else checks
+    unknown = [name for name in names if name not in CHECKS]
+    if unknown:
+        raise ValueError(f'未知的检查项: {", ".join(unknown)}')
+
+    started = time.perf_counter()
+    report = OrderedDict()
+    for name in names:
+        description, build = CHECKS[name]
+        check_started = time.perf_counter()
+        statement = build()
+        rows = [] if statement is None else db.session.execute(statement).mappings().all()
+        report[name] = {
+            'description': description,
+            'count': len(rows),
+            'elapsed_ms': round((time.perf_counter() - check_started) * 1000, 1),
+            'rows': [dict(row) for row in rows[:limit]]
+        }
+
+    problems = sum(item['count'] for item in report.values())
+    return {
+        'ok': problems == 0,
+        'problems': problems,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'checks': report
+    }
+
+
+@click.command('audit-db')
+@click.option('--check', 'checks', multiple=True, type=click.Choice(list(CHECKS)),
+              help='只执行指定的检查项，可多次指定，默认全部执行')
+@click.option('--limit', type=int, default=100, show_default=True, help='每个检查项最多输出的明细行数')
+@with_appcontext
+def audit_db_command(checks, limit):
+    """检查全校课表和基础数据的一致性，发现问题时以非零状态退出"""
+    import json
+
+    report = run_audit(list(checks) or None, limit=limit)
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+    if not report['ok']:
+        raise SystemExit(1)
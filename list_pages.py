@@ -0,0 +1,302 @@
+"""
+列表页的服务器端筛选和键集分页
+代课记录全年都在增加，授课计划、教师、早晚自习授课计划列表以前也是整表读出再交给模板。
+这里为这些列表提供统一的筛选条件和键集分页：
+
+- 按排序列的值（最后一列总是ID，保证唯一）定位下一页，不使用 OFFSET，翻到第几页都只扫描一页的行
+- 多对一关系（教师、班级、学科）在同一条查询中 JOIN 载入，教师的任教学科用一条 IN 查询载入，
+  每页的查询数是固定的，与记录总数无关
+- 游标是上一页最后一行排序列的值（JSON + base64），客户端原样传回即可；可为空的排序列中 NULL 视为最小值
+
+LISTS 中登记了各列表的模型、排序、筛选条件和序列化方法，GET /api/lists/<名称> 使用同样的定义
+"""
+
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, false, or_, true
+from sqlalchemy.orm import joinedload, selectinload
+
+from database import db
+from models import (Class, NonRoutineSubstitution, SelfStudyPlan, SubstitutionArrangement, Teacher, TeachingPlan,
+                    TemporarySubstitution, teacher_subject)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'limit'])
+
+# 一个列表的定义：模型、排序列和方向（最后一列必须是ID）、预先载入的关系、筛选函数、序列化函数
+ListSpec = namedtuple('ListSpec', ['model', 'order', 'options', 'apply_filters', 'serialize'])
+
+
+def encode_cursor(values: Sequence) -> str:
+    """把排序列的值编码为游标"""
+    plain = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(plain).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, order) -> List:
+    """
+    把游标还原为排序列的值，每个值必须是与排序列类型一致的标量（日期为ISO格式的字符串），
+    可为空的排序列也可以是None
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('分页游标格式不正确') from None
+    if not isinstance(values, list) or len(values) != len(order):
+        raise ValueError('分页游标格式不正确')
+
+    decoded = []
+    for value, (column, _) in zip(values, order):
+        python_type = column.type.python_type
+        if value is None:
+            valid = _nullable(column)
+        elif python_type in (date, datetime):
+            valid = isinstance(value, str)
+            # fromisoformat 格式不正确时抛出 ValueError
+            value = python_type.fromisoformat(value) if valid else value
+        elif python_type is float:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        else:
+            # bool 是 int 的子类，整数列不接受 true/false
+            valid = isinstance(value, python_type) and not (python_type is int and isinstance(value, bool))
+        if not valid:
+            raise ValueError('分页游标格式不正确')
+        decoded.append(value)
+    return decoded
+
+
+def _nullable(column) -> bool:
+    return bool(getattr(column.expression, 'nullable', False))
+
+
+def _order_by(column, descending):
+    """排序表达式，可为空的列中 NULL 视为最小值（升序时在最前，降序时在最后），与 _after 一致"""
+    if not _nullable(column):
+        return column.desc() if descending else column.asc()
+    return column.desc().nulls_last() if descending else column.asc().nulls_first()
+
+
+def _beyond(column, descending, value):
+    """该列排在 value 之后的行"""
+    if value is None:
+        return false() if descending else column.isnot(None)
+    if descending:
+        return or_(column < value, column.is_(None)) if _nullable(column) else column < value
+    return column > value
+
+
+def _after(order, values):
+    """
+    排在游标之后的行的条件。对 (a 降序, b 升序, id 降序) 生成
+    a <= :a AND (a < :a OR (a = :a AND (b > :b OR (b = :b AND id < :id))))，
+    最外层的范围条件可以直接用索引定位
+    """
+    condition = None
+    for (column, descending), value in reversed(list(zip(order, values))):
+        beyond = _beyond(column, descending, value)
+        equal = column.is_(None) if value is None else column == value
+        condition = beyond if condition is None else or_(beyond, and_(equal, condition))
+    (first_column, first_descending), first_value = order[0], values[0]
+    if first_value is None:
+        first_bound = first_column.is_(None) if first_descending else true()
+    elif first_descending:
+        first_bound = first_column <= first_value
+        if _nullable(first_column):
+            first_bound = or_(first_bound, first_column.is_(None))
+    else:
+        first_bound = first_column >= first_value
+    return and_(first_bound, condition)
+
+
+def paginate(query, order, cursor: Optional[str] = None, limit: int = DEFAULT_LIMIT) -> Page:
+    """
+    键集分页
+
+    Args:
+        query: 已加入筛选条件的查询
+        order: [(列, 是否降序), ...]，最后一列必须唯一（通常是ID）
+        cursor: 上一页返回的 next_cursor，为空时从第一行开始
+        limit: 每页行数
+
+    Returns:
+        Page: items 为本页的行，next_cursor 为下一页的游标（没有下一页时为None）
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    limit = max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+    if cursor:
+        query = query.filter(_after(order, decode_cursor(cursor, order)))
+    query = query.order_by(*[_order_by(column, descending) for column, descending in order])
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column, _ in order])
+    return Page(rows, next_cursor, limit)
+
+
+def _parse_date(value: Optional[str], label: str) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{label}格式无效') from None
+
+
+def _substitution_filters(model):
+    """代课记录：日期范围、教师（原任课或代课）、班级、状态"""
+
+    def apply(query, args):
+        start_date = _parse_date(args.get('start_date'), '开始日期')
+        end_date = _parse_date(args.get('end_date'), '结束日期')
+        if start_date:
+            query = query.filter(model.date >= start_date)
+        if end_date:
+            query = query.filter(model.date <= end_date)
+        teacher_id = args.get('teacher_id', type=int)
+        if teacher_id:
+            query = query.filter(or_(model.original_teacher_id == teacher_id,
+                                     model.substitute_teacher_id == teacher_id))
+        class_id = args.get('class_id', type=int)
+        if class_id:
+            query = query.filter(model.class_id == class_id)
+        status = args.get('status', 'all')
+        if status != 'all':
+            query = query.filter(model.status == status)
+        return query
+
+    return apply
+
+
+def _arrangement_filters(query, args):
+    """长期代课安排：与日期范围有重叠的安排，以及教师、班级、状态"""
+    start_date = _parse_date(args.get('start_date'), '开始日期')
+    end_date = _parse_date(args.get('end_date'), '结束日期')
+    if start_date:
+        query = query.filter(SubstitutionArrangement.end_date >= start_date)
+    if end_date:
+        query = query.filter(SubstitutionArrangement.start_date <= end_date)
+    teacher_id = args.get('teacher_id', type=int)
+    if teacher_id:
+        query = query.filter(or_(SubstitutionArrangement.original_teacher_id == teacher_id,
+                                 SubstitutionArrangement.substitute_teacher_id == teacher_id))
+    class_id = args.get('class_id', type=int)
+    if class_id:
+        query = query.filter(SubstitutionArrangement.class_id == class_id)
+    status = args.get('status', 'all')
+    if status != 'all':
+        query = query.filter(SubstitutionArrangement.status == status)
+    return query
+
+
+def _plan_filters(model):
+    """授课计划：班级、年级、学科、教师"""
+
+    def apply(query, args):
+        for name in ('class_id', 'subject_id', 'teacher_id'):
+            value = args.get(name, type=int)
+            if value:
+                query = query.filter(getattr(model, name) == value)
+        grade = args.get('grade', type=int)
+        if grade:
+            query = query.filter(model.class_id.in_(Class.query.with_entities(Class.id).filter_by(grade=grade)))
+        return query
+
+    return apply
+
+
+def _teacher_filters(query, args):
+    """教师：姓名或工号包含关键字、任教学科"""
+    keyword = (args.get('q') or '').strip()
+    if keyword:
+        query = query.filter(or_(Teacher.name.contains(keyword), Teacher.staff_id.contains(keyword)))
+    subject_id = args.get('subject_id', type=int)
+    if subject_id:
+        query = query.filter(Teacher.id.in_(
+            db.session.query(teacher_subject.c.teacher_id).filter(teacher_subject.c.subject_id == subject_id)))
+    return query
+
+
+def _teacher_dict(teacher: Teacher) -> Dict:
+    return {**teacher.to_dict(), 'gender': teacher.gender,
+            'subjects': [{'id': subject.id, 'name': subject.name} for subject in teacher.subjects]}
+
+
+def _plan_dict(plan) -> Dict:
+    return {**plan.to_dict(), 'class_name': plan.class_obj.name if plan.class_obj else None}
+
+
+def _substitution_options(model):
+    return [joinedload(model.original_teacher), joinedload(model.substitute_teacher),
+            joinedload(model.class_obj), joinedload(model.subject)]
+
+
+LISTS: Dict[str, ListSpec] = {
+    'non_routine_substitutions': ListSpec(
+        NonRoutineSubstitution,
+        [(NonRoutineSubstitution.date, True), (NonRoutineSubstitution.period, False), (NonRoutineSubstitution.id, True)],
+        _substitution_options(NonRoutineSubstitution), _substitution_filters(NonRoutineSubstitution),
+        NonRoutineSubstitution.to_dict),
+    'temporary_substitutions': ListSpec(
+        TemporarySubstitution,
+        [(TemporarySubstitution.date, True), (TemporarySubstitution.period, False), (TemporarySubstitution.id, True)],
+        _substitution_options(TemporarySubstitution), _substitution_filters(TemporarySubstitution),
+        TemporarySubstitution.to_dict),
+    'substitution_arrangements': ListSpec(
+        SubstitutionArrangement,
+        [(SubstitutionArrangement.start_date, True), (SubstitutionArrangement.id, True)],
+        _substitution_options(SubstitutionArrangement), _arrangement_filters, SubstitutionArrangement.to_dict),
+    'plans': ListSpec(
+        TeachingPlan,
+        [(TeachingPlan.class_id, False), (TeachingPlan.subject_id, False), (TeachingPlan.id, False)],
+        [joinedload(TeachingPlan.class_obj), joinedload(TeachingPlan.subject), joinedload(TeachingPlan.teacher)],
+        _plan_filters(TeachingPlan), _plan_dict),
+    'selfstudy_plans': ListSpec(
+        SelfStudyPlan,
+        [(SelfStudyPlan.class_id, False), (SelfStudyPlan.subject_id, False), (SelfStudyPlan.id, False)],
+        [joinedload(SelfStudyPlan.class_obj), joinedload(SelfStudyPlan.subject), joinedload(SelfStudyPlan.teacher)],
+        _plan_filters(SelfStudyPlan), _plan_dict),
+    'teachers': ListSpec(
+        Teacher,
+        [(Teacher.name, False), (Teacher.id, False)],
+        [selectinload(Teacher.subjects)], _teacher_filters, _teacher_dict),
+}
+
+
+def list_page(name: str, args, cursor: Optional[str] = None, limit: int = DEFAULT_LIMIT,
+              serialize: bool = True) -> Page:
+    """
+    按 LISTS 中的定义筛选并分页
+
+    Args:
+        name: 列表名称
+        args: 筛选参数（request.args）
+        cursor: 上一页的 next_cursor
+        limit: 每页行数
+        serialize: 为True时 items 为字典列表，否则为模型实例（供模板使用）
+
+    Raises:
+        KeyError: 没有这个列表
+        ValueError: 筛选参数或游标格式不正确
+    """
+    spec = LISTS[name]
+    query = spec.apply_filters(spec.model.query.options(*spec.options), args)
+    page = paginate(query, spec.order, cursor, limit)
+    if serialize:
+        page = page._replace(items=[spec.serialize(item) for item in page.items])
+    return page
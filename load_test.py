@@ -0,0 +1,384 @@
+"""
+课表查询接口的压力测试
+开学时很多老师同时打开课表，这里模拟这种情况：先生成一个规模接近真实学校的测试数据库，
+再用已登录的会话以指定的并发数反复请求课表查看、手动排课、教师课表弹窗、代课日历和Excel导出等接口，
+按接口统计吞吐量和 p50/p95/p99 延迟。结果保存为键排序的JSON文件，可以直接 diff，
+也可以用 --compare 与上一版本的结果逐接口对比。
+
+用法:
+    python load_test.py seed [--db loadtest.db] [--grades 6] [--classes-per-grade 12]
+    python load_test.py run --db loadtest.db --start [--concurrency 10] [--requests 100] [--output 结果.json]
+    python load_test.py run --db loadtest.db --url http://127.0.0.1:5000 --compare 上次结果.json
+
+--start 会用测试数据库在本机启动一个开发服务器，测试结束后关闭；
+也可以自己用 gunicorn 等方式启动服务器后通过 --url 指定（--db 仍用于读取班级和教师ID）
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 接口名称 -> 路径模板，{class_id}、{teacher_id} 每次请求随机选取
+ENDPOINTS = {
+    'view_class': '/schedule/view?view_type=class&class_id={class_id}',
+    'view_teacher': '/schedule/view?view_type=teacher&teacher_id={teacher_id}',
+    'manual': '/schedule/manual?class_id={class_id}',
+    'teacher_popup': '/schedule/teacher_popup_schedule/{teacher_id}',
+    'substitution_calendar': '/substitution/calendar',
+    'export_class_excel': '/schedule/export_excel/{class_id}',
+    'export_teacher_excel': '/schedule/export_excel_teacher/{teacher_id}',
+    'export_school': '/schedule/export_school',
+}
+
+SUBJECTS = [
+    # (名称, 是否主科, 每周课时, 固定排课日)
+    ('语文', True, 6, None), ('数学', True, 6, None), ('英语', True, 5, None), ('物理', False, 3, None),
+    ('化学', False, 3, None), ('生物', False, 2, None), ('政治', False, 2, None), ('历史', False, 2, None),
+    ('地理', False, 2, None), ('体育', False, 2, None), ('音乐', False, 1, None), ('信息', False, 1, None),
+    ('美术1', False, 1, 6),
+]
+
+
+# ---------------------------------------------------------------------------
+# 生成测试数据
+# ---------------------------------------------------------------------------
+
+def seed_database(db_path, grades=6, classes_per_grade=12, classes_per_teacher=2, seed=1):
+    """
+    生成测试数据库：班级、学科、教师、授课计划、每个年级一个体育合班、公共课程、
+    自动排好的课表以及本月的临时代课记录。已存在的文件会被覆盖
+
+    Returns:
+        Dict: 各类数据的数量
+    """
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from database import db
+    from models import (User, ScheduleSetting, PrintSetting, Subject, Teacher, Class, ClassCombination,
+                        TeachingPlan, CommonCourse, Schedule, TemporarySubstitution)
+    from schema_migrations import upgrade
+    import timetable_solver
+
+    db_path = os.path.abspath(db_path)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rnd = random.Random(seed)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    with app.app_context():
+        db.create_all()
+        upgrade()
+        db.session.add(User(username='admin', password=generate_password_hash('admin123'), name='系统管理员',
+                            role='admin'))
+        db.session.add(ScheduleSetting(periods_per_day=8, days_per_week=6, morning_periods=4, afternoon_periods=4,
+                                       major_subjects_morning=True))
+        db.session.add(PrintSetting())
+        subjects = [Subject(name=name, is_major=is_major, fixed_day=fixed_day)
+                    for name, is_major, _, fixed_day in SUBJECTS]
+        db.session.add_all(subjects)
+        db.session.flush()
+
+        teacher_count = 0
+
+        def new_teacher():
+            nonlocal teacher_count
+            teacher_count += 1
+            teacher = Teacher(name=f'教师{teacher_count:03d}', staff_id=f'T{teacher_count:04d}', max_hours_per_day=6)
+            db.session.add(teacher)
+            return teacher
+
+        plans = []
+        for grade in range(7, 7 + grades):
+            classes = [Class(name=f'{grade}年级{number}班', grade=grade) for number in range(1, classes_per_grade + 1)]
+            db.session.add_all(classes)
+            db.session.flush()
+            combination = ClassCombination(name=f'{grade}年级体育合班', subject_id=subjects[9].id,
+                                           classes=classes[:2])
+            db.session.add(combination)
+            db.session.flush()
+            for subject, (_, _, hours, _) in zip(subjects, SUBJECTS):
+                for start in range(0, classes_per_grade, classes_per_teacher):
+                    teacher = new_teacher()
+                    db.session.flush()
+                    for class_obj in classes[start:start + classes_per_teacher]:
+                        combined = subject.id == subjects[9].id and class_obj in combination.classes
+                        plans.append(TeachingPlan(class_id=class_obj.id, subject_id=subject.id, teacher_id=teacher.id,
+                                                  hours_per_week=hours, is_combined=combined,
+                                                  combination_id=combination.id if combined else None))
+        db.session.add_all(plans)
+        db.session.add(CommonCourse(name='班会', day_of_week=5, period=8, apply_to_all_classes=True))
+        db.session.commit()
+
+        for attempt in range(10):
+            success, message, lessons = timetable_solver.solve(timetable_solver.load_problem(), seed=seed + attempt)
+            if success:
+                break
+        else:
+            raise RuntimeError(f'测试数据自动排课失败: {message}')
+        timetable_solver.save_lessons(lessons)
+
+        # 本月的临时代课记录，供代课日历使用
+        today = date.today()
+        first_day = today.replace(day=1)
+        sample = rnd.sample(Schedule.query.all(), min(len(lessons), grades * classes_per_grade * 2))
+        teacher_ids = [id_ for (id_,) in db.session.query(Teacher.id)]
+        for lesson in sample:
+            day = first_day + timedelta(days=rnd.randrange(28))
+            db.session.add(TemporarySubstitution(
+                original_teacher_id=lesson.teacher_id, substitute_teacher_id=rnd.choice(teacher_ids),
+                class_id=lesson.class_id, subject_id=lesson.subject_id, date=day,
+                day_of_week=day.isoweekday(), period=lesson.period, reason='压力测试', status='approved'))
+        db.session.commit()
+
+        return {
+            'classes': Class.query.count(),
+            'teachers': Teacher.query.count(),
+            'plans': TeachingPlan.query.count(),
+            'lessons': Schedule.query.count(),
+            'substitutions': TemporarySubstitution.query.count(),
+        }
+
+
+# ---------------------------------------------------------------------------
+# 压力测试
+# ---------------------------------------------------------------------------
+
+def start_server(db_path, port):
+    """用测试数据库在本机启动开发服务器（多线程），等到登录页面可以访问后返回进程"""
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.abspath(db_path)}', FLASK_DEBUG='0')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('服务器启动失败')
+        try:
+            urllib.request.urlopen(f'{url}/login', timeout=1)
+            return process, url
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('等待服务器启动超时')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def login(url, username, password):
+    """登录并返回会话 Cookie，之后所有请求共用这个已登录的会话"""
+    opener = urllib.request.build_opener(_NoRedirect)
+    data = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+    try:
+        response = opener.open(f'{url}/login', data=data, timeout=10)
+    except urllib.error.HTTPError as e:
+        response = e
+    cookies = [header.split(';', 1)[0] for header in response.headers.get_all('Set-Cookie') or []]
+    if response.status != 302 or not cookies:
+        raise RuntimeError('登录失败，请检查用户名和密码')
+    return '; '.join(cookies)
+
+
+def _percentile(sorted_values, percent):
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def run_endpoint(url, cookie, path_template, ids, requests_count, concurrency, timeout=60):
+    """
+    以指定并发数请求一个接口
+
+    Returns:
+        Dict: 请求数、错误数、状态码分布、吞吐量（次/秒）、延迟统计（毫秒）、平均响应大小
+    """
+    rnd = random.Random(0)
+    paths = [path_template.format(class_id=rnd.choice(ids['class']), teacher_id=rnd.choice(ids['teacher']))
+             for _ in range(requests_count)]
+    opener = urllib.request.build_opener(_NoRedirect)
+    lock = threading.Lock()
+    latencies, statuses, sizes = [], {}, []
+
+    def fetch(path):
+        request = urllib.request.Request(url + path, headers={'Cookie': cookie})
+        started = time.perf_counter()
+        try:
+            with opener.open(request, timeout=timeout) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body, status = e.read(), e.code
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            body, status = b'', 'error'
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            sizes.append(len(body))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fetch, paths))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if status != '200')
+    return {
+        'requests': requests_count,
+        'errors': errors,
+        'statuses': statuses,
+        'throughput': round(requests_count / wall, 2),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 1),
+            'p50': round(_percentile(latencies, 50), 1),
+            'p95': round(_percentile(latencies, 95), 1),
+            'p99': round(_percentile(latencies, 99), 1),
+            'max': round(latencies[-1], 1),
+        },
+        'avg_bytes': round(statistics.mean(sizes)),
+    }
+
+
+def load_ids(db_path):
+    """从测试数据库读取班级和教师ID"""
+    with sqlite3.connect(os.path.abspath(db_path)) as conn:
+        ids = {
+            'class': [id_ for (id_,) in conn.execute('SELECT id FROM class')],
+            'teacher': [id_ for (id_,) in conn.execute('SELECT DISTINCT teacher_id FROM schedule')],
+        }
+    if not ids['class'] or not ids['teacher']:
+        raise RuntimeError('测试数据库中没有班级或课表，请先运行 python load_test.py seed')
+    return ids
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    ids = load_ids(args.db)
+    endpoints = args.endpoints.split(',') if args.endpoints else list(ENDPOINTS)
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        raise SystemExit(f'未知的接口: {", ".join(unknown)}（可选: {", ".join(ENDPOINTS)}）')
+
+    server = None
+    url = args.url.rstrip('/') if args.url else None
+    if args.start:
+        server, url = start_server(args.db, args.port)
+    if not url:
+        raise SystemExit('请用 --url 指定服务器地址，或用 --start 在本机启动服务器')
+
+    try:
+        cookie = login(url, args.username, args.password)
+        results = {}
+        for name in endpoints:
+            # 预热：让模板编译、缓存加载等一次性开销不计入结果
+            run_endpoint(url, cookie, ENDPOINTS[name], ids, min(args.concurrency, args.requests), args.concurrency)
+            results[name] = run_endpoint(url, cookie, ENDPOINTS[name], ids, args.requests, args.concurrency)
+            latency = results[name]['latency_ms']
+            print(f'{name:24s} {results[name]["throughput"]:8.1f} 次/秒  p50 {latency["p50"]:8.1f}  '
+                  f'p95 {latency["p95"]:8.1f}  p99 {latency["p99"]:8.1f} ms  错误 {results[name]["errors"]}')
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'meta': {
+            'revision': _git_revision(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'concurrency': args.concurrency,
+            'requests_per_endpoint': args.requests,
+            'classes': len(ids['class']),
+            'teachers': len(ids['teacher']),
+            'python': sys.version.split()[0],
+        },
+        'endpoints': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'结果已保存到 {args.output}')
+    if args.compare:
+        compare(args.compare, report)
+    return report
+
+
+def compare(previous_path, report):
+    """逐接口打印与上一次结果相比吞吐量和延迟的变化（百分比）"""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f'\n与 {previous_path}（版本 {previous["meta"].get("revision")}）对比:')
+    for name, current in report['endpoints'].items():
+        before = previous['endpoints'].get(name)
+        if not before:
+            print(f'{name:24s} 上次未测试')
+            continue
+
+        def change(old, new):
+            return f'{(new - old) / old * 100:+6.1f}%' if old else '     -'
+
+        print(f'{name:24s} 吞吐量 {change(before["throughput"], current["throughput"])}  '
+              + '  '.join(f'{key} {change(before["latency_ms"][key], current["latency_ms"][key])}'
+                          for key in ('p50', 'p95', 'p99')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='课表查询接口的压力测试')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='生成测试数据库')
+    seed_parser.add_argument('--db', default='loadtest.db')
+    seed_parser.add_argument('--grades', type=int, default=6)
+    seed_parser.add_argument('--classes-per-grade', type=int, default=12)
+    seed_parser.add_argument('--classes-per-teacher', type=int, default=2)
+    seed_parser.add_argument('--seed', type=int, default=1)
+
+    run_parser = commands.add_parser('run', help='运行压力测试')
+    run_parser.add_argument('--db', default='loadtest.db', help='测试数据库（读取班级和教师ID，--start 时也用于启动服务器）')
+    run_parser.add_argument('--url', help='服务器地址，如 http://127.0.0.1:5000')
+    run_parser.add_argument('--start', action='store_true', help='在本机启动开发服务器')
+    run_parser.add_argument('--port', type=int, default=5055)
+    run_parser.add_argument('--username', default='admin')
+    run_parser.add_argument('--password', default='admin123')
+    run_parser.add_argument('--concurrency', type=int, default=10)
+    run_parser.add_argument('--requests', type=int, default=100, help='每个接口的请求数')
+    run_parser.add_argument('--endpoints', help=f'逗号分隔的接口名称，默认全部（{",".join(ENDPOINTS)}）')
+    run_parser.add_argument('--output', help='保存结果的JSON文件')
+    run_parser.add_argument('--compare', help='与之前保存的结果对比')
+
+    args = parser.parse_args(argv)
+    if args.command == 'seed':
+        counts = seed_database(args.db, args.grades, args.classes_per_grade, args.classes_per_teacher, args.seed)
+        print('测试数据库已生成: ' + ', '.join(f'{name} {count}' for name, count in counts.items()))
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
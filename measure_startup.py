@@ -0,0 +1,48 @@
+"""
+冷启动耗时测量
+每一轮都启动一个新的Python进程，分别记录导入 app 模块和调用 create_app() 的耗时，
+以及启动后是否已经加载了 pandas、numpy、xlsxwriter 等较重的依赖
+
+用法: python measure_startup.py [轮数，默认5]
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ['pandas', 'numpy', 'xlsxwriter', 'openpyxl', 'chardet']
+
+PROBE = f'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({{
+    'import': imported - start,
+    'create_app': created - imported,
+    'heavy': [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+}}))
+'''
+
+
+def measure(rounds=5):
+    results = []
+    for _ in range(rounds):
+        output = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = measure(rounds)
+
+    import_times = [r['import'] * 1000 for r in results]
+    create_times = [r['create_app'] * 1000 for r in results]
+    print(f'测量轮数: {rounds}')
+    print(f'导入 app 模块: 中位数 {statistics.median(import_times):.1f} ms, 最大 {max(import_times):.1f} ms')
+    print(f'create_app(): 中位数 {statistics.median(create_times):.1f} ms, 最大 {max(create_times):.1f} ms')
+    print(f'启动后已加载的重依赖: {", ".join(results[-1]["heavy"]) or "无"}')
@@ -48,6 +48,7 @@ class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
     is_major = db.Column(db.Boolean, default=False)  # 是否为主科
+    fixed_day = db.Column(db.Integer, nullable=True)  # 固定排课日 1-7（如周六科目为6），为空表示不固定
     teachers = db.relationship('Teacher', secondary='teacher_subject', overlaps="subjects")
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
@@ -59,7 +60,8 @@ class Subject(db.Model):
         return {
             'id': self.id,
             'name': self.name,
-            'is_major': self.is_major
+            'is_major': self.is_major,
+            'fixed_day': self.fixed_day
         }
 
 # 班级模型
@@ -183,6 +185,7 @@ class Schedule(db.Model):
         db.Index('idx_class_day_period', 'class_id', 'day_of_week', 'period'),
         db.Index('idx_teacher_day_period', 'teacher_id', 'day_of_week', 'period'),
         db.Index('idx_day_period', 'day_of_week', 'period'),
+        db.Index('idx_schedule_class_subject_teacher', 'class_id', 'subject_id', 'teacher_id'),
     )
 
     def __repr__(self):
@@ -270,6 +273,12 @@ class SelfStudyPlan(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # 添加数据库索引以优化查询性能
+    __table_args__ = (
+        db.Index('idx_selfstudy_plan_teacher', 'teacher_id'),
+        db.Index('idx_selfstudy_plan_class_subject', 'class_id', 'subject_id'),
+    )
+
     def __repr__(self):
         return f'<SelfStudyPlan {self.class_obj.name}-{self.subject.name}>'
 
@@ -305,6 +314,12 @@ class SelfStudySchedule(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # 添加数据库索引以优化查询性能
+    __table_args__ = (
+        db.Index('idx_selfstudy_class_day_period', 'class_id', 'day', 'period'),
+        db.Index('idx_selfstudy_plan', 'plan_id'),
+    )
+
     @property
     def subject(self):
         """返回关联计划的学科"""
@@ -382,6 +397,13 @@ class SubstitutionArrangement(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # 添加数据库索引以优化查询性能
+    __table_args__ = (
+        db.Index('idx_arrangement_original_dates', 'original_teacher_id', 'start_date', 'end_date'),
+        db.Index('idx_arrangement_substitute', 'substitute_teacher_id'),
+        db.Index('idx_arrangement_dates', 'start_date', 'end_date'),
+    )
+
     def __repr__(self):
         return f'<SubstitutionArrangement {self.original_teacher.name} -> {self.substitute_teacher.name}, {self.subject.name}, {self.start_date} 至 {self.end_date}>'
 
@@ -422,6 +444,13 @@ class TemporarySubstitution(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # 添加数据库索引以优化查询性能
+    __table_args__ = (
+        db.Index('idx_temp_sub_date_period', 'date', 'period'),
+        db.Index('idx_temp_sub_original_date', 'original_teacher_id', 'date'),
+        db.Index('idx_temp_sub_substitute_date', 'substitute_teacher_id', 'date'),
+    )
+
     def __repr__(self):
         return f'<TemporarySubstitution {self.original_teacher.name} -> {self.substitute_teacher.name}, {self.subject.name}, {self.date}, 第{self.period}节>'
 
@@ -464,6 +493,13 @@ class NonRoutineSubstitution(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # 添加数据库索引以优化查询性能
+    __table_args__ = (
+        db.Index('idx_non_routine_date_period', 'date', 'period'),
+        db.Index('idx_non_routine_original_date', 'original_teacher_id', 'date'),
+        db.Index('idx_non_routine_substitute_date', 'substitute_teacher_id', 'date'),
+    )
+
     def __repr__(self):
         return f'<NonRoutineSubstitution {self.original_teacher.name} -> {self.substitute_teacher.name}, {self.subject.name}, {self.date}, 第{self.period}节>'
 
@@ -485,4 +521,30 @@ class NonRoutineSubstitution(db.Model):
             'notes': self.notes,
             'status': self.status,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None
+        }
+
+# 课表快照模型
+class ScheduleSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # 快照名称
+    is_auto = db.Column(db.Boolean, default=False)  # 是否为自动排课/清空课表前自动创建的快照
+    lesson_count = db.Column(db.Integer, default=0)  # 正课节数
+    selfstudy_count = db.Column(db.Integer, default=0)  # 早晚自习节数
+    data = db.Column(db.LargeBinary, nullable=False)  # 压缩后的课表数据，格式见 schedule_snapshots.py
+    created_by = db.Column(db.String(80), nullable=True)  # 创建人
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<ScheduleSnapshot {self.name}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'is_auto': self.is_auto,
+            'lesson_count': self.lesson_count,
+            'selfstudy_count': self.selfstudy_count,
+            'size': len(self.data) if self.data else 0,
+            'created_by': self.created_by,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None
         }
\ No newline at end of file
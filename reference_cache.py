@@ -0,0 +1,265 @@
+"""
+基础数据缓存
+排课设置、打印设置、学科、教师、班级这些数据每学期只修改几次，却几乎每个请求都要查询。
+这里把它们缓存在进程内：
+
+- 缓存的是与会话无关的只读副本（namedtuple），可以在线程之间共享，修改缓存值不会影响数据库
+- 每类数据有一个版本号：提交的事务中新增、修改、删除了相应模型（包括 query.delete()/update()
+  批量操作）时自动递增版本号，下次读取时重新加载；bulk_insert_mappings 等不经过ORM事件的批量写入
+  需要手动调用 invalidate()
+- 多进程部署时其他进程的修改无法通过事件通知，缓存值最多保留 REFERENCE_CACHE_TTL 秒
+- stats() 返回各类数据的命中次数和命中率，供监控使用
+- 排课沙盒等使用其他数据库的会话在 bypass() 中读取，直接从当前会话加载，不使用也不更新缓存；
+  这些会话的 info 中有 'sandbox' 键，它们的修改不会使缓存失效
+"""
+
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from database import db
+from models import ScheduleSetting, PrintSetting, Subject, Teacher, Class, teacher_subject
+
+
+# 默认缓存有效期（秒），可通过配置项 REFERENCE_CACHE_TTL 修改
+DEFAULT_TTL = 60
+
+_row_types: Dict[type, type] = {}
+
+
+def _row_type(model):
+    """为模型生成只包含列属性的 namedtuple 类型"""
+    if model not in _row_types:
+        columns = [attr.key for attr in inspect(model).column_attrs]
+        _row_types[model] = namedtuple(f'{model.__name__}Row', columns)
+    return _row_types[model]
+
+
+def snapshot(instance):
+    """
+    把模型实例转换为只读副本；未保存的默认实例使用列的默认值填充空字段
+
+    Args:
+        instance: 模型实例
+
+    Returns:
+        namedtuple: 只读副本
+    """
+    model = type(instance)
+    row_type = _row_type(model)
+    values = {}
+    for attr in inspect(model).column_attrs:
+        value = getattr(instance, attr.key)
+        column = attr.columns[0]
+        if value is None and column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        values[attr.key] = value
+    return row_type(**values)
+
+
+class ReferenceCache:
+    """按名称缓存基础数据，按版本号失效"""
+
+    def __init__(self, ttl: int = DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[Any, Tuple[str, ...]] = {}
+        self._versions: Dict[str, int] = {}
+        self._entries: Dict[str, Tuple[int, float, Any]] = {}
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._local = threading.local()
+
+    def register(self, name: str, loader: Callable[[], Any], depends_on: Iterable[Any]):
+        """
+        注册一类缓存数据
+
+        Args:
+            name: 缓存名称
+            loader: 加载函数，返回值必须是不可变对象（tuple/namedtuple等）
+            depends_on: 依赖的模型类或数据表，这些数据变化时缓存失效
+        """
+        self._loaders[name] = loader
+        self._versions.setdefault(name, 0)
+        self._hits.setdefault(name, 0)
+        self._misses.setdefault(name, 0)
+        for dependency in depends_on:
+            self._models[dependency] = self._models.get(dependency, ()) + (name,)
+
+    def get(self, name: str):
+        """读取缓存数据，版本变化或超过有效期时重新加载"""
+        if getattr(self._local, 'bypass', 0):
+            return self._loaders[name]()
+
+        version = self._versions[name]
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+            with self._lock:
+                self._hits[name] += 1
+            return entry[2]
+
+        with self._lock:
+            self._misses[name] += 1
+        value = self._loaders[name]()
+        with self._lock:
+            # 加载期间如果版本又发生了变化，本次结果只返回不缓存
+            if self._versions[name] == version:
+                self._entries[name] = (version, time.monotonic(), value)
+        return value
+
+    @contextmanager
+    def bypass(self):
+        """代码块中（当前线程）每次读取都直接从当前会话加载，不使用也不更新缓存"""
+        self._local.bypass = getattr(self._local, 'bypass', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.bypass -= 1
+
+    def invalidate(self, *names: str):
+        """使指定缓存失效（不指定时全部失效）"""
+        with self._lock:
+            for name in names or tuple(self._loaders):
+                self._versions[name] = self._versions.get(name, 0) + 1
+                self._entries.pop(name, None)
+
+    def names_for(self, dependency) -> Tuple[str, ...]:
+        """依赖指定模型类或数据表的缓存名称"""
+        return self._models.get(dependency, ())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各类缓存的版本号、命中次数、未命中次数和命中率"""
+        result = {}
+        for name in self._loaders:
+            hits, misses = self._hits[name], self._misses[name]
+            result[name] = {
+                'version': self._versions[name],
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None
+            }
+        return result
+
+
+cache = ReferenceCache()
+
+
+def _load_schedule_setting():
+    setting = ScheduleSetting.query.first() or ScheduleSetting(
+        periods_per_day=8, days_per_week=5, morning_periods=4, afternoon_periods=4,
+        major_subjects_morning=True
+    )
+    return snapshot(setting)
+
+
+def _load_print_setting():
+    return snapshot(PrintSetting.query.first() or PrintSetting())
+
+
+def _load_rows(model, *order_by):
+    row_type = _row_type(model)
+    columns = [getattr(model, attr.key) for attr in inspect(model).column_attrs]
+    return tuple(row_type(*row) for row in db.session.query(*columns).order_by(*order_by))
+
+
+cache.register('schedule_setting', _load_schedule_setting, [ScheduleSetting])
+cache.register('print_setting', _load_print_setting, [PrintSetting])
+cache.register('subjects', lambda: _load_rows(Subject, Subject.id), [Subject])
+cache.register('teachers', lambda: _load_rows(Teacher, Teacher.name, Teacher.id), [Teacher])
+cache.register('classes', lambda: _load_rows(Class, Class.grade, Class.name), [Class])
+cache.register('teacher_subjects', lambda: tuple(sorted(db.session.query(
+    teacher_subject.c.teacher_id, teacher_subject.c.subject_id))), [teacher_subject, Teacher, Subject])
+
+
+def get_schedule_setting():
+    """排课设置（只读副本），数据库中没有时返回默认设置"""
+    return cache.get('schedule_setting')
+
+
+def get_print_setting():
+    """打印设置（只读副本），数据库中没有时返回默认设置"""
+    return cache.get('print_setting')
+
+
+def get_subjects():
+    """全部学科（只读副本），按ID排序"""
+    return cache.get('subjects')
+
+
+def get_teachers():
+    """全部教师（只读副本），按姓名排序"""
+    return cache.get('teachers')
+
+
+def get_classes():
+    """全部班级（只读副本），按年级、班级名称排序"""
+    return cache.get('classes')
+
+
+def get_teacher_subject_pairs():
+    """全部教师-学科教授关系 (教师ID, 学科ID)"""
+    return cache.get('teacher_subjects')
+
+
+def invalidate(*names: str):
+    """使指定缓存失效（不指定时全部失效），用于不触发ORM事件的批量写入"""
+    cache.invalidate(*names)
+
+
+def bypass():
+    """代码块中不使用缓存，用于读取其他数据库（如排课沙盒）的会话"""
+    return cache.bypass()
+
+
+def cache_stats():
+    """各类缓存的命中率"""
+    return cache.stats()
+
+
+def init_cache(app):
+    """根据应用配置设置缓存有效期"""
+    cache.ttl = app.config.get('REFERENCE_CACHE_TTL', DEFAULT_TTL)
+
+
+# ---------------------------------------------------------------------------
+# 自动失效：记录事务中修改过的模型，提交成功后递增对应缓存的版本号
+# ---------------------------------------------------------------------------
+
+def _pending(session) -> set:
+    return session.info.setdefault('reference_cache_pending', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    if session.info.get('sandbox'):
+        return
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        _pending(session).update(cache.names_for(type(instance)))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_statements(orm_execute_state):
+    if orm_execute_state.session.info.get('sandbox'):
+        return
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _pending(orm_execute_state.session).update(cache.names_for(mapper.class_))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    names = session.info.pop('reference_cache_pending', None)
+    if names:
+        cache.invalidate(*names)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('reference_cache_pending', None)
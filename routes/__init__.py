@@ -0,0 +1 @@
+# 路由包初始化文件
\ No newline at end of file
@@ -0,0 +1,58 @@
+from flask import Blueprint, render_template, request, jsonify
+from flask_login import login_required
+from datetime import datetime
+from teacher_workload import compute_teacher_workload
+from teacher_free_slots import expand_teacher_group, find_free_slots
+
+analytics_bp = Blueprint('analytics', __name__)
+
+
+def _parse_date(value):
+    """解析 YYYY-MM-DD 格式的日期参数，为空或格式错误时返回None"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+
+@analytics_bp.route('/analytics/teacher_workload')
+@login_required
+def teacher_workload():
+    """教师工作量统计页面"""
+    return render_template('analytics/teacher_workload.html')
+
+
+@analytics_bp.route('/api/analytics/teacher_workload')
+@login_required
+def teacher_workload_data():
+    """
+    教师工作量统计数据
+
+    可选参数 start / end（YYYY-MM-DD）限定代课统计的日期范围
+    """
+    start = _parse_date(request.args.get('start'))
+    end = _parse_date(request.args.get('end'))
+    return jsonify({'success': True, **compute_teacher_workload(start, end)})
+
+
+@analytics_bp.route('/api/analytics/free_slots')
+@login_required
+def teacher_free_slots():
+    """
+    一组教师的共同空闲节次，用于安排教研组、年级组会议
+
+    参数：teacher_id、subject_id、grade 均可多个，合并为一组教师；min_free 为至少空闲的人数（默认全部）；
+    date（YYYY-MM-DD）为只查看这一天并计入当天的代课；include_selfstudy=no 时不包括早读、晚修
+    """
+    teacher_ids = expand_teacher_group(request.args.getlist('teacher_id', type=int),
+                                       request.args.getlist('subject_id', type=int),
+                                       request.args.getlist('grade', type=int))
+    on_date = _parse_date(request.args.get('date'))
+    if request.args.get('date') and on_date is None:
+        return jsonify({'success': False, 'message': '日期格式无效'}), 400
+    try:
+        result = find_free_slots(teacher_ids, request.args.get('min_free', type=int), on_date,
+                                 include_selfstudy=request.args.get('include_selfstudy') != 'no')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **result})
@@ -0,0 +1,299 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
+from flask_login import login_required
+from database import db
+from models import Teacher, Class, TeachingPlan
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.wsgi import ClosingIterator
+from schedule_grid import (get_schedule_setting, load_print_options, load_school_grids,
+                           build_time_rows, format_cell, DAY_NAMES)
+import os
+import re
+import tempfile
+from datetime import datetime
+
+bulk_schedule_bp = Blueprint('bulk_schedule', __name__)
+
+# Excel工作表名称中不允许出现的字符
+_INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+
+def _sheet_name(name, used):
+    """生成合法且不重复的工作表名称（最长31个字符）"""
+    base = _INVALID_SHEET_CHARS.sub('_', name).strip("'")[:31] or 'Sheet'
+    candidate = base
+    index = 2
+    while candidate.lower() in used:
+        suffix = f'_{index}'
+        candidate = base[:31 - len(suffix)] + suffix
+        index += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def _add_formats(workbook):
+    """创建所有工作表共用的格式，整个工作簿只创建一次"""
+    base = {'align': 'center', 'valign': 'vcenter', 'font_name': '宋体'}
+    return {
+        'title': workbook.add_format({**base, 'bold': True, 'font_size': 18}),
+        'subtitle': workbook.add_format({**base, 'bold': True, 'font_size': 16}),
+        'info': workbook.add_format({**base, 'align': 'left', 'font_size': 12}),
+        'header': workbook.add_format({**base, 'bold': True, 'font_size': 12, 'border': 1,
+                                       'bg_color': '#F2F2F2'}),
+        'time': workbook.add_format({**base, 'bold': True, 'font_size': 11, 'border': 1,
+                                     'text_wrap': True}),
+        'cell': workbook.add_format({**base, 'font_size': 11, 'border': 1, 'text_wrap': True}),
+        'selfstudy': workbook.add_format({**base, 'font_size': 11, 'border': 1, 'text_wrap': True,
+                                          'bg_color': '#E8F5E8'}),
+        'common': workbook.add_format({**base, 'font_size': 11, 'border': 1, 'text_wrap': True,
+                                       'bg_color': '#FFF2CC'}),
+    }
+
+
+def _write_timetable_sheet(worksheet, formats, title, subtitle, info, grid, time_rows,
+                           days, print_settings):
+    """
+    写入单个班级/教师的课表工作表
+
+    constant_memory模式下必须按行顺序写入，因此行高在写入每行之前设置
+    """
+    title_row_height = print_settings.title_row_height or 25
+    row_height = print_settings.row_height or 45
+    last_col = days
+
+    worksheet.set_column(0, last_col, print_settings.column_width or 27)
+
+    worksheet.set_row(0, title_row_height)
+    worksheet.merge_range(0, 0, 0, last_col, title, formats['title'])
+    worksheet.set_row(1, title_row_height)
+    worksheet.merge_range(1, 0, 1, last_col, subtitle, formats['subtitle'])
+    worksheet.set_row(2, title_row_height)
+    worksheet.merge_range(2, 0, 2, last_col, info, formats['info'])
+
+    worksheet.set_row(3, title_row_height)
+    worksheet.write(3, 0, '星期/节数', formats['header'])
+    for day in range(1, days + 1):
+        worksheet.write(3, day, DAY_NAMES[day - 1], formats['header'])
+
+    row = 4
+    for period, label in time_rows:
+        worksheet.set_row(row, row_height)
+        worksheet.write(row, 0, label, formats['time'])
+        for day in range(1, days + 1):
+            cell = grid.get(day, {}).get(period)
+            if cell and cell.get('is_common_course'):
+                cell_format = formats['common']
+            elif (cell and cell.get('is_selfstudy')) or label in ('早读', '晚修'):
+                cell_format = formats['selfstudy']
+            else:
+                cell_format = formats['cell']
+            worksheet.write(row, day, format_cell(cell), cell_format)
+        row += 1
+
+    worksheet.set_landscape()
+    worksheet.set_paper(9)
+    worksheet.fit_to_pages(1, 1)
+    worksheet.set_margins(0.5, 0.5, 0.75, 0.75)
+    worksheet.set_footer('&C第&P页 共&N页')
+
+
+def _write_master_sheet(worksheet, formats, title, classes, class_grids, time_rows, days):
+    """写入总课表：每个班级一行，列为各天各节"""
+    periods_per_day = len(time_rows)
+    last_col = days * periods_per_day
+
+    worksheet.set_column(0, 0, 12)
+    worksheet.set_column(1, last_col, 10)
+
+    worksheet.set_row(0, 30)
+    worksheet.merge_range(0, 0, 0, last_col, title, formats['title'])
+
+    # 第一行表头：星期（合并单元格）
+    worksheet.write(1, 0, '班级', formats['header'])
+    for day in range(1, days + 1):
+        first_col = (day - 1) * periods_per_day + 1
+        worksheet.merge_range(1, first_col, 1, first_col + periods_per_day - 1,
+                              DAY_NAMES[day - 1], formats['header'])
+
+    # 第二行表头：节次
+    worksheet.write(2, 0, '', formats['header'])
+    for day in range(1, days + 1):
+        for index, (_, label) in enumerate(time_rows):
+            worksheet.write(2, (day - 1) * periods_per_day + index + 1,
+                            label.split('\n')[0], formats['header'])
+
+    row = 3
+    for class_obj in classes:
+        worksheet.set_row(row, 36)
+        worksheet.write(row, 0, class_obj.name, formats['time'])
+        grid = class_grids.get(class_obj.id, {})
+        for day in range(1, days + 1):
+            day_cells = grid.get(day, {})
+            for index, (period, _) in enumerate(time_rows):
+                cell = day_cells.get(period)
+                cell_format = formats['common'] if cell and cell.get('is_common_course') else formats['cell']
+                worksheet.write(row, (day - 1) * periods_per_day + index + 1,
+                                format_cell(cell), cell_format)
+        row += 1
+
+    worksheet.freeze_panes(3, 1)
+    worksheet.set_landscape()
+    worksheet.set_paper(8)  # A3纸张
+    worksheet.fit_to_pages(1, 0)
+
+
+def write_school_workbook(path, setting, print_settings, period_times, classes, teachers,
+                          class_grids, teacher_grids):
+    """
+    将全校课表写入单个工作簿：总课表 + 每个班级一张表 + 每位教师一张表
+
+    使用xlsxwriter的constant_memory模式逐行落盘，内存占用与班级数量无关
+    """
+    import xlsxwriter  # 只在导出时加载
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    formats = _add_formats(workbook)
+
+    school_name = (print_settings.school_name or '').strip() or '六盘水市第七中学'
+    semester = (print_settings.semester or '').strip()
+    title = f'{school_name}{semester}'
+    today = datetime.now().strftime('%Y年%m月%d日')
+
+    # 总课表只显示正课节次，各班/各教师表包含早晚自习
+    days = min(setting.days_per_week or 5, 7)
+    time_rows = build_time_rows(setting, period_times)
+    master_rows = build_time_rows(setting, period_times, include_selfstudy=False)
+
+    used_names = set()
+    master = workbook.add_worksheet(_sheet_name('总课表', used_names))
+    _write_master_sheet(master, formats, f'{title} 总课表', classes, class_grids, master_rows, days)
+
+    for class_obj in classes:
+        worksheet = workbook.add_worksheet(_sheet_name(class_obj.name, used_names))
+        head_teacher = class_obj.head_teacher.name if class_obj.head_teacher else '未设置'
+        _write_timetable_sheet(worksheet, formats, title, f'{class_obj.name} 班级课程表',
+                               f'课表执行日期：{today}    班主任：{head_teacher}',
+                               class_grids.get(class_obj.id, {}), time_rows, days, print_settings)
+
+    for teacher in teachers:
+        worksheet = workbook.add_worksheet(_sheet_name(f'{teacher.name}(教师)', used_names))
+        _write_timetable_sheet(worksheet, formats, title, f'{teacher.name} 教师课程表',
+                               f'课表执行日期：{today}',
+                               teacher_grids.get(teacher.id, {}), time_rows, days, print_settings)
+
+    workbook.close()
+
+
+@bulk_schedule_bp.route('/schedule/export_school', methods=['GET', 'POST'])
+@login_required
+def export_school():
+    """导出全校课表到单个Excel工作簿（替代批量导出的ZIP压缩包）"""
+    selected_class_ids = request.values.getlist('class_ids[]', type=int)
+    selected_teacher_ids = request.values.getlist('teacher_ids[]', type=int)
+
+    class_query = Class.query.options(joinedload(Class.head_teacher)).order_by(Class.grade, Class.name)
+    teacher_query = Teacher.query.order_by(Teacher.name)
+    if selected_class_ids or selected_teacher_ids:
+        class_query = class_query.filter(Class.id.in_(selected_class_ids))
+        teacher_query = teacher_query.filter(Teacher.id.in_(selected_teacher_ids))
+    classes = class_query.all()
+    teachers = teacher_query.all()
+
+    if not classes and not teachers:
+        flash('没有可导出的班级或教师', 'warning')
+        return redirect(url_for('schedule.view'))
+
+    setting = get_schedule_setting()
+    print_settings, period_times, _ = load_print_options()
+    class_grids, teacher_grids = load_school_grids(
+        setting,
+        class_ids=[c.id for c in classes],
+        teacher_ids=[t.id for t in teachers]
+    )
+
+    temp_dir = os.path.join(os.getcwd(), 'temp_export')
+    os.makedirs(temp_dir, exist_ok=True)
+    filename = f'全校课表_{datetime.now().strftime("%Y%m%d%H%M%S")}.xlsx'
+    # 临时文件名必须唯一，否则同一秒内的多个导出请求会互相覆盖、删除对方的文件
+    fd, path = tempfile.mkstemp(suffix='.xlsx', dir=temp_dir)
+    os.close(fd)
+
+    try:
+        write_school_workbook(path, setting, print_settings, period_times, classes, teachers,
+                              class_grids, teacher_grids)
+        # 直接从临时文件分块发送，不把整个工作簿读入内存
+        response = send_file(
+            path,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=filename
+        )
+    except Exception:
+        os.remove(path)
+        raise
+
+    def remove_temp_file():
+        if os.path.exists(path):
+            os.remove(path)
+
+    # send_file 的响应发送完毕时只关闭文件、不调用 response.close()，临时文件在文件关闭后删除
+    response.response = ClosingIterator(response.response, [remove_temp_file])
+    return response
+
+
+@bulk_schedule_bp.route('/schedule/print_bulk')
+@login_required
+def print_bulk():
+    """批量打印预览：把选中的班级/教师课表渲染到同一个分页的HTML文档中"""
+    view_type = request.args.get('view_type', 'class')
+    grade = request.args.get('grade', type=int)
+    selected_class_ids = request.args.getlist('class_ids[]', type=int)
+    selected_teacher_ids = request.args.getlist('teacher_ids[]', type=int)
+    include_selfstudy = request.args.get('include_selfstudy') == '1'
+
+    classes = []
+    teachers = []
+
+    if view_type in ('class', 'all'):
+        class_query = Class.query.options(joinedload(Class.head_teacher)).order_by(Class.grade, Class.name)
+        if selected_class_ids:
+            class_query = class_query.filter(Class.id.in_(selected_class_ids))
+        elif grade:
+            class_query = class_query.filter(Class.grade == grade)
+        classes = class_query.all()
+
+    if view_type in ('teacher', 'all'):
+        teacher_query = Teacher.query.options(selectinload(Teacher.subjects)).order_by(Teacher.name)
+        if selected_teacher_ids:
+            teacher_query = teacher_query.filter(Teacher.id.in_(selected_teacher_ids))
+        elif grade:
+            # 只打印在该年级任课的教师
+            grade_teacher_ids = db.session.query(TeachingPlan.teacher_id) \
+                .join(Class, TeachingPlan.class_id == Class.id) \
+                .filter(Class.grade == grade)
+            teacher_query = teacher_query.filter(Teacher.id.in_(grade_teacher_ids))
+        teachers = teacher_query.all()
+
+    if not classes and not teachers:
+        flash('请选择要打印的班级或教师', 'warning')
+        return redirect(url_for('schedule.view'))
+
+    setting = get_schedule_setting()
+    print_settings, period_times, common_periods = load_print_options()
+    class_grids, teacher_grids = load_school_grids(
+        setting,
+        class_ids=[c.id for c in classes],
+        teacher_ids=[t.id for t in teachers],
+        include_selfstudy=include_selfstudy
+    )
+
+    pages = [('class', class_obj, class_grids.get(class_obj.id, {})) for class_obj in classes]
+    pages += [('teacher', teacher, teacher_grids.get(teacher.id, {})) for teacher in teachers]
+
+    return render_template('schedule/print_bulk.html',
+                          pages=pages,
+                          time_rows=build_time_rows(setting, period_times, include_selfstudy),
+                          setting=setting,
+                          print_settings=print_settings,
+                          period_times=period_times,
+                          common_periods=common_periods,
+                          day_names=DAY_NAMES)
@@ -0,0 +1,103 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from models import TeachingPlan, SelfStudyPlan
+
+imports_bp = Blueprint('imports', __name__)
+
+
+@imports_bp.route('/api/import/<entity>', methods=['POST'])
+@login_required
+def import_entity(entity):
+    """
+    批量导入接口：teachers / classes / subjects / plans / selfstudy_plans
+
+    返回导入报告（新增、更新、失败数量及逐行错误信息）
+    """
+    import bulk_import  # pandas 只在第一次导入时加载
+
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'success': False, 'message': '没有选择文件!'}), 400
+
+    try:
+        if entity == 'teachers':
+            df = bulk_import.read_upload(file)
+            report = bulk_import.import_teachers(
+                df, auto_create_subjects=request.form.get('auto_create_subjects') == 'on')
+        elif entity == 'classes':
+            report = bulk_import.import_classes(bulk_import.read_upload(file))
+        elif entity == 'subjects':
+            report = bulk_import.import_subjects(bulk_import.read_upload(file))
+        elif entity in ('plans', 'selfstudy_plans'):
+            df = bulk_import.read_upload(file, allowed=('.xlsx', '.xls'))
+            report = bulk_import.import_plans(
+                df,
+                plan_model=TeachingPlan if entity == 'plans' else SelfStudyPlan,
+                upsert=request.form.get('mode', 'upsert') == 'upsert',
+                clear_existing=request.form.get('clear_existing') == 'yes'
+            )
+        else:
+            return jsonify({'success': False, 'message': f'不支持的导入类型: {entity}'}), 404
+    except bulk_import.UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'导入出错: {str(e)}'}), 500
+
+    return jsonify({
+        'success': report.failed == 0,
+        'message': report.summary(),
+        'report': report.to_dict()
+    })
+
+
+@imports_bp.route('/api/matrix_import/<entity>/<action>', methods=['POST'])
+@login_required
+def matrix_import(entity, action):
+    """
+    矩阵式授课计划导入：preview 只返回与现有计划的差异，apply 只写入差异部分
+
+    apply 时可提交 preview 返回的 fingerprint，预览后数据若有变化则拒绝应用
+    """
+    import bulk_import  # pandas 只在第一次导入时加载
+
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    if entity not in ('plans', 'selfstudy_plans') or action not in ('preview', 'apply'):
+        return jsonify({'success': False, 'message': f'不支持的导入类型: {entity}/{action}'}), 404
+
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'success': False, 'message': '没有选择文件!'}), 400
+
+    plan_model = TeachingPlan if entity == 'plans' else SelfStudyPlan
+    try:
+        frame = bulk_import.read_matrix(file)
+        if action == 'preview':
+            changeset = bulk_import.diff_matrix(frame, plan_model)
+        else:
+            changeset = bulk_import.apply_matrix(
+                frame, plan_model,
+                expected_fingerprint=request.form.get('fingerprint') or None,
+                drop_invalidated=request.form.get('keep_invalidated') != 'yes'
+            )
+    except bulk_import.StaleChangesetError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    except bulk_import.UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'导入出错: {str(e)}'}), 500
+
+    message = (f'新增 {len(changeset.inserts)} 条，修改 {len(changeset.updates)} 条，'
+               f'删除 {len(changeset.deletes)} 条，未变化 {changeset.unchanged} 条；'
+               f'受影响的已排课程 {len(changeset.invalidated)} 节')
+    if changeset.errors:
+        message += f'；{len(changeset.errors)} 个单元格无法导入'
+    return jsonify({
+        'success': True,
+        'message': ('预览：' if action == 'preview' else '已应用：') + message,
+        'changeset': changeset.to_dict()
+    })
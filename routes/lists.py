@@ -0,0 +1,26 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required
+import list_pages
+
+lists_bp = Blueprint('lists', __name__)
+
+
+@lists_bp.route('/api/lists/<name>')
+@login_required
+def list_api(name):
+    """
+    列表的一页：代课记录（non_routine_substitutions、temporary_substitutions、substitution_arrangements）、
+    授课计划（plans）、早晚自习授课计划（selfstudy_plans）和教师（teachers）
+
+    查询参数：筛选条件（start_date、end_date、teacher_id、class_id、status、grade、subject_id、q，视列表而定）；
+    limit 为每页行数（默认50，最多200）；cursor 为上一页返回的 next_cursor
+    """
+    if name not in list_pages.LISTS:
+        return jsonify({'success': False, 'message': f'没有这个列表: {name}'}), 404
+
+    try:
+        page = list_pages.list_page(name, request.args, cursor=request.args.get('cursor'),
+                                    limit=request.args.get('limit', list_pages.DEFAULT_LIMIT, type=int))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'items': page.items, 'next_cursor': page.next_cursor, 'limit': page.limit})
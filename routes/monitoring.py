@@ -0,0 +1,31 @@
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+import reference_cache
+
+monitoring_bp = Blueprint('monitoring', __name__)
+
+
+@monitoring_bp.route('/api/monitoring/cache')
+@login_required
+def cache_stats():
+    """基础数据缓存的版本号、命中次数和命中率"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    return jsonify({'success': True, 'cache': reference_cache.cache_stats()})
+
+
+@monitoring_bp.route('/api/monitoring/audit')
+@login_required
+def database_audit():
+    """整库一致性检查报告，可用 check 参数（可多个）只执行指定的检查项，limit 限制每项返回的明细行数"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    from db_audit import run_audit
+
+    try:
+        report = run_audit(request.args.getlist('check') or None, limit=request.args.get('limit', 100, type=int))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'audit': report})
@@ -0,0 +1,35 @@
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import login_required, current_user
+from timetable_publish import publish, publish_directory, read_manifest
+
+publish_bp = Blueprint('publish', __name__)
+
+
+@publish_bp.route('/api/publish')
+@login_required
+def publish_status():
+    """最近一次发布的版本号、发布时间和文件数，没有发布过时 version 为0"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+    directory = publish_directory(current_app)
+    manifest = read_manifest(directory) or {'version': 0, 'published_at': None, 'files': {}}
+    return jsonify({'success': True, 'directory': directory, 'version': manifest['version'],
+                    'published_at': manifest['published_at'], 'files': len(manifest['files'])})
+
+
+@publish_bp.route('/api/publish', methods=['POST'])
+@login_required
+def publish_timetables():
+    """把全部班级和教师的课表发布到 PUBLISH_DIR，只写入有变化的文件；表单参数 force=yes 时重新写入全部文件"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    try:
+        result = publish(force=request.form.get('force') == 'yes')
+    except OSError as e:
+        return jsonify({'success': False, 'message': f'写入发布目录失败: {e}'}), 500
+    if result['changed']:
+        message = f'已发布版本{result["version"]}：更新{len(result["written"])}个文件，删除{len(result["removed"])}个文件'
+    else:
+        message = f'课表没有变化，当前版本为{result["version"]}'
+    return jsonify({'success': True, 'message': message, **result})
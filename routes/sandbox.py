@@ -0,0 +1,148 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required, current_user
+from schedule_sandbox import sandboxes
+from routes.solver import _scope_class_ids
+
+sandbox_bp = Blueprint('sandbox', __name__)
+
+
+def _get_sandbox(id):
+    sandbox = sandboxes.get(id)
+    if sandbox is None:
+        return None, (jsonify({'success': False, 'message': '沙盒不存在或已因闲置被删除!'}), 404)
+    return sandbox, None
+
+
+@sandbox_bp.route('/api/sandboxes')
+@login_required
+def list_sandboxes():
+    """本进程中的沙盒列表"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+    return jsonify({'success': True, 'sandboxes': [sandbox.to_dict() for sandbox in sandboxes.all()]})
+
+
+@sandbox_bp.route('/api/sandboxes', methods=['POST'])
+@login_required
+def create_sandbox():
+    """把当前数据库复制为一个新的沙盒，表单参数 name 为沙盒名称"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    name = (request.form.get('name') or '').strip() or '未命名沙盒'
+    try:
+        sandbox = sandboxes.create(name, created_by=current_user.username)
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    return jsonify({'success': True, 'message': f'沙盒已创建，复制数据库用时{sandbox.clone_ms}毫秒',
+                    'sandbox': sandbox.to_dict()})
+
+
+@sandbox_bp.route('/api/sandboxes/<int:id>')
+@login_required
+def sandbox_report(id):
+    """沙盒信息，以及沙盒课表与正式课表的评分比较（current 为正式课表，other 为沙盒）和逐节差异"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+    sandbox, error = _get_sandbox(id)
+    if error:
+        return error
+    return jsonify({'success': True, 'sandbox': sandbox.to_dict(), **sandbox.report()})
+
+
+@sandbox_bp.route('/api/sandboxes/<int:id>/changes', methods=['POST'])
+@login_required
+def sandbox_changes(id):
+    """
+    在沙盒中修改数据，请求体为JSON：{"changes": [{"action": "update", "model": "teaching_plan", "id": 3,
+    "values": {"teacher_id": 7}}, ...]}，格式见 schedule_sandbox 模块说明。任一项出错时全部撤销
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+    sandbox, error = _get_sandbox(id)
+    if error:
+        return error
+
+    changes = (request.get_json(silent=True) or {}).get('changes')
+    if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+        return jsonify({'success': False, 'message': '请以JSON提交修改列表 changes!'}), 400
+    try:
+        applied = sandbox.apply(changes)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'applied': applied, 'sandbox': sandbox.to_dict()})
+
+
+@sandbox_bp.route('/api/sandboxes/<int:id>/generate', methods=['POST'])
+@login_required
+def sandbox_generate(id):
+    """
+    在沙盒中自动排课，表单参数与 /api/schedule/solve 相同（scope、grade_id、class_id、constraints、seed、workers），
+    返回排课结果以及与正式课表的评分比较
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+    sandbox, error = _get_sandbox(id)
+    if error:
+        return error
+
+    class_ids, error = _scope_class_ids()
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+
+    result = sandbox.generate(
+        class_ids, request.form.getlist('constraints') or None, seed=request.form.get('seed', type=int),
+        workers=request.form.get('workers', type=int) or current_app.config.get('SOLVER_WORKERS'))
+    if result['success']:
+        report = sandbox.report()
+        result.update(score=report['score'], summary=report['diff']['summary'])
+    return jsonify(result)
+
+
+@sandbox_bp.route('/api/sandboxes/<int:id>/timetable')
+@login_required
+def sandbox_timetable(id):
+    """沙盒中某个班级（class_id）或教师（teacher_id）的课表"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+    sandbox, error = _get_sandbox(id)
+    if error:
+        return error
+
+    class_id = request.args.get('class_id', type=int)
+    teacher_id = request.args.get('teacher_id', type=int)
+    if class_id is None and teacher_id is None:
+        return jsonify({'success': False, 'message': '请指定班级或教师!'}), 400
+    return jsonify({'success': True, 'lessons': sandbox.lessons(class_id, teacher_id)})
+
+
+@sandbox_bp.route('/api/sandboxes/<int:id>/promote', methods=['POST'])
+@login_required
+def promote_sandbox(id):
+    """把沙盒中的修改和课表在一个事务中应用到正式数据库，应用前自动保存快照，应用后删除沙盒"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+    sandbox, error = _get_sandbox(id)
+    if error:
+        return error
+
+    try:
+        result = sandbox.promote()
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    sandboxes.remove(id)
+    return jsonify({'success': True, 'message': f'已应用沙盒"{sandbox.name}"：{result["changes"]}项修改，'
+                                               f'正课{result["lessons"]}节', **result})
+
+
+@sandbox_bp.route('/api/sandboxes/<int:id>', methods=['DELETE'])
+@login_required
+def delete_sandbox(id):
+    """删除沙盒，不影响正式数据库"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+    if not sandboxes.remove(id):
+        return jsonify({'success': False, 'message': '沙盒不存在或已因闲置被删除!'}), 404
+    return jsonify({'success': True, 'message': '沙盒已删除'})
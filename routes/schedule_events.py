@@ -0,0 +1,48 @@
+from flask import Blueprint, Response, request, jsonify
+from flask_login import login_required
+from database import db
+import schedule_events
+
+schedule_events_bp = Blueprint('schedule_events', __name__)
+
+
+def _client_revision():
+    """客户端已收到的最新版本号：断线重连时浏览器自动发送 Last-Event-ID，首次连接时使用查询参数 since"""
+    revision = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        return int(revision)
+    except (TypeError, ValueError):
+        return schedule_events.changes.revision
+
+
+@schedule_events_bp.route('/api/schedule/events')
+@login_required
+def event_stream():
+    """
+    课表变更事件流（text/event-stream）
+
+    事件类型：lesson 为单元格的课程变化（class_id、day、period、old、new），reload 为需要重新加载页面；
+    每个事件的 id 为版本号
+    """
+    revision = _client_revision()
+    # 事件流可能持续数小时，且不访问数据库：不保留请求上下文，并在返回前归还登录校验占用的数据库连接
+    db.session.remove()
+    response = Response(schedule_events.stream(revision), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 禁止 nginx 缓冲，事件才能立即送达
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@schedule_events_bp.route('/api/schedule/events/poll')
+@login_required
+def poll_events():
+    """不支持 EventSource 的环境下轮询获取版本号 since 之后的事件"""
+    revision = _client_revision()
+    items, missed = schedule_events.changes.since(revision)
+    return jsonify({
+        'success': True,
+        'revision': schedule_events.changes.revision,
+        'reload': missed,
+        'events': [] if missed else items
+    })
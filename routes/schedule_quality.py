@@ -0,0 +1,57 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required
+from models import ScheduleSnapshot
+import schedule_snapshots
+import json
+
+schedule_quality_bp = Blueprint('schedule_quality', __name__)
+
+
+@schedule_quality_bp.route('/api/schedule/score')
+@login_required
+def score():
+    """当前课表的质量指标和加权总扣分（越低越好）"""
+    import timetable_score  # numpy 只在第一次评分时加载
+
+    return jsonify({'success': True, **timetable_score.score_current()})
+
+
+@schedule_quality_bp.route('/api/schedule/lessons')
+@login_required
+def lessons():
+    """以紧凑格式导出当前课表，可保存下来供以后对比"""
+    import timetable_score
+
+    return jsonify({
+        'columns': list(timetable_score.LESSON_COLUMNS),
+        'lessons': timetable_score.load_lessons().tolist()
+    })
+
+
+@schedule_quality_bp.route('/api/schedule/score/compare', methods=['POST'])
+@login_required
+def compare():
+    """
+    比较当前课表与保存的课表
+
+    保存的课表为 /api/schedule/lessons 导出的JSON，可以作为请求体提交，也可以作为文件(file)上传；
+    也可以通过查询参数 snapshot 指定一个课表快照
+    """
+    import timetable_score
+
+    snapshot_id = request.args.get('snapshot', type=int)
+    if snapshot_id:
+        snapshot = ScheduleSnapshot.query.get_or_404(snapshot_id)
+        other = timetable_score.lessons_array(
+            schedule_snapshots.lesson_rows(schedule_snapshots.unpack(snapshot.data)))
+    else:
+        try:
+            file = request.files.get('file')
+            saved = json.load(file) if file else request.get_json(force=True)
+            other = timetable_score.lessons_array(saved['lessons'])
+        except (ValueError, KeyError, TypeError):
+            return jsonify({'success': False, 'message': '保存的课表格式不正确!'}), 400
+
+    result = timetable_score.compare_scores(
+        timetable_score.score_current(), timetable_score.score_lessons(other))
+    return jsonify({'success': True, **result})
@@ -0,0 +1,27 @@
+import time
+from flask import Blueprint, request, jsonify
+from flask_login import login_required
+import search_index
+
+search_bp = Blueprint('search', __name__)
+
+
+@search_bp.route('/api/search')
+@login_required
+def search():
+    """
+    教师、班级、学科的输入联想搜索
+
+    查询参数：q 为输入的内容（名称、工号、年级或拼音首字母）；type 为 teacher/class/subject（可多个，默认全部）；
+    limit 为最多返回的条数（默认20，最多100）
+    """
+    started = time.perf_counter()
+    types = request.args.getlist('type')
+    unknown = [name for name in types if name not in search_index.TYPES]
+    if unknown:
+        return jsonify({'success': False, 'message': f'不支持的搜索类型: {", ".join(unknown)}'}), 400
+
+    limit = max(1, min(request.args.get('limit', search_index.DEFAULT_LIMIT, type=int), 100))
+    results = search_index.search(request.args.get('q', ''), types or None, limit)
+    return jsonify({'success': True, 'results': results,
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)})
@@ -0,0 +1,149 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+import reference_cache
+from selfstudy_grid import SelfStudyGrid, add_lesson, swap_lesson, toggle_block
+
+selfstudy_grid_bp = Blueprint('selfstudy_grid', __name__, url_prefix='/api/selfstudy/grid')
+
+
+def _to_int(value):
+    """把 JSON 参数转换为整数，无法转换时返回 None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@selfstudy_grid_bp.route('/<int:class_id>')
+@login_required
+def class_grid(class_id):
+    """班级的早晚自习网格（含禁排、公共活动和各计划的已排课时）"""
+    grid = SelfStudyGrid.load([class_id])
+    plans = [grid.describe_plan(plan_id) for plan_id in grid.plans]
+    return jsonify({'success': True, 'class_id': class_id, 'grid': grid.class_grid(class_id), 'plans': plans})
+
+
+@selfstudy_grid_bp.route('/swappable_slots', methods=['POST'])
+@login_required
+def swappable_slots():
+    """计算可交换课程的单元格（参数与 selfstudy.get_swappable_slots 相同）"""
+    data = request.get_json(silent=True) or {}
+    class_id, day, period = data.get('class_id'), data.get('day'), data.get('period')
+    if not all([class_id, day, period]):
+        return jsonify({'success': False, 'message': '缺少必要参数'})
+
+    class_id, day = _to_int(class_id), _to_int(day)
+    if class_id is None or day is None:
+        return jsonify({'success': False, 'message': '参数格式错误'}), 400
+    grid = SelfStudyGrid.load([class_id])
+    source = grid.cell(class_id, day, period)
+    if not source or source.is_common_course or not source.plan_id:
+        return jsonify({'success': False, 'message': '源单元格无有效课程'})
+
+    return jsonify({
+        'success': True,
+        'source': {'day': day, 'period': period, 'subject': data.get('subject'), 'teacher': data.get('teacher')},
+        'swappable_slots': grid.swappable_slots(class_id, day, period, source)
+    })
+
+
+@selfstudy_grid_bp.route('/available_slots', methods=['POST'])
+@login_required
+def available_slots():
+    """计划还可以安排的单元格（参数与 selfstudy.calculate_available_selfstudy_slots 相同）"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'})
+
+    class_id = request.form.get('class_id', type=int)
+    plan_id = request.form.get('plan_id', type=int)
+    if not all([class_id, plan_id]):
+        return jsonify({'success': False, 'message': '参数不完整 (需要 class_id 和 plan_id)!'})
+
+    grid = SelfStudyGrid.load([class_id])
+    plan = grid.plans.get(plan_id)
+    if not plan or plan.class_id != class_id:
+        return jsonify({'success': False, 'message': '授课计划与班级不匹配!'})
+
+    scheduled, total = grid.plan_hours(plan_id)
+    if scheduled >= total:
+        return jsonify({'success': True, 'available_slots': [], 'plan_id': plan_id, 'message': '该计划的课时已排满。'})
+    return jsonify({'success': True, 'available_slots': grid.available_slots(class_id, plan), 'plan_id': plan_id})
+
+
+@selfstudy_grid_bp.route('/add_lesson', methods=['POST'])
+@login_required
+def add():
+    """在空单元格中安排早晚自习（参数与 selfstudy.add_selfstudy_lesson 相同）"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'})
+
+    class_id = request.form.get('class_id', type=int)
+    plan_id = request.form.get('plan_id', type=int)
+    day = request.form.get('day', type=int)
+    period = request.form.get('period', type=str)
+    if not all([class_id, plan_id, day, period]):
+        return jsonify({'success': False, 'message': '参数不完整!'})
+
+    success, message, extra = add_lesson(SelfStudyGrid.load([class_id]), class_id, plan_id, day, period)
+    return jsonify({'success': success, 'message': message, **extra})
+
+
+@selfstudy_grid_bp.route('/swap_lesson', methods=['POST'])
+@login_required
+def swap():
+    """交换/移动早晚自习课程（参数与 selfstudy.swap_selfstudy_lesson 相同）"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'})
+
+    data = request.get_json(silent=True) or {}
+    keys = ('class_id', 'source_day', 'source_period', 'target_day', 'target_period')
+    if not all(data.get(key) for key in keys):
+        return jsonify({'success': False, 'message': '参数不完整!'})
+
+    class_id, source_day, target_day = (_to_int(data[key]) for key in ('class_id', 'source_day', 'target_day'))
+    if None in (class_id, source_day, target_day):
+        return jsonify({'success': False, 'message': '参数格式错误'}), 400
+
+    success, message, extra = swap_lesson(
+        SelfStudyGrid.load([class_id]), class_id, source_day, data['source_period'],
+        target_day, data['target_period'])
+    return jsonify({'success': success, 'message': message, **extra})
+
+
+@selfstudy_grid_bp.route('/toggle_block', methods=['POST'])
+@login_required
+def toggle():
+    """设置或取消禁排（参数与 selfstudy.toggle_block 相同），全校禁排需要管理员权限"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({'success': False, 'message': '无效的请求格式'})
+
+    day, period = data.get('day'), data.get('period')
+    action = data.get('action', 'block')
+    apply_to_all = data.get('apply_to_all', False)
+    if not all([day, period]):
+        return jsonify({'success': False, 'message': '缺少必要参数'})
+    day = _to_int(day)
+    if day is None:
+        return jsonify({'success': False, 'message': '参数格式错误'}), 400
+    if apply_to_all and current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '只有管理员才能设置全校禁排'})
+    if action not in ('block', 'unblock'):
+        return jsonify({'success': False, 'message': '无效的操作类型'})
+
+    if apply_to_all:
+        class_ids = [item.id for item in reference_cache.get_classes()]
+    elif data.get('class_id'):
+        class_id = _to_int(data['class_id'])
+        if class_id is None:
+            return jsonify({'success': False, 'message': '参数格式错误'}), 400
+        class_ids = [class_id]
+    else:
+        return jsonify({'success': False, 'message': '缺少班级ID'})
+
+    affected = toggle_block(SelfStudyGrid.load(None if apply_to_all else class_ids), class_ids, day, period,
+                            action == 'block', keep_common=apply_to_all)
+    action_text = '禁排' if action == 'block' else '解除禁排'
+    if apply_to_all:
+        return jsonify({'success': True, 'message': f'已为全校{affected}个班级{action_text}', 'affected_count': affected})
+    return jsonify({'success': True, 'message': '已设置禁排' if action == 'block' else '已取消禁排'})
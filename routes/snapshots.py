@@ -0,0 +1,99 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
+from models import ScheduleSnapshot
+from database import db
+import schedule_snapshots
+
+snapshots_bp = Blueprint('snapshots', __name__)
+
+
+@snapshots_bp.route('/api/snapshots')
+@login_required
+def list_snapshots():
+    """快照列表（不含课表数据），最新的在前"""
+    snapshots = ScheduleSnapshot.query.order_by(ScheduleSnapshot.id.desc()).all()
+    return jsonify({'success': True, 'snapshots': [snapshot.to_dict() for snapshot in snapshots]})
+
+
+@snapshots_bp.route('/api/snapshots/create', methods=['POST'])
+@login_required
+def create_snapshot():
+    """保存当前课表的快照"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    name = (request.form.get('name') or '').strip()
+    if not name:
+        return jsonify({'success': False, 'message': '请填写快照名称!'}), 400
+
+    snapshot = schedule_snapshots.take_snapshot(name, created_by=current_user.username)
+    return jsonify({'success': True, 'message': '快照已保存!', 'snapshot': snapshot.to_dict()})
+
+
+@snapshots_bp.route('/api/snapshots/<int:id>/restore', methods=['POST'])
+@login_required
+def restore_snapshot(id):
+    """
+    用快照整体替换当前课表，恢复前自动保存当前课表，恢复错了还可以再恢复回来
+
+    表单参数 include_selfstudy=no 时只恢复正课；快照中班级、学科、教师或自习计划已被删除的课程不恢复，
+    跳过的节数为 skipped
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    snapshot = ScheduleSnapshot.query.get_or_404(id)
+    name = snapshot.name
+    backup = schedule_snapshots.auto_snapshot(f'恢复"{name}"前')
+    try:
+        counts = schedule_snapshots.restore_snapshot(
+            snapshot, include_selfstudy=request.form.get('include_selfstudy') != 'no')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'快照数据无法读取: {str(e)}'}), 400
+    except IntegrityError:
+        return jsonify({'success': False, 'message': f'快照"{name}"与当前数据不一致，无法恢复，课表未做修改'}), 409
+
+    message = f'已恢复快照"{name}"：正课{counts["lessons"]}节，早晚自习{counts["selfstudy"]}节'
+    if counts['skipped']:
+        message += f'，{counts["skipped"]}节课程的班级、学科、教师或自习计划已被删除，未恢复'
+    return jsonify({
+        'success': True,
+        'message': message,
+        'backup': backup.to_dict(),
+        **counts
+    })
+
+
+@snapshots_bp.route('/api/snapshots/<int:id>/diff')
+@login_required
+def diff_snapshot(id):
+    """
+    比较快照与另一个快照或当前课表，按班级和教师列出变化
+
+    查询参数 against 为另一个快照的ID，默认为 current（当前课表）
+    """
+    snapshot = ScheduleSnapshot.query.get_or_404(id)
+    against = request.args.get('against', 'current')
+    if against == 'current':
+        other = schedule_snapshots.current_content()
+    elif against.isdigit():
+        other = schedule_snapshots.unpack(ScheduleSnapshot.query.get_or_404(int(against)).data)
+    else:
+        return jsonify({'success': False, 'message': '对比对象不正确!'}), 400
+
+    diff = schedule_snapshots.diff_snapshots(schedule_snapshots.unpack(snapshot.data), other)
+    return jsonify({'success': True, 'snapshot': snapshot.to_dict(), 'against': against, **diff})
+
+
+@snapshots_bp.route('/api/snapshots/<int:id>/delete', methods=['POST'])
+@login_required
+def delete_snapshot(id):
+    """删除快照"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    snapshot = ScheduleSnapshot.query.get_or_404(id)
+    db.session.delete(snapshot)
+    db.session.commit()
+    return jsonify({'success': True, 'message': '快照已删除!'})
@@ -0,0 +1,90 @@
+import os
+from contextlib import nullcontext
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required, current_user
+from models import Class
+import schedule_decomposition
+import schedule_snapshots
+import timetable_solver
+from solver_telemetry import SolverTelemetry, PROFILERS, profile_run, profile_directory
+
+solver_bp = Blueprint('solver', __name__)
+
+
+def _scope_class_ids():
+    """
+    根据表单参数 scope（all/grade/class）确定排课范围
+
+    Returns:
+        Tuple: (班级ID列表，全校时为None, 错误信息)
+    """
+    scope = request.form.get('scope', 'all')
+    if scope == 'all':
+        return None, None
+    if scope == 'grade':
+        grade_id = request.form.get('grade_id', type=int)
+        class_ids = [id_ for (id_,) in Class.query.with_entities(Class.id).filter_by(grade=grade_id)]
+        return class_ids, None if class_ids else f'未找到{grade_id}年级的班级!'
+    if scope == 'class':
+        class_id = request.form.get('class_id', type=int)
+        return [class_id], None if class_id and Class.query.get(class_id) else '未找到指定的班级!'
+    return None, '排课范围不正确!'
+
+
+@solver_bp.route('/api/schedule/components')
+@login_required
+def components():
+    """全校授课计划可以分成几个互不相关的部分（各部分可以同时排课）"""
+    problem = timetable_solver.load_problem()
+    return jsonify({'success': True, 'components': schedule_decomposition.describe_components(problem)})
+
+
+@solver_bp.route('/api/schedule/solve', methods=['POST'])
+@login_required
+def solve():
+    """
+    分解后并行自动排课，成功时替换排课范围内班级的课表
+
+    表单参数：scope、grade_id、class_id 与自动排课页面相同；constraints 为启用的约束条件（可多个，默认全部）；
+    seed 为随机数种子（可选）；workers 为进程数（默认为配置项 SOLVER_WORKERS）；
+    profile 为 cprofile 或 pyinstrument 时对本次排课做性能剖析（在当前进程中求解），结果保存在 SOLVER_PROFILE_DIR
+
+    返回结果中的 telemetry 为读取、求解各阶段、写回的耗时和计数
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    class_ids, error = _scope_class_ids()
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+
+    profiler = request.form.get('profile')
+    if profiler and profiler not in PROFILERS:
+        return jsonify({'success': False, 'message': f'不支持的性能剖析工具: {profiler}'}), 400
+
+    telemetry = SolverTelemetry()
+    problem = timetable_solver.load_problem(class_ids, telemetry)
+    if not problem.plans:
+        return jsonify({'success': False, 'message': '未找到任何授课计划，无法进行排课!'}), 400
+
+    constraints = request.form.getlist('constraints') or None
+    # 子进程中的求解无法剖析，剖析时在当前进程中依次求解
+    workers = 1 if profiler else request.form.get('workers', type=int) or current_app.config.get('SOLVER_WORKERS')
+    try:
+        with profile_run(profile_directory(current_app), profiler) if profiler else nullcontext({}) as profile:
+            result = schedule_decomposition.solve_parallel(
+                problem, constraints, seed=request.form.get('seed', type=int), workers=workers)
+    except ImportError:
+        return jsonify({'success': False, 'message': f'未安装 {profiler}，无法进行性能剖析!'}), 400
+
+    telemetry.merge(result.pop('telemetry'))
+    if result['success']:
+        schedule_snapshots.auto_snapshot('并行自动排课前')
+        timetable_solver.save_lessons(result['lessons'], class_ids, telemetry)
+    telemetry.log(f'自动排课（{result["mode"]}，{len(problem.plans)}个授课计划）')
+
+    lessons = result.pop('lessons')
+    response = {**result, 'lessons': len(lessons), 'telemetry': telemetry.to_dict()}
+    if profile.get('path'):
+        response['profile'] = os.path.basename(profile['path'])
+    return jsonify(response)
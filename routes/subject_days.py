@@ -0,0 +1,39 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from models import Subject
+from database import db
+import reference_cache
+
+subject_days_bp = Blueprint('subject_days', __name__)
+
+
+@subject_days_bp.route('/api/subjects/fixed_days')
+@login_required
+def list_fixed_days():
+    """全部学科的固定排课日（1-7，为空表示不固定）"""
+    return jsonify({'success': True, 'subjects': [
+        {'id': subject.id, 'name': subject.name, 'fixed_day': subject.fixed_day}
+        for subject in reference_cache.get_subjects()
+    ]})
+
+
+@subject_days_bp.route('/api/subjects/<int:id>/fixed_day', methods=['POST'])
+@login_required
+def set_fixed_day(id):
+    """
+    设置学科的固定排课日：自动排课时这个学科先排在这一天
+
+    表单参数 fixed_day 为1-7（周一至周日），为空时取消固定排课日
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '您没有权限进行此操作!'}), 403
+
+    subject = Subject.query.get_or_404(id)
+    value = (request.form.get('fixed_day') or '').strip()
+    if value and not (value.isdigit() and 1 <= int(value) <= 7):
+        return jsonify({'success': False, 'message': '固定排课日应为1-7（周一至周日）!'}), 400
+
+    subject.fixed_day = int(value) if value else None
+    db.session.commit()
+    return jsonify({'success': True, 'message': f'已更新学科"{subject.name}"的固定排课日',
+                    'subject': subject.to_dict()})
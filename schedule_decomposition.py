@@ -0,0 +1,195 @@
+"""
+排课问题分解与并行求解
+不同年级之间通常只通过少数共用的教师或合班联系在一起，初中和高中往往完全独立。
+这里把授课计划看成"班级—教师—合班"图：同一计划的班级和教师相连，同一合班的班级相连，
+图的每个连通分量就是一个独立的子问题，彼此不争用任何班级或教师的时间段。
+
+各子问题交给独立的进程同时求解后合并，全校的求解时间取决于最大的子问题而不是全校规模。
+合并后如果发现子问题之间存在资源冲突（正常情况下不会发生），退回到整体求解
+"""
+
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from solver_telemetry import SolverTelemetry
+from timetable_solver import SchedulingProblem, solve
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, node):
+        parent = self.parent.setdefault(node, node)
+        if parent != node:
+            parent = self.parent[node] = self.find(parent)
+        return parent
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+def find_components(problem: SchedulingProblem) -> List[List[int]]:
+    """
+    按班级、教师和合班把授课计划分成互不相关的组
+
+    排课范围以外的班级只作为只读的已占用时间段参与求解，不会把两个组连在一起
+
+    Returns:
+        List[List[int]]: 每组的授课计划ID，按计划数从多到少排列
+    """
+    involved_class_ids = problem.class_ids
+    groups = _UnionFind()
+    for plan in problem.plans:
+        class_node = ('class', plan.class_id)
+        groups.find(class_node)
+        if plan.teacher_id:
+            groups.union(class_node, ('teacher', plan.teacher_id))
+        if plan.is_combined and plan.combination_id:
+            for other_class_id in problem.combinations.get(plan.combination_id, ()):
+                if other_class_id in involved_class_ids:
+                    groups.union(class_node, ('class', other_class_id))
+
+    components = defaultdict(list)
+    for plan in problem.plans:
+        components[groups.find(('class', plan.class_id))].append(plan.id)
+    return sorted((sorted(plan_ids) for plan_ids in components.values()), key=lambda ids: (-len(ids), ids[0]))
+
+
+def _component_seed(seed: Optional[int], plan_ids: List[int]) -> Optional[int]:
+    """每个子问题的随机数种子只取决于总种子和子问题本身，与求解顺序、进程数无关"""
+    return None if seed is None else seed * 1000003 + plan_ids[0]
+
+
+def _solve_component(problem: SchedulingProblem, constraints, seed):
+    started = time.perf_counter()
+    telemetry = SolverTelemetry()
+    success, message, lessons = solve(problem, constraints, seed, telemetry)
+    return success, message, lessons, time.perf_counter() - started, telemetry.to_dict()
+
+
+def find_conflicts(lessons) -> List[Dict]:
+    """
+    检查合并后的课表中同一时间段被两个班级（或两个合班）占用的教师，以及有两节课的班级
+
+    Returns:
+        List[Dict]: 冲突列表，没有冲突时为空
+    """
+    teacher_groups = defaultdict(set)
+    class_lessons = defaultdict(int)
+    for class_id, _, teacher_id, day, period, is_combined, combination_id in lessons:
+        class_lessons[(class_id, day, period)] += 1
+        if teacher_id:
+            group = ('combination', combination_id) if is_combined and combination_id else ('class', class_id)
+            teacher_groups[(teacher_id, day, period)].add(group)
+
+    conflicts = [{'type': 'teacher', 'teacher_id': teacher_id, 'day': day, 'period': period}
+                 for (teacher_id, day, period), groups in teacher_groups.items() if len(groups) > 1]
+    conflicts += [{'type': 'class', 'class_id': class_id, 'day': day, 'period': period}
+                  for (class_id, day, period), count in class_lessons.items() if count > 1]
+    return conflicts
+
+
+def solve_parallel(problem: SchedulingProblem, constraints: Optional[Iterable[str]] = None,
+                   seed: Optional[int] = None, workers: Optional[int] = None) -> Dict:
+    """
+    分解排课问题，各子问题同时求解后合并
+
+    Args:
+        problem: 排课问题
+        constraints: 启用的约束条件，默认全部启用
+        seed: 随机数种子；指定后无论进程数多少，结果都相同
+        workers: 进程数，默认为CPU核数；为1时在当前进程中依次求解
+
+    Returns:
+        Dict: {'success', 'message', 'lessons', 'mode': 'parallel'/'joint', 'components': 各子问题的规模和耗时,
+               'elapsed_ms', 'telemetry': 各子问题求解阶段的耗时和计数之和（见 SolverTelemetry.to_dict）}
+    """
+    started = time.perf_counter()
+    constraints = list(constraints) if constraints is not None else None
+    workers = workers or os.cpu_count() or 1
+    components = find_components(problem)
+
+    def joint(reason=None):
+        success, message, lessons, elapsed, telemetry = _solve_component(problem, constraints, seed)
+        return {
+            'success': success,
+            'message': message if reason is None else f'{message}（{reason}，已改为整体求解）',
+            'lessons': lessons,
+            'mode': 'joint',
+            'components': [_component_info(problem, [plan.id for plan in problem.plans], elapsed)],
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'telemetry': telemetry
+        }
+
+    if len(components) <= 1:
+        return joint()
+
+    subproblems = [problem.subset(plan_ids) for plan_ids in components]
+    seeds = [_component_seed(seed, plan_ids) for plan_ids in components]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(subproblems))) as executor:
+            results = list(executor.map(_solve_component, subproblems, [constraints] * len(subproblems), seeds))
+    else:
+        results = [_solve_component(subproblem, constraints, component_seed)
+                   for subproblem, component_seed in zip(subproblems, seeds)]
+
+    info = [_component_info(subproblem, plan_ids, elapsed)
+            for subproblem, plan_ids, (_, _, _, elapsed, _) in zip(subproblems, components, results)]
+    telemetry = SolverTelemetry()
+    for *_, component_telemetry in results:
+        telemetry.merge(component_telemetry)
+    failed = [message for success, message, *_ in results if not success]
+    if failed:
+        return {
+            'success': False,
+            'message': '；'.join(failed),
+            'lessons': [],
+            'mode': 'parallel',
+            'components': info,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'telemetry': telemetry.to_dict()
+        }
+
+    lessons = [lesson for _, _, component_lessons, *_ in results for lesson in component_lessons]
+    if find_conflicts(lessons):
+        return joint('子问题之间存在资源冲突')
+
+    messages = {message for _, message, *_ in results}
+    return {
+        'success': True,
+        'message': '；'.join(sorted(messages)),
+        'lessons': lessons,
+        'mode': 'parallel',
+        'components': info,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'telemetry': telemetry.to_dict()
+    }
+
+
+def _component_info(problem: SchedulingProblem, plan_ids: List[int], elapsed: float) -> Dict:
+    return {
+        'plans': len(plan_ids),
+        'classes': len(problem.class_ids),
+        'teachers': len({plan.teacher_id for plan in problem.plans if plan.teacher_id}),
+        'hours': sum(plan.hours_per_week for plan in problem.plans),
+        'elapsed_ms': round(elapsed * 1000, 1)
+    }
+
+
+def describe_components(problem: SchedulingProblem) -> List[Dict]:
+    """各子问题包含的班级、教师和课时数，用于查看全校可以分成几个独立部分"""
+    result = []
+    for plan_ids in find_components(problem):
+        subproblem = problem.subset(plan_ids)
+        info = _component_info(subproblem, plan_ids, 0)
+        del info['elapsed_ms']
+        info['class_ids'] = sorted(subproblem.class_ids)
+        info['class_names'] = [problem.class_names.get(class_id) for class_id in info['class_ids']]
+        result.append(info)
+    return result
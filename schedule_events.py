@@ -0,0 +1,247 @@
+"""
+课表变更事件
+两位管理员同时在手动排课页面调课时，一方的修改要等另一方刷新页面才能看到。这里把每次提交的
+课表修改（新增、删除、调整课程）记录为带递增版本号的小事件，通过 SSE 推送给打开的课表页面，
+页面只更新受影响的单元格：
+
+- 通过ORM新增、修改、删除 Schedule 的事务，提交成功后为每个变化的单元格发布一个 lesson 事件，
+  包含班级、星期、节次以及修改前后的课程
+- query.delete()/update() 等批量语句无法得知具体的单元格，一次修改大量课程（如自动排课）时逐个推送也没有意义，
+  这两种情况发布一个 reload 事件，页面提示重新加载
+- 最近的事件保存在内存中，断线重连的页面按版本号补发错过的事件；错过的事件已被丢弃时发布 reload 事件
+
+事件只在本进程内传递，多进程部署时每个进程只推送本进程提交的修改；排课沙盒的会话（info 中有 'sandbox' 键）不发布事件
+"""
+
+import json
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from models import Schedule
+import reference_cache
+
+
+# 内存中保留的最近事件数，可通过配置项 SCHEDULE_EVENT_BUFFER 修改
+DEFAULT_BUFFER = 1000
+
+# 没有新事件时发送心跳的间隔（秒），防止代理服务器断开空闲连接
+HEARTBEAT_SECONDS = 15
+
+# 一个事务修改的课程超过这个数时（如自动排课）不再逐个单元格推送，改为发布 reload 事件
+MAX_LESSON_EVENTS = 200
+
+LESSON_FIELDS = ('class_id', 'subject_id', 'teacher_id', 'day_of_week', 'period', 'is_combined', 'week_type')
+
+
+class ChangeLog:
+    """带版本号的事件环形缓冲区，订阅者等待新事件"""
+
+    def __init__(self, size: int = DEFAULT_BUFFER):
+        self.revision = 0
+        self._events = deque(maxlen=size)
+        self._condition = threading.Condition()
+
+    def resize(self, size: int):
+        with self._condition:
+            self._events = deque(self._events, maxlen=size)
+
+    def publish(self, events: List[Dict]) -> int:
+        """依次为事件分配版本号并通知订阅者，返回最新版本号"""
+        with self._condition:
+            for item in events:
+                self.revision += 1
+                self._events.append(dict(item, revision=self.revision))
+            self._condition.notify_all()
+            return self.revision
+
+    def since(self, revision: int) -> Tuple[List[Dict], bool]:
+        """
+        版本号大于 revision 的事件
+
+        Returns:
+            Tuple[List[Dict], bool]: (事件列表, 是否有事件已被丢弃而无法补发)
+        """
+        with self._condition:
+            return self._collect(revision)
+
+    def wait(self, revision: int, timeout: float) -> Tuple[List[Dict], bool]:
+        """等待版本号大于 revision 的事件，超时返回空列表"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.revision != revision, timeout=timeout)
+            return self._collect(revision)
+
+    def _collect(self, revision: int) -> Tuple[List[Dict], bool]:
+        if revision > self.revision:
+            # 客户端的版本号比服务器还新，说明服务器重启过，之前的事件都已丢失
+            return [], True
+        if revision == self.revision:
+            return [], False
+        oldest = self._events[0]['revision'] if self._events else self.revision + 1
+        missed = revision + 1 < oldest
+        return [item for item in self._events if item['revision'] > revision], missed
+
+
+changes = ChangeLog()
+
+
+def _names():
+    return ({subject.id: subject.name for subject in reference_cache.get_subjects()},
+            {teacher.id: teacher.name for teacher in reference_cache.get_teachers()},
+            {item.id: item.name for item in reference_cache.get_classes()})
+
+
+def _lesson(values: Dict, names) -> Optional[Dict]:
+    if values is None:
+        return None
+    subjects, teachers, classes = names
+    return {
+        'subject_id': values['subject_id'],
+        'subject': subjects.get(values['subject_id']),
+        'teacher_id': values['teacher_id'],
+        'teacher': teachers.get(values['teacher_id']),
+        'class_name': classes.get(values['class_id']),
+        'is_combined': bool(values['is_combined']),
+        'week_type': values['week_type'] or 'all'
+    }
+
+
+def lesson_events(changed: List[Tuple[Optional[Dict], Optional[Dict]]]) -> List[Dict]:
+    """
+    把 (修改前, 修改后) 的课程字段转换为单元格事件；班级或时间段发生变化时拆成原单元格和新单元格两个事件
+    """
+    names = _names()
+    result = []
+    for before, after in changed:
+        pairs = [(before, after)]
+        if before and after and any(before[key] != after[key] for key in ('class_id', 'day_of_week', 'period')):
+            pairs = [(before, None), (None, after)]
+        for old, new in pairs:
+            where = new or old
+            result.append({
+                'type': 'lesson',
+                'class_id': where['class_id'],
+                'day': where['day_of_week'],
+                'period': where['period'],
+                'old': _lesson(old, names),
+                'new': _lesson(new, names)
+            })
+    return result
+
+
+def publish_reload(reason: str, class_ids: Optional[List[int]] = None) -> int:
+    """发布 reload 事件：受影响的页面需要重新加载（class_ids 为空表示所有班级）"""
+    return changes.publish([{'type': 'reload', 'reason': reason, 'class_ids': class_ids}])
+
+
+def format_sse(item: Dict) -> str:
+    """SSE 格式的事件文本"""
+    return f"id: {item['revision']}\nevent: {item['type']}\ndata: {json.dumps(item, ensure_ascii=False)}\n\n"
+
+
+def stream(revision: int, heartbeat: float = HEARTBEAT_SECONDS):
+    """
+    SSE 事件流：先补发版本号之后错过的事件，再持续推送新事件
+
+    Args:
+        revision: 客户端已收到的最新版本号
+    """
+    yield 'retry: 3000\n\n'
+    while True:
+        items, missed = changes.wait(revision, heartbeat)
+        if missed:
+            # 错过的事件已被丢弃，只能整体重新加载
+            revision = changes.revision
+            yield format_sse({'type': 'reload', 'reason': 'missed', 'class_ids': None, 'revision': revision})
+            continue
+        if not items:
+            yield ': keep-alive\n\n'
+            continue
+        for item in items:
+            yield format_sse(item)
+        revision = items[-1]['revision']
+
+
+def init_events(app):
+    """
+    根据应用配置设置内存中保留的事件数，并注册模板函数 schedule_revision()：
+    页面渲染时记下当时的版本号，连接事件流后从这个版本号开始补发，渲染到连接之间的修改也不会漏掉
+    """
+    changes.resize(app.config.get('SCHEDULE_EVENT_BUFFER', DEFAULT_BUFFER))
+    app.add_template_global(lambda: changes.revision, 'schedule_revision')
+
+
+# ---------------------------------------------------------------------------
+# 记录事务中的课表修改，提交成功后发布
+# ---------------------------------------------------------------------------
+
+def _pending(session) -> List:
+    return session.info.setdefault('schedule_events_pending', [])
+
+
+def _values(instance) -> Dict:
+    return {key: getattr(instance, key) for key in LESSON_FIELDS}
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_lessons(session, flush_context, instances):
+    if session.info.get('sandbox'):
+        return
+    added = [instance for instance in session.new if isinstance(instance, Schedule)]
+    touched = [instance for instance in session.dirty
+               if isinstance(instance, Schedule) and session.is_modified(instance, include_collections=False)]
+    removed = [instance for instance in session.deleted if isinstance(instance, Schedule)]
+    if not (added or touched or removed) or session.info.get('schedule_events_bulk'):
+        return
+
+    pending = _pending(session)
+    if len(pending) + len(added) + len(touched) + len(removed) > MAX_LESSON_EVENTS:
+        session.info['schedule_events_bulk'] = True
+        return
+
+    with session.no_autoflush:
+        # 提交前数据库中还是修改前的课程（已过期的对象在修改时不会记录原值，只能从数据库读取）；
+        # 提交后不能再查询数据库，学科、教师、班级名称也在这里查好
+        ids = [inspect(instance).identity[0] for instance in touched + removed]
+        stored = {}
+        if ids:
+            columns = [getattr(Schedule, key) for key in LESSON_FIELDS]
+            stored = {row[0]: dict(zip(LESSON_FIELDS, row[1:]))
+                      for row in session.execute(select(Schedule.id, *columns).where(Schedule.id.in_(ids)))}
+
+        changed = [(None, _values(instance)) for instance in added]
+        for instance, id_ in zip(touched + removed, ids):
+            before = stored.get(id_)
+            after = _values(instance) if instance in touched else None
+            if before is not None and before != after:
+                changed.append((before, after))
+        pending.extend(lesson_events(changed))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_statements(orm_execute_state):
+    if orm_execute_state.session.info.get('sandbox'):
+        return
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is Schedule:
+            orm_execute_state.session.info['schedule_events_bulk'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    changed = session.info.pop('schedule_events_pending', None)
+    bulk = session.info.pop('schedule_events_bulk', None)
+    if bulk:
+        publish_reload('bulk')
+    elif changed:
+        changes.publish(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('schedule_events_pending', None)
+    session.info.pop('schedule_events_bulk', None)
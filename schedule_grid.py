@@ -0,0 +1,276 @@
+"""
+课表批量加载模块
+用固定次数的查询一次性加载全校（或选定范围）的课表数据，
+供整校导出、批量打印等需要处理大量班级/教师课表的功能使用
+"""
+
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple, Any
+
+from sqlalchemy import or_
+
+from database import db
+from models import (Schedule, Teacher, Subject, Class, CommonCourse, ScheduleSetting,
+                    PrintSetting, SelfStudySchedule, SelfStudyPlan)
+import reference_cache
+
+
+# 早晚自习时段：时段名称 -> 显示名称
+SELFSTUDY_PERIODS = {
+    '早读1': '早读',
+    '晚修1': '晚修',
+}
+
+DAY_NAMES = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
+
+
+def get_schedule_setting() -> ScheduleSetting:
+    """获取排课设置（缓存的只读副本），不存在时返回默认设置（不写入数据库）"""
+    return reference_cache.get_schedule_setting()
+
+
+def selfstudy_virtual_period(period_name: str, setting: ScheduleSetting) -> Optional[int]:
+    """
+    将早晚自习时段名称映射为课表中的虚拟节次
+
+    早读排在第一节课之前（-1），晚修排在最后一节课之后（periods_per_day + 1），
+    与 get_class_schedule_with_selfstudy 的约定保持一致
+
+    Args:
+        period_name: 早晚自习时段名称，如 '早读1'
+        setting: 排课设置
+
+    Returns:
+        Optional[int]: 虚拟节次，无法识别的时段返回None
+    """
+    if period_name == '早读1':
+        return -1
+    if period_name == '晚修1':
+        return (setting.periods_per_day or 8) + 1
+    return None
+
+
+def load_print_options() -> Tuple[PrintSetting, Dict[str, Any], Dict[str, Any]]:
+    """
+    获取打印设置（缓存的只读副本）并解析其中的JSON字段，整个请求只需解析一次
+
+    Returns:
+        Tuple: (打印设置, 课节时间, 公共时段)
+    """
+    print_settings = reference_cache.get_print_setting()
+
+    try:
+        period_times = json.loads(print_settings.period_times) if print_settings.period_times else {}
+    except (ValueError, TypeError):
+        period_times = {}
+
+    try:
+        common_periods = json.loads(print_settings.common_periods) if print_settings.common_periods else {}
+    except (ValueError, TypeError):
+        common_periods = {}
+
+    return print_settings, period_times, common_periods
+
+
+def _empty_grid(setting: ScheduleSetting) -> Dict[int, Dict[int, Any]]:
+    return {day: {} for day in range(1, (setting.days_per_week or 5) + 1)}
+
+
+def load_school_grids(setting: ScheduleSetting,
+                      class_ids: Optional[Iterable[int]] = None,
+                      teacher_ids: Optional[Iterable[int]] = None,
+                      include_selfstudy: bool = True) -> Tuple[Dict[int, dict], Dict[int, dict]]:
+    """
+    批量加载班级课表和教师课表
+
+    无论涉及多少班级和教师，都只执行固定次数的查询（正课、公共课程、早晚自习各一次），
+    返回的单元格结构与 get_class_schedule_with_selfstudy / get_teacher_schedule_with_selfstudy 一致
+
+    Args:
+        setting: 排课设置
+        class_ids: 需要的班级ID，None表示全部班级，空列表表示不需要班级课表
+        teacher_ids: 需要的教师ID，None表示全部教师，空列表表示不需要教师课表
+        include_selfstudy: 是否包含早晚自习
+
+    Returns:
+        Tuple: (班级ID -> 课表数据, 教师ID -> 课表数据)
+    """
+    class_filter = set(class_ids) if class_ids is not None else None
+    teacher_filter = set(teacher_ids) if teacher_ids is not None else None
+    want_classes = class_filter is None or bool(class_filter)
+    want_teachers = teacher_filter is None or bool(teacher_filter)
+
+    class_grids = defaultdict(lambda: _empty_grid(setting))
+    teacher_grids = defaultdict(lambda: _empty_grid(setting))
+
+    if not want_classes and not want_teachers:
+        return {}, {}
+
+    # 正课：只取需要的列，避免逐条加载关联对象
+    query = db.session.query(
+        Schedule.class_id, Schedule.teacher_id, Schedule.subject_id,
+        Schedule.day_of_week, Schedule.period, Schedule.is_combined,
+        Subject.name, Subject.fixed_day, Teacher.name, Class.name
+    ).join(Subject, Schedule.subject_id == Subject.id) \
+     .join(Teacher, Schedule.teacher_id == Teacher.id) \
+     .join(Class, Schedule.class_id == Class.id)
+
+    if class_filter is not None and teacher_filter is not None:
+        query = query.filter(or_(Schedule.class_id.in_(class_filter or [-1]),
+                                 Schedule.teacher_id.in_(teacher_filter or [-1])))
+    elif class_filter is not None and not want_teachers:
+        query = query.filter(Schedule.class_id.in_(class_filter))
+    elif teacher_filter is not None and not want_classes:
+        query = query.filter(Schedule.teacher_id.in_(teacher_filter))
+
+    # 已排课时计数：(班级, 学科, 教师) -> 课时数
+    scheduled_counts = defaultdict(int)
+
+    for (class_id, teacher_id, subject_id, day, period, is_combined,
+         subject_name, fixed_day, teacher_name, class_name) in query:
+        # 固定排在周六的科目（学科的 fixed_day 为6），打印时突出显示
+        is_saturday_priority = fixed_day == 6
+        if want_classes and (class_filter is None or class_id in class_filter):
+            class_grids[class_id].setdefault(day, {})[period] = {
+                'subject': subject_name,
+                'teacher': teacher_name,
+                'teacher_id': teacher_id,
+                'subject_id': subject_id,
+                'is_combined': is_combined,
+                'is_saturday_priority': is_saturday_priority
+            }
+            scheduled_counts[(class_id, subject_id, teacher_id)] += 1
+        if want_teachers and (teacher_filter is None or teacher_id in teacher_filter):
+            teacher_grids[teacher_id].setdefault(day, {})[period] = {
+                'subject': subject_name,
+                'teacher': class_name,  # 对于教师视图，"teacher"字段实际存储班级名称
+                'class_id': class_id,
+                'subject_id': subject_id,
+                'is_combined': is_combined,
+                'is_saturday_priority': is_saturday_priority
+            }
+
+    # 公共课程只影响班级课表
+    if want_classes:
+        all_class_ids = class_filter if class_filter is not None else {
+            row[0] for row in db.session.query(Class.id)
+        }
+        for course in CommonCourse.query.all():
+            if course.apply_to_all_classes:
+                targets = all_class_ids
+            elif course.class_id in all_class_ids:
+                targets = (course.class_id,)
+            else:
+                continue
+            cell = {
+                'subject': course.name,
+                'description': course.description or '',
+                'teacher': '公共课程',
+                'teacher_id': 0,
+                'is_combined': False,
+                'is_common_course': True,
+                'week_type': course.week_type
+            }
+            for class_id in targets:
+                class_grids[class_id].setdefault(course.day_of_week, {})[course.period] = dict(cell)
+
+    if include_selfstudy:
+        _load_selfstudy(setting, class_grids, teacher_grids, class_filter, teacher_filter,
+                        want_classes, want_teachers)
+
+    return dict(class_grids), dict(teacher_grids)
+
+
+def _load_selfstudy(setting, class_grids, teacher_grids, class_filter, teacher_filter,
+                    want_classes, want_teachers):
+    """用一次外连接查询把早晚自习合并进班级和教师课表"""
+    query = db.session.query(
+        SelfStudySchedule.class_id, SelfStudySchedule.day, SelfStudySchedule.period,
+        SelfStudySchedule.is_common_course, SelfStudySchedule.common_course_title,
+        SelfStudyPlan.teacher_id, SelfStudyPlan.subject_id,
+        Subject.name, Teacher.name, Class.name
+    ).outerjoin(SelfStudyPlan, SelfStudySchedule.plan_id == SelfStudyPlan.id) \
+     .outerjoin(Subject, SelfStudyPlan.subject_id == Subject.id) \
+     .outerjoin(Teacher, SelfStudyPlan.teacher_id == Teacher.id) \
+     .join(Class, SelfStudySchedule.class_id == Class.id) \
+     .filter(SelfStudySchedule.period.in_(list(SELFSTUDY_PERIODS)))
+
+    for (class_id, day, period_name, is_common, common_title, teacher_id, subject_id,
+         subject_name, teacher_name, class_name) in query:
+        virtual_period = selfstudy_virtual_period(period_name, setting)
+        display = SELFSTUDY_PERIODS[period_name]
+
+        if want_classes and (class_filter is None or class_id in class_filter):
+            if is_common:
+                cell = {
+                    'subject': common_title,
+                    'teacher': '公共课程',
+                    'teacher_id': 0,
+                    'is_combined': False,
+                    'is_common_course': True,
+                    'is_selfstudy': True,
+                    'period_display': display
+                }
+            else:
+                cell = {
+                    'subject': subject_name or '',
+                    'teacher': teacher_name or '',
+                    'teacher_id': teacher_id or 0,
+                    'is_combined': False,
+                    'is_common_course': False,
+                    'is_selfstudy': True,
+                    'period_display': display
+                }
+            class_grids[class_id].setdefault(day, {})[virtual_period] = cell
+
+        if (want_teachers and not is_common and teacher_id
+                and (teacher_filter is None or teacher_id in teacher_filter)):
+            teacher_grids[teacher_id].setdefault(day, {})[virtual_period] = {
+                'subject': subject_name or '',
+                'teacher': class_name,  # 对于教师视图，显示班级名称
+                'class_id': class_id,
+                'subject_id': subject_id or 0,
+                'is_combined': False,
+                'is_selfstudy': True,
+                'period_display': display
+            }
+
+
+def build_time_rows(setting: ScheduleSetting, period_times: Dict[str, Any],
+                    include_selfstudy: bool = True):
+    """
+    生成课表的行定义（节次, 行标题），早读在最前、晚修在最后
+
+    Args:
+        setting: 排课设置
+        period_times: 打印设置中的课节时间
+        include_selfstudy: 是否包含早晚自习行
+
+    Returns:
+        List[Tuple[int, str]]: 行定义列表
+    """
+    morning = setting.morning_periods or 4
+    rows = []
+    if include_selfstudy:
+        rows.append((-1, '早读'))
+    for period in range(1, (setting.periods_per_day or 8) + 1):
+        if period <= morning:
+            label = f'上午第{period}节'
+        else:
+            label = f'下午第{period - morning}节'
+        time_text = period_times.get(str(period))
+        rows.append((period, f'{label}\n{time_text}' if time_text else label))
+    if include_selfstudy:
+        rows.append(((setting.periods_per_day or 8) + 1, '晚修'))
+    return rows
+
+
+def format_cell(cell: Optional[dict]) -> str:
+    """将课表单元格格式化为"学科\\n教师/班级"文本"""
+    if not cell:
+        return ''
+    text = f"{cell['subject']}\n{cell['teacher']}"
+    if cell.get('is_combined'):
+        text += "\n(合班)"
+    return text
@@ -0,0 +1,347 @@
+"""
+排课沙盒
+管理员想试试新的合班、不同的禁排时段或给某个班换老师会有什么效果时，以前只能直接修改正式数据库，
+自动排课后再想办法改回去。沙盒用 SQLite 的在线备份接口把整个数据库复制到内存中（几毫秒），
+修改、自动排课和评分都在副本上进行，不影响正式课表：
+
+- 修改以 {'action': 'add'|'update'|'delete', 'model': 模型名称, 'id': ..., 'values': {...}} 的列表给出，
+  可修改的模型见 EDITABLE_MODELS；新增的记录可以用 'ref' 命名，之后的修改中用 {'ref': 名称} 引用它的ID
+- 沙盒中的自动排课与 /api/schedule/solve 相同，结果可以与正式课表比较评分和逐节差异
+- 只有明确的"应用"才会写入正式数据库：在一个事务中重放沙盒中的修改并用沙盒的课表替换正式课表。
+  创建沙盒后正式数据库中的课表或相关数据被修改过时拒绝应用
+- 可以同时存在多个沙盒（数量上限 SANDBOX_LIMIT），闲置超过 SANDBOX_TTL 秒的沙盒自动删除
+
+沙盒保存在本进程的内存中，多进程部署时只能在创建它的进程中访问。沙盒的会话不发布课表变更事件，
+也不使用、不影响基础数据缓存
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import create_engine, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from database import apply_sqlite_pragmas, db
+from models import (Class, ClassCombination, CommonCourse, Schedule, ScheduleSetting, SelfStudySchedule, Subject,
+                    SubjectBlock, Teacher, TeachingPlan, class_combination_detail)
+import reference_cache
+import schedule_decomposition
+import schedule_snapshots
+import timetable_solver
+from solver_telemetry import SolverTelemetry
+
+DEFAULT_LIMIT = 5
+DEFAULT_TTL = 3600
+
+# 沙盒中可以修改的模型：名称 -> 模型类
+EDITABLE_MODELS = OrderedDict([
+    ('teacher', Teacher),
+    ('class_combination', ClassCombination),
+    ('teaching_plan', TeachingPlan),
+    ('subject_block', SubjectBlock),
+    ('common_course', CommonCourse),
+    ('schedule_setting', ScheduleSetting),
+    ('schedule', Schedule),
+])
+
+# 创建沙盒后这些表被修改过时拒绝应用
+FINGERPRINT_TABLES = [Schedule.__table__, SelfStudySchedule.__table__, Class.__table__, Subject.__table__,
+                      class_combination_detail] + [model.__table__ for model in EDITABLE_MODELS.values()]
+
+READONLY_COLUMNS = {'id', 'created_at', 'updated_at'}
+
+
+def fingerprint() -> str:
+    """当前会话中课表和可修改数据的指纹，用于判断正式数据库在创建沙盒后是否被修改"""
+    digest = hashlib.sha1()
+    for table in dict.fromkeys(FINGERPRINT_TABLES):
+        digest.update(table.name.encode('utf-8'))
+        for row in db.session.execute(select(table).order_by(*table.primary_key.columns)):
+            digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _resolve(value, refs: Dict[str, int]):
+    """把 {'ref': 名称} 替换为之前新增的记录的ID"""
+    if isinstance(value, dict) and 'ref' in value:
+        if value['ref'] not in refs:
+            raise ValueError(f'引用了未定义的新增记录: {value["ref"]}')
+        return refs[value['ref']]
+    return value
+
+
+def _assign(instance, values: Dict, refs: Dict[str, int]):
+    model = type(instance)
+    columns = {attr.key for attr in inspect(model).column_attrs} - READONLY_COLUMNS
+    for key, value in values.items():
+        if model is ClassCombination and key == 'class_ids':
+            class_ids = [_resolve(id_, refs) for id_ in value]
+            classes = Class.query.filter(Class.id.in_(class_ids)).all()
+            if len(classes) != len(set(class_ids)):
+                raise ValueError(f'未找到班级: {sorted(set(class_ids) - {c.id for c in classes})}')
+            instance.classes = classes
+        elif key in columns:
+            setattr(instance, key, _resolve(value, refs))
+        else:
+            raise ValueError(f'{model.__tablename__} 没有可修改的字段 {key}')
+
+
+def apply_changes(changes: Iterable[Dict], refs: Optional[Dict[str, int]] = None) -> List[Dict]:
+    """
+    在当前会话中执行修改，不提交
+
+    Args:
+        changes: 修改列表，格式见模块说明
+        refs: 新增记录的名称 -> ID，执行过程中更新
+
+    Returns:
+        List[Dict]: 每项修改的 action、model 和记录ID
+    """
+    refs = {} if refs is None else refs
+    applied = []
+    for index, change in enumerate(changes, 1):
+        action, name = change.get('action'), change.get('model')
+        model = EDITABLE_MODELS.get(name)
+        try:
+            if model is None:
+                raise ValueError(f'不能修改 {name}')
+            if action == 'add':
+                instance = model()
+            elif action in ('update', 'delete'):
+                instance = db.session.get(model, _resolve(change.get('id'), refs))
+                if instance is None:
+                    raise ValueError(f'未找到 {name} {change.get("id")}')
+            else:
+                raise ValueError(f'不支持的操作 {action}')
+
+            if action == 'delete':
+                db.session.delete(instance)
+            else:
+                with db.session.no_autoflush:
+                    _assign(instance, change.get('values') or {}, refs)
+                db.session.add(instance)
+            db.session.flush()
+        except ValueError as e:
+            raise ValueError(f'第{index}项修改：{e}') from None
+        except IntegrityError as e:
+            raise ValueError(f'第{index}项修改：数据不完整或与已有数据重复（{e.orig}）') from None
+
+        if action == 'add' and change.get('ref'):
+            refs[change['ref']] = instance.id
+        applied.append({'action': action, 'model': name, 'id': instance.id})
+    return applied
+
+
+def _clone_database() -> sqlite3.Connection:
+    """用 SQLite 在线备份接口把正式数据库复制到一个内存数据库中，连接参数与正式数据库相同（SQLITE_PRAGMAS）"""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        raise RuntimeError('排课沙盒只支持SQLite数据库')
+    target = sqlite3.connect(':memory:', check_same_thread=False)
+    # 外键检查等设置要与正式数据库一致，沙盒中能执行的修改在应用到正式数据库时也能执行
+    apply_sqlite_pragmas(target, current_app.config.get('SQLITE_PRAGMAS') or {})
+    source = engine.raw_connection()
+    try:
+        source.driver_connection.backup(target)
+    finally:
+        source.close()
+    return target
+
+
+class Sandbox:
+    """一个内存中的数据库副本，以及在其中执行过的修改"""
+
+    def __init__(self, sandbox_id: int, name: str, created_by: Optional[str] = None):
+        self.id = sandbox_id
+        self.name = name
+        self.created_by = created_by
+        self.created_at = datetime.now()
+        self.last_used = time.monotonic()
+        self.changes: List[Dict] = []
+        self.runs: List[Dict] = []
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+        started = time.perf_counter()
+        self._connection = _clone_database()
+        self.clone_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.engine = create_engine('sqlite://', creator=lambda: self._connection, poolclass=StaticPool)
+        with self.activate():
+            self.baseline = fingerprint()
+
+    @contextmanager
+    def activate(self):
+        """
+        代码块中的 db.session（包括 Model.query）使用沙盒数据库，基础数据不走缓存。
+        同一沙盒同时只能有一个代码块在使用
+        """
+        with self._lock, current_app.app_context(), reference_cache.bypass():
+            # 新的应用上下文有自己的 db.session，退出时由 Flask-SQLAlchemy 关闭
+            db.session.registry.set(Session(bind=self.engine, info={'sandbox': self.id}))
+            self.last_used = time.monotonic()
+            yield
+
+    def apply(self, changes: List[Dict]) -> List[Dict]:
+        """在沙盒中执行修改并提交，任一项出错时全部撤销"""
+        refs = dict(self._refs)
+        with self.activate():
+            try:
+                applied = apply_changes(changes, refs)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        self._refs = refs
+        self.changes.extend(changes)
+        return applied
+
+    def generate(self, class_ids: Optional[List[int]] = None, constraints: Optional[List[str]] = None,
+                 seed: Optional[int] = None, workers: Optional[int] = None) -> Dict:
+        """在沙盒中自动排课，参数与 schedule_decomposition.solve_parallel 相同，成功时替换沙盒中的课表"""
+        telemetry = SolverTelemetry()
+        with self.activate():
+            problem = timetable_solver.load_problem(class_ids, telemetry)
+            if not problem.plans:
+                return {'success': False, 'message': '未找到任何授课计划，无法进行排课!'}
+            result = schedule_decomposition.solve_parallel(problem, constraints, seed=seed, workers=workers)
+            telemetry.merge(result.pop('telemetry'))
+            if result['success']:
+                timetable_solver.save_lessons(result['lessons'], class_ids, telemetry)
+
+        lessons = result.pop('lessons')
+        self.runs.append({'class_ids': class_ids, 'constraints': constraints, 'seed': seed,
+                          'success': result['success'], 'message': result['message']})
+        return {**result, 'lessons': len(lessons), 'telemetry': telemetry.to_dict()}
+
+    def report(self) -> Dict:
+        """沙盒课表与正式课表的评分比较和逐节差异"""
+        # 评分依赖 numpy，只在需要时导入
+        import timetable_score
+
+        with self.activate():
+            sandbox_score = timetable_score.score_current()
+            content = schedule_snapshots.current_content()
+        return {
+            'score': timetable_score.compare_scores(timetable_score.score_current(), sandbox_score),
+            'diff': schedule_snapshots.diff_snapshots(schedule_snapshots.current_content(), content)
+        }
+
+    def lessons(self, class_id: Optional[int] = None, teacher_id: Optional[int] = None) -> List[Dict]:
+        """沙盒中某个班级或教师的课表"""
+        with self.activate():
+            query = Schedule.query
+            if class_id is not None:
+                query = query.filter(Schedule.class_id == class_id)
+            if teacher_id is not None:
+                query = query.filter(Schedule.teacher_id == teacher_id)
+            subjects = {s.id: s.name for s in reference_cache.get_subjects()}
+            teachers = {t.id: t.name for t in reference_cache.get_teachers()}
+            classes = {c.id: c.name for c in reference_cache.get_classes()}
+            return [{
+                'class_id': lesson.class_id, 'class_name': classes.get(lesson.class_id),
+                'subject_id': lesson.subject_id, 'subject': subjects.get(lesson.subject_id),
+                'teacher_id': lesson.teacher_id, 'teacher': teachers.get(lesson.teacher_id),
+                'day': lesson.day_of_week, 'period': lesson.period, 'week_type': lesson.week_type,
+                'is_combined': bool(lesson.is_combined), 'combination_id': lesson.combination_id
+            } for lesson in query.order_by(Schedule.day_of_week, Schedule.period, Schedule.class_id)]
+
+    def promote(self) -> Dict:
+        """
+        把沙盒应用到正式数据库：在一个事务中重放沙盒中的修改，并用沙盒的课表替换正式课表（早晚自习不变）
+
+        Returns:
+            Dict: 重放的修改数和写入的正课节数
+        """
+        with self.activate():
+            content = schedule_snapshots.current_content()
+        if fingerprint() != self.baseline:
+            raise RuntimeError('创建沙盒后正式课表或相关数据已被修改，请重新创建沙盒')
+        try:
+            schedule_snapshots.auto_snapshot('应用排课沙盒前')
+            applied = apply_changes(self.changes)
+            counts = schedule_snapshots.replace_content(content, include_selfstudy=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return {'changes': len(applied), 'lessons': counts['lessons']}
+
+    def close(self):
+        with self._lock:
+            self.engine.dispose()
+            self._connection.close()
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'created_by': self.created_by,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'clone_ms': self.clone_ms,
+            'idle_seconds': round(time.monotonic() - self.last_used),
+            'changes': self.changes,
+            'runs': self.runs
+        }
+
+
+class SandboxRegistry:
+    """本进程中的沙盒，限制数量并删除闲置的沙盒"""
+
+    def __init__(self, limit: int = DEFAULT_LIMIT, ttl: int = DEFAULT_TTL):
+        self.limit = limit
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sandboxes: Dict[int, Sandbox] = OrderedDict()
+        self._next_id = 1
+
+    def _purge(self):
+        now = time.monotonic()
+        for sandbox_id, sandbox in list(self._sandboxes.items()):
+            if now - sandbox.last_used > self.ttl:
+                self._sandboxes.pop(sandbox_id).close()
+
+    def create(self, name: str, created_by: Optional[str] = None) -> Sandbox:
+        with self._lock:
+            self._purge()
+            if len(self._sandboxes) >= self.limit:
+                raise RuntimeError(f'最多同时存在{self.limit}个沙盒，请先删除不用的沙盒')
+            sandbox = Sandbox(self._next_id, name, created_by)
+            self._sandboxes[sandbox.id] = sandbox
+            self._next_id += 1
+            return sandbox
+
+    def get(self, sandbox_id: int) -> Optional[Sandbox]:
+        with self._lock:
+            self._purge()
+            return self._sandboxes.get(sandbox_id)
+
+    def all(self) -> List[Sandbox]:
+        with self._lock:
+            self._purge()
+            return list(self._sandboxes.values())
+
+    def remove(self, sandbox_id: int) -> bool:
+        with self._lock:
+            sandbox = self._sandboxes.pop(sandbox_id, None)
+        if sandbox is None:
+            return False
+        sandbox.close()
+        return True
+
+
+sandboxes = SandboxRegistry()
+
+
+def init_sandboxes(app):
+    """根据应用配置设置沙盒数量上限和闲置时间"""
+    sandboxes.limit = app.config.get('SANDBOX_LIMIT', DEFAULT_LIMIT)
+    sandboxes.ttl = app.config.get('SANDBOX_TTL', DEFAULT_TTL)
@@ -0,0 +1,395 @@
+"""
+课表快照
+把整张课表（正课 + 早晚自习）打包成一个压缩的整数数组保存为一条记录，可以随时整体恢复、
+与其他快照或当前课表比较。自动排课、清空课表等会整体覆盖课表的操作在写入前自动创建快照，
+快照与写入在同一个事务中提交：操作因参数错误被拒绝或写入失败回滚时，不会留下多余的快照。
+
+快照数据格式（zlib压缩）：
+    4字节头部长度 + 头部JSON（版本、行数、早晚自习时段名称、公共课程文本）
+    + 正课 int32 数组，每行 (班级ID, 学科ID, 教师ID, 时间段, 合班ID, 标记)
+    + 早晚自习 int32 数组，每行 (班级ID, 星期, 时段下标, 自习计划ID, 公共课程下标)
+时间段 = 星期 * 100 + 节次；标记的第0位为是否合班，第1-2位为单双周（0每周 1单周 2双周）
+"""
+
+import json
+import struct
+import sys
+import zlib
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from flask import g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db
+from models import (Class, ClassCombination, Schedule, ScheduleSnapshot, SelfStudyPlan, SelfStudySchedule, Subject,
+                    Teacher)
+import reference_cache
+
+
+FORMAT_VERSION = 1
+REGULAR_WIDTH = 6
+SELFSTUDY_WIDTH = 5
+
+WEEK_TYPES = ['all', 's', 'd']
+
+# 会整体删除或重新生成课表、但没有自行调用 auto_snapshot() 的接口：请求中第一次删除或批量修改
+# 正课、早晚自习时（即参数校验之后、实际写入之前）自动创建快照
+AUTO_SNAPSHOT_ENDPOINTS = {
+    'schedule.auto_generate': '自动排课前',
+    'schedule.clear_all_schedules': '清空课表前',
+    'selfstudy.auto_schedule': '早晚自习自动排课前',
+    'selfstudy.delete_all_schedules': '清空早晚自习前',
+}
+
+# 自动快照最多保留的数量，手动创建的快照不受影响
+AUTO_SNAPSHOT_KEEP = 20
+
+
+def _int_array(rows, width: int) -> array:
+    values = array('i')
+    for row in rows:
+        values.extend(row)
+    assert len(values) % width == 0
+    return values
+
+
+def _to_bytes(values: array) -> bytes:
+    # 统一按小端序保存，保证快照在不同平台之间通用
+    if sys.byteorder != 'little':
+        values = array('i', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(data: bytes) -> array:
+    values = array('i')
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def pack_current() -> Tuple[bytes, int, int]:
+    """
+    用两次只取列的查询读取当前课表并打包
+
+    Returns:
+        Tuple: (压缩数据, 正课节数, 早晚自习节数)
+    """
+    regular_rows = [
+        (class_id or 0, subject_id or 0, teacher_id or 0, day * 100 + period, combination_id or 0,
+         (1 if is_combined else 0) | (WEEK_TYPES.index(week_type) if week_type in WEEK_TYPES else 0) << 1)
+        for class_id, subject_id, teacher_id, day, period, combination_id, is_combined, week_type
+        in db.session.query(
+            Schedule.class_id, Schedule.subject_id, Schedule.teacher_id, Schedule.day_of_week,
+            Schedule.period, Schedule.combination_id, Schedule.is_combined, Schedule.week_type)
+    ]
+
+    period_names: List[str] = []
+    common_courses: List[list] = []
+    selfstudy_rows = []
+    for class_id, day, period, plan_id, is_common, title, desc, apply_all in db.session.query(
+        SelfStudySchedule.class_id, SelfStudySchedule.day, SelfStudySchedule.period,
+        SelfStudySchedule.plan_id, SelfStudySchedule.is_common_course, SelfStudySchedule.common_course_title,
+        SelfStudySchedule.common_course_desc, SelfStudySchedule.apply_to_all_classes
+    ):
+        if period not in period_names:
+            period_names.append(period)
+        common_index = 0
+        if is_common:
+            common_courses.append([title, desc, bool(apply_all)])
+            common_index = len(common_courses)
+        selfstudy_rows.append((class_id or 0, day, period_names.index(period), plan_id or 0, common_index))
+
+    header = json.dumps({
+        'version': FORMAT_VERSION,
+        'regular': len(regular_rows),
+        'selfstudy': len(selfstudy_rows),
+        'periods': period_names,
+        'common': common_courses
+    }, ensure_ascii=False).encode('utf-8')
+
+    payload = (struct.pack('<I', len(header)) + header
+               + _to_bytes(_int_array(regular_rows, REGULAR_WIDTH))
+               + _to_bytes(_int_array(selfstudy_rows, SELFSTUDY_WIDTH)))
+    return zlib.compress(payload, 6), len(regular_rows), len(selfstudy_rows)
+
+
+def unpack(data: bytes) -> Dict:
+    """
+    解包快照数据
+
+    Returns:
+        Dict: {'regular': 正课行列表, 'selfstudy': 早晚自习行列表, 'periods': 时段名称, 'common': 公共课程}
+    """
+    payload = zlib.decompress(data)
+    header_length = struct.unpack('<I', payload[:4])[0]
+    header = json.loads(payload[4:4 + header_length].decode('utf-8'))
+    if header.get('version') != FORMAT_VERSION:
+        raise ValueError(f"不支持的快照格式版本: {header.get('version')}")
+
+    values = _from_bytes(payload[4 + header_length:])
+    split = header['regular'] * REGULAR_WIDTH
+    regular = [tuple(values[i:i + REGULAR_WIDTH]) for i in range(0, split, REGULAR_WIDTH)]
+    selfstudy = [tuple(values[i:i + SELFSTUDY_WIDTH]) for i in range(split, len(values), SELFSTUDY_WIDTH)]
+    return {'regular': regular, 'selfstudy': selfstudy, 'periods': header['periods'], 'common': header['common']}
+
+
+def _add_snapshot(name: str, is_auto: bool, created_by: Optional[str]) -> ScheduleSnapshot:
+    """把数据库中当前课表的快照加入会话（不提交），自动快照超过保留数量时删除最早的"""
+    with db.session.no_autoflush:
+        data, lesson_count, selfstudy_count = pack_current()
+        snapshot = ScheduleSnapshot(name=name, is_auto=is_auto, data=data, lesson_count=lesson_count,
+                                    selfstudy_count=selfstudy_count, created_by=created_by)
+        if is_auto:
+            # 新快照还没有写入数据库，已有的自动快照只保留 AUTO_SNAPSHOT_KEEP - 1 个
+            expired = [id_ for (id_,) in db.session.query(ScheduleSnapshot.id)
+                       .filter(ScheduleSnapshot.is_auto.is_(True))
+                       .order_by(ScheduleSnapshot.id.desc()).offset(AUTO_SNAPSHOT_KEEP - 1)]
+            if expired:
+                ScheduleSnapshot.query.filter(ScheduleSnapshot.id.in_(expired)).delete(synchronize_session=False)
+        db.session.add(snapshot)
+    return snapshot
+
+
+def take_snapshot(name: str, is_auto: bool = False, created_by: Optional[str] = None) -> ScheduleSnapshot:
+    """
+    保存当前课表的快照并提交
+
+    Args:
+        name: 快照名称
+        is_auto: 是否为自动快照（超过保留数量时自动删除最早的）
+        created_by: 创建人
+
+    Returns:
+        ScheduleSnapshot: 新建的快照
+    """
+    snapshot = _add_snapshot(name, is_auto, created_by)
+    db.session.commit()
+    return snapshot
+
+
+def auto_snapshot(label: str, created_by: Optional[str] = None) -> ScheduleSnapshot:
+    """
+    在整体覆盖课表的写入之前保存自动快照：快照只加入当前事务，与随后的写入一起提交，写入回滚时快照也不保留
+
+    Args:
+        label: 操作说明，如"自动排课前"
+        created_by: 创建人，默认为当前登录用户
+
+    Returns:
+        ScheduleSnapshot: 新建的快照（提交后才有ID）
+    """
+    if created_by is None and has_request_context() and current_user.is_authenticated:
+        created_by = current_user.username
+    return _add_snapshot(f'{label}自动备份', True, created_by)
+
+
+def restore_snapshot(snapshot: ScheduleSnapshot, include_selfstudy: bool = True) -> Dict[str, int]:
+    """
+    用快照整体替换当前课表：在一个事务中批量删除后批量插入
+
+    Args:
+        snapshot: 要恢复的快照
+        include_selfstudy: 是否同时恢复早晚自习
+
+    Returns:
+        Dict[str, int]: 恢复的正课和早晚自习节数，以及因班级、学科、教师或自习计划已删除而跳过的节数
+
+    Raises:
+        IntegrityError: 写入违反数据库约束（已回滚）
+    """
+    try:
+        result = replace_content(unpack(snapshot.data), include_selfstudy)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+
+def replace_content(content: Dict, include_selfstudy: bool = True) -> Dict[str, int]:
+    """
+    在当前事务中用解包后的快照内容替换课表（批量删除后批量插入），由调用方提交
+
+    Args:
+        content: unpack() 或 current_content() 的结果
+        include_selfstudy: 是否同时替换早晚自习
+
+    Returns:
+        Dict[str, int]: 写入的正课和早晚自习节数，以及跳过的节数 skipped
+        （快照中的班级、学科、教师或自习计划已被删除；已删除的合班只清除合班ID）
+    """
+    def existing(column):
+        return {id_ for (id_,) in db.session.query(column)}
+
+    class_ids, subject_ids, teacher_ids = existing(Class.id), existing(Subject.id), existing(Teacher.id)
+    combination_ids = existing(ClassCombination.id)
+
+    lessons = [
+        {
+            'class_id': class_id or None,
+            'subject_id': subject_id or None,
+            'teacher_id': teacher_id or None,
+            'day_of_week': slot // 100,
+            'period': slot % 100,
+            'combination_id': combination_id if combination_id in combination_ids else None,
+            'is_combined': bool(flags & 1),
+            'week_type': WEEK_TYPES[(flags >> 1) & 3]
+        }
+        for class_id, subject_id, teacher_id, slot, combination_id, flags in content['regular']
+        if (not class_id or class_id in class_ids) and (not subject_id or subject_id in subject_ids)
+        and (not teacher_id or teacher_id in teacher_ids)
+    ]
+    skipped = len(content['regular']) - len(lessons)
+    Schedule.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(Schedule, lessons)
+
+    restored_selfstudy = 0
+    if include_selfstudy:
+        plan_ids = existing(SelfStudyPlan.id)
+        SelfStudySchedule.query.delete(synchronize_session=False)
+        mappings = []
+        for class_id, day, period_index, plan_id, common_index in content['selfstudy']:
+            if (class_id and class_id not in class_ids) or (plan_id and plan_id not in plan_ids):
+                skipped += 1
+                continue
+            mapping = {
+                'class_id': class_id or None,
+                'day': day,
+                'period': content['periods'][period_index],
+                'plan_id': plan_id or None,
+                'is_common_course': bool(common_index)
+            }
+            if common_index:
+                title, desc, apply_all = content['common'][common_index - 1]
+                mapping.update(common_course_title=title, common_course_desc=desc,
+                               apply_to_all_classes=apply_all)
+            mappings.append(mapping)
+        db.session.bulk_insert_mappings(SelfStudySchedule, mappings)
+        restored_selfstudy = len(mappings)
+
+    return {'lessons': len(lessons), 'selfstudy': restored_selfstudy, 'skipped': skipped}
+
+
+def _lesson_map(content: Dict) -> Dict[Tuple[int, int, int], Tuple[int, int]]:
+    """(班级ID, 时间段, 单双周) -> (学科ID, 教师ID)"""
+    return {
+        (class_id, slot, (flags >> 1) & 3): (subject_id, teacher_id)
+        for class_id, subject_id, teacher_id, slot, _, flags in content['regular']
+    }
+
+
+def _selfstudy_map(content: Dict) -> Dict[Tuple[int, int, str], int]:
+    """(班级ID, 星期, 时段名称) -> 自习计划ID（公共课程为负的下标）"""
+    return {
+        (class_id, day, content['periods'][period_index]): plan_id or -common_index
+        for class_id, day, period_index, plan_id, common_index in content['selfstudy']
+    }
+
+
+def diff_snapshots(old: Dict, new: Dict) -> Dict:
+    """
+    比较两份解包后的快照，按班级和教师列出变化
+
+    Returns:
+        Dict: {'classes': 班级ID -> 变化列表, 'teachers': 教师ID -> 变化列表,
+               'selfstudy_classes': 班级ID -> 早晚自习变化数, 'summary': 汇总}
+    """
+    old_lessons, new_lessons = _lesson_map(old), _lesson_map(new)
+    subjects = {s.id: s.name for s in reference_cache.get_subjects()}
+    teachers = {t.id: t.name for t in reference_cache.get_teachers()}
+
+    def describe(lesson):
+        if lesson is None:
+            return None
+        subject_id, teacher_id = lesson
+        return {'subject_id': subject_id, 'subject': subjects.get(subject_id),
+                'teacher_id': teacher_id, 'teacher': teachers.get(teacher_id)}
+
+    by_class = defaultdict(list)
+    by_teacher = defaultdict(list)
+    for key in old_lessons.keys() | new_lessons.keys():
+        before, after = old_lessons.get(key), new_lessons.get(key)
+        if before == after:
+            continue
+        class_id, slot, week_type = key
+        change = {'class_id': class_id, 'day': slot // 100, 'period': slot % 100,
+                  'week_type': WEEK_TYPES[week_type], 'before': describe(before), 'after': describe(after)}
+        by_class[class_id].append(change)
+        for teacher_id in {lesson[1] for lesson in (before, after) if lesson and lesson[1]}:
+            by_teacher[teacher_id].append(change)
+
+    for changes in list(by_class.values()) + list(by_teacher.values()):
+        changes.sort(key=lambda c: (c['day'], c['period'], c['class_id']))
+
+    old_selfstudy, new_selfstudy = _selfstudy_map(old), _selfstudy_map(new)
+    selfstudy_classes = defaultdict(int)
+    for key in old_selfstudy.keys() | new_selfstudy.keys():
+        if old_selfstudy.get(key) != new_selfstudy.get(key):
+            selfstudy_classes[key[0]] += 1
+
+    return {
+        'classes': dict(by_class),
+        'teachers': dict(by_teacher),
+        'selfstudy_classes': dict(selfstudy_classes),
+        'summary': {
+            'changed_lessons': sum(len(changes) for changes in by_class.values()),
+            'changed_classes': len(by_class),
+            'changed_teachers': len(by_teacher),
+            'changed_selfstudy': sum(selfstudy_classes.values())
+        }
+    }
+
+
+def current_content() -> Dict:
+    """当前课表（与解包后的快照格式相同），用于与快照比较"""
+    return unpack(pack_current()[0])
+
+
+def lesson_rows(content: Dict) -> List[Tuple[int, int, int, int, int]]:
+    """快照中的正课，转换为课表评分使用的 (班级ID, 学科ID, 教师ID, 星期, 节次) 格式"""
+    return [(class_id, subject_id, teacher_id, slot // 100, slot % 100)
+            for class_id, subject_id, teacher_id, slot, _, _ in content['regular']]
+
+
+def init_snapshots(app):
+    """为 AUTO_SNAPSHOT_ENDPOINTS 中的接口登记待创建的自动快照，在请求第一次删除或批量修改课表时创建"""
+
+    @app.before_request
+    def arm_auto_snapshot():
+        label = AUTO_SNAPSHOT_ENDPOINTS.get(request.endpoint)
+        if label and request.method == 'POST' and current_user.is_authenticated and current_user.role == 'admin':
+            g.auto_snapshot_label = label
+
+
+# ---------------------------------------------------------------------------
+# 登记了待创建快照的请求，在第一次删除或批量修改正课、早晚自习之前创建快照
+# ---------------------------------------------------------------------------
+
+def _take_armed_snapshot(session):
+    if session.info.get('sandbox') or not has_request_context():
+        return
+    # 先取出标记，创建快照时执行的查询不会再次触发
+    label = g.pop('auto_snapshot_label', None)
+    if label:
+        auto_snapshot(label)
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_before_delete(session, flush_context, instances):
+    if any(isinstance(instance, (Schedule, SelfStudySchedule)) for instance in session.deleted):
+        _take_armed_snapshot(session)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _snapshot_before_bulk_write(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Schedule, SelfStudySchedule):
+            _take_armed_snapshot(orm_execute_state.session)
+
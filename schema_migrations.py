@@ -0,0 +1,245 @@
+"""
+数据库结构迁移
+按版本号顺序执行迁移，已执行的版本记录在 schema_version 表中；每个迁移本身也会先检查
+表、列、索引是否已存在，因此重复执行或在中途失败后重新执行都是安全的。
+取代 db_migration.py、fix_database.py、migrate_*.py 等直接打开数据库文件的一次性脚本
+
+另外提供 EXPLAIN QUERY PLAN 检查：列出的高频查询如果在SQLite上退化为全表扫描则检查失败
+
+用法:
+    flask upgrade-db            执行所有未执行的迁移
+    flask check-query-plans     检查高频查询的执行计划
+"""
+
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import click
+import sqlalchemy as sa
+from flask.cli import with_appcontext
+
+from database import db
+import models  # 确保所有模型都已注册到 db.metadata
+from timetable_constraints import default_fixed_day
+
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+
+def _create_missing_tables(connection):
+    """创建数据库中缺失的数据表（已存在的表不受影响）"""
+    db.metadata.create_all(bind=connection, checkfirst=True)
+
+
+def _add_missing_columns(connection):
+    """为旧版本数据库补充模型中新增的列，如 subject.is_major、schedule.week_type 等"""
+    inspector = sa.inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            ddl = (f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN '
+                   f'{preparer.format_column(column)} {column.type.compile(dialect=connection.dialect)}')
+            # 新增列一律允许为空；有固定默认值的列同时设置数据库默认值，保证已有数据可用
+            if column.default is not None and column.default.is_scalar:
+                default = sa.literal(column.default.arg, type_=column.type).compile(
+                    dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+                ddl += f' DEFAULT {default}'
+            connection.execute(sa.text(ddl))
+
+
+# 高频查询依赖的索引（定义见 models.py 中各模型的 __table_args__）
+HOT_PATH_INDEXES = [
+    'idx_schedule_class_subject_teacher',
+    'idx_class_day_period',
+    'idx_teacher_day_period',
+    'idx_selfstudy_class_day_period',
+    'idx_selfstudy_plan',
+    'idx_selfstudy_plan_teacher',
+    'idx_selfstudy_plan_class_subject',
+    'idx_arrangement_original_dates',
+    'idx_arrangement_substitute',
+    'idx_arrangement_dates',
+    'idx_temp_sub_date_period',
+    'idx_temp_sub_original_date',
+    'idx_temp_sub_substitute_date',
+    'idx_non_routine_date_period',
+    'idx_non_routine_original_date',
+    'idx_non_routine_substitute_date',
+]
+
+# 授课计划的复合索引（迁移3遗漏了这些索引，由迁移6补充）
+TEACHING_PLAN_INDEXES = [
+    'idx_class_subject',
+    'idx_teacher_class',
+    'idx_class_teacher_subject',
+]
+
+
+def _create_indexes(connection, names: List[str]):
+    """按名称创建模型中定义的索引，已存在的索引跳过"""
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(bind=connection, checkfirst=True)
+
+
+def _create_hot_path_indexes(connection):
+    """为高频查询创建复合索引（旧数据库建表时模型中还没有这些索引）"""
+    _create_indexes(connection, HOT_PATH_INDEXES)
+
+
+def _create_teaching_plan_indexes(connection):
+    """为授课计划的按班级、教师查询创建复合索引"""
+    _create_indexes(connection, TEACHING_PLAN_INDEXES)
+
+
+def _create_snapshot_table(connection):
+    """创建课表快照表"""
+    models.ScheduleSnapshot.__table__.create(bind=connection, checkfirst=True)
+
+
+def _add_subject_fixed_day(connection):
+    """添加 subject.fixed_day 列，并按以前的命名约定为带"1"后缀的科目（篮球1、足球1除外）设置为周六"""
+    _add_missing_columns(connection)
+    subjects = connection.execute(sa.text('SELECT id, name FROM subject WHERE fixed_day IS NULL')).all()
+    updates = [{'id': id_, 'fixed_day': default_fixed_day(name)} for id_, name in subjects if default_fixed_day(name)]
+    if updates:
+        connection.execute(sa.text('UPDATE subject SET fixed_day = :fixed_day WHERE id = :id'), updates)
+
+
+# 迁移列表：(版本号, 说明, 迁移函数)，只能在末尾追加，已发布的版本不能修改
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, '创建缺失的数据表', _create_missing_tables),
+    (2, '补充旧版本数据库缺失的列', _add_missing_columns),
+    (3, '为课表、早晚自习和代课的高频查询添加复合索引', _create_hot_path_indexes),
+    (4, '创建课表快照表', _create_snapshot_table),
+    (5, '为学科添加固定排课日（原带"1"后缀的周六科目）', _add_subject_fixed_day),
+    (6, '为授课计划添加复合索引', _create_teaching_plan_indexes),
+]
+
+
+def _ensure_version_table(connection):
+    connection.execute(sa.text(
+        f'CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)'
+    ))
+
+
+def current_version(engine=None) -> int:
+    """
+    获取数据库当前的结构版本
+
+    Returns:
+        int: 已执行的最大版本号，从未执行过迁移时为0
+    """
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+        version = connection.execute(sa.text(f'SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}')).scalar()
+    return version or 0
+
+
+def upgrade(engine=None, target: int = None) -> List[Tuple[int, str]]:
+    """
+    按顺序执行未执行的迁移，每个迁移及其版本记录在同一个事务中提交
+
+    Args:
+        engine: 数据库引擎，默认为当前应用的引擎
+        target: 升级到的版本号，默认为最新版本
+
+    Returns:
+        List[Tuple[int, str]]: 本次执行的迁移（版本号, 说明）
+    """
+    engine = engine or db.engine
+    applied = []
+    version = current_version(engine)
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version or (target is not None and migration_version > target):
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(
+                sa.text(f'INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) '
+                        'VALUES (:version, :description, :applied_at)'),
+                {'version': migration_version, 'description': description, 'applied_at': datetime.now()}
+            )
+        applied.append((migration_version, description))
+    return applied
+
+
+# 需要走索引的高频查询：(说明, SQL)，参数值不影响执行计划
+HOT_QUERIES: List[Tuple[str, str]] = [
+    ('班级学科教师已排课时数', 'SELECT COUNT(*) FROM schedule WHERE class_id = 1 AND subject_id = 1 AND teacher_id = 1'),
+    ('班级课表', 'SELECT * FROM schedule WHERE class_id = 1'),
+    ('教师某天课表', 'SELECT * FROM schedule WHERE teacher_id = 1 AND day_of_week = 1'),
+    ('班级早晚自习时段', "SELECT * FROM self_study_schedule WHERE class_id = 1 AND day = 1 AND period = '早读1'"),
+    ('早晚自习计划的已排课程', 'SELECT * FROM self_study_schedule WHERE plan_id = 1'),
+    ('教师的早晚自习计划', 'SELECT * FROM self_study_plan WHERE teacher_id = 1'),
+    ('班级学科的早晚自习计划', 'SELECT * FROM self_study_plan WHERE class_id = 1 AND subject_id = 1'),
+    ('班级学科的授课计划', 'SELECT * FROM teaching_plan WHERE class_id = 1 AND subject_id = 1'),
+    ('教师的授课计划', 'SELECT * FROM teaching_plan WHERE teacher_id = 1'),
+    ('某日的临时代课', "SELECT * FROM temporary_substitution WHERE date = '2024-01-01'"),
+    ('原任课教师的临时代课',
+     "SELECT * FROM temporary_substitution WHERE original_teacher_id = 1 AND date BETWEEN '2024-01-01' AND '2024-01-07'"),
+    ('代课教师的临时代课', "SELECT * FROM temporary_substitution WHERE substitute_teacher_id = 1 AND date >= '2024-01-01'"),
+    ('某日的常规代课', "SELECT * FROM non_routine_substitution WHERE date = '2024-01-01'"),
+    ('原任课教师的常规代课', "SELECT * FROM non_routine_substitution WHERE original_teacher_id = 1 AND date = '2024-01-01'"),
+    ('代课教师的常规代课', "SELECT * FROM non_routine_substitution WHERE substitute_teacher_id = 1 AND date = '2024-01-01'"),
+    ('教师当前的代课安排',
+     "SELECT * FROM substitution_arrangement WHERE original_teacher_id = 1 "
+     "AND start_date <= '2024-01-01' AND end_date >= '2024-01-01'"),
+    ('代课教师的代课安排', 'SELECT * FROM substitution_arrangement WHERE substitute_teacher_id = 1'),
+    ('某日生效的代课安排', "SELECT * FROM substitution_arrangement WHERE start_date <= '2024-01-01' AND end_date >= '2024-01-01'"),
+]
+
+
+def check_query_plans(engine=None) -> Dict[str, List[str]]:
+    """
+    用 EXPLAIN QUERY PLAN 检查高频查询，找出退化为全表扫描的查询（仅SQLite）
+
+    Returns:
+        Dict[str, List[str]]: 查询说明 -> 全表扫描的执行计划步骤，所有查询都走索引时为空字典
+    """
+    engine = engine or db.engine
+    if engine.dialect.name != 'sqlite':
+        raise RuntimeError('执行计划检查只支持SQLite数据库')
+
+    failures = {}
+    with engine.connect() as connection:
+        for name, sql in HOT_QUERIES:
+            details = [row[-1] for row in connection.execute(sa.text(f'EXPLAIN QUERY PLAN {sql}'))]
+            # "SCAN 表名" 为全表扫描；"SCAN 表名 USING [COVERING] INDEX" 和 "SEARCH" 都会走索引
+            scans = [detail for detail in details if detail.startswith('SCAN') and 'USING' not in detail]
+            if scans:
+                failures[name] = scans
+    return failures
+
+
+@click.command('upgrade-db')
+@click.option('--target', type=int, default=None, help='升级到的版本号，默认为最新版本')
+@with_appcontext
+def upgrade_db_command(target):
+    """执行未执行的数据库结构迁移"""
+    before = current_version()
+    applied = upgrade(target=target)
+    for version, description in applied:
+        print(f'已执行迁移 {version}: {description}')
+    print(f'数据库结构版本: {before} -> {current_version()}')
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """检查高频查询是否走索引，存在全表扫描时以非零状态退出"""
+    failures = check_query_plans()
+    for name, scans in failures.items():
+        print(f'[全表扫描] {name}: {"; ".join(scans)}')
+    if failures:
+        raise SystemExit(1)
+    print(f'全部 {len(HOT_QUERIES)} 个高频查询都使用了索引')
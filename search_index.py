@@ -0,0 +1,188 @@
+"""
+教师、班级、学科的输入联想搜索
+代课、授课计划和课表页面的下拉框以前把全部教师、班级塞进页面，几百个名字只能滚动查找。
+这里在内存中为它们建立搜索索引，页面只需按输入的内容请求 GET /api/search：
+
+- 匹配教师姓名、工号，班级名称、年级（如"初一"），学科名称
+- 支持前缀匹配、拼音首字母匹配（"zs" 匹配"张三"）和包含匹配，按 完全相同 > 前缀 > 拼音首字母 > 包含 排序
+- 索引由基础数据缓存（reference_cache）提供数据：新增、修改、导入教师/班级/学科提交后缓存失效，
+  下次搜索时重建索引；名称没有变化的记录直接复用上次计算的拼音，不重新计算
+
+安装 pypinyin 后使用它计算拼音（支持全部汉字，还可以用全拼搜索）；未安装时按GB2312编码顺序推算常用汉字的声母
+"""
+
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import reference_cache
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # pypinyin 为可选依赖，未安装时只支持常用汉字的拼音首字母
+    lazy_pinyin = None
+
+TYPES = ('teacher', 'class', 'subject')
+DEFAULT_LIMIT = 20
+
+# 匹配等级，数字越小越靠前
+EXACT, PREFIX, INITIALS, SUBSTRING = range(4)
+
+# GB2312 一级汉字按拼音排序，每个声母第一个汉字的编码
+_GB2312_INITIALS = [
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'), (0xB7A2, 'f'),
+    (0xB8C1, 'g'), (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'), (0xC0AC, 'l'), (0xC2E8, 'm'),
+    (0xC4C3, 'n'), (0xC5B6, 'o'), (0xC5BE, 'p'), (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'),
+    (0xCBFA, 't'), (0xCDDA, 'w'), (0xCEF4, 'x'), (0xD1B9, 'y'), (0xD4D1, 'z'),
+]
+_GB2312_CODES = [code for code, _ in _GB2312_INITIALS]
+_GB2312_LEVEL1_END = 0xD7F9
+
+Entry = namedtuple('Entry', ['type', 'id', 'label', 'detail', 'keys'])
+
+
+def _initial(char: str) -> str:
+    """单个字符的拼音首字母；字母数字原样返回（小写），无法推算的汉字返回空字符串"""
+    if char.isascii():
+        return char.lower() if char.isalnum() else ''
+    try:
+        encoded = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return ''
+    if len(encoded) != 2:
+        return ''
+    code = encoded[0] << 8 | encoded[1]
+    if code < _GB2312_CODES[0] or code > _GB2312_LEVEL1_END:
+        return ''
+    return _GB2312_INITIALS[bisect_left(_GB2312_CODES, code + 1) - 1][1]
+
+
+def pinyin_keys(text: str) -> Tuple[str, ...]:
+    """
+    文本的拼音搜索词：拼音首字母，安装 pypinyin 时还包括全拼
+
+    Returns:
+        Tuple[str, ...]: 小写的搜索词，文本中没有汉字时为空
+    """
+    if not text or text.isascii():
+        return ()
+    if lazy_pinyin is not None:
+        initials = ''.join(lazy_pinyin(text, style=Style.FIRST_LETTER)).lower()
+        full = ''.join(lazy_pinyin(text)).lower()
+        return tuple(dict.fromkeys(key for key in (initials, full) if key))
+    initials = ''.join(_initial(char) for char in text)
+    return (initials,) if initials else ()
+
+
+class SearchIndex:
+    """按基础数据缓存的内容建立的搜索索引，缓存的数据变化时重建"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = None
+        self._entries: Dict[Tuple[str, int], Entry] = {}
+        # (搜索词, 匹配等级, (类型, ID))，按搜索词排序，用二分查找做前缀匹配
+        self._terms: List[Tuple[str, int, Tuple[str, int]]] = []
+        self._pinyin: Dict[str, Tuple[str, ...]] = {}
+
+    def _build_entries(self, teachers, classes, subjects, pairs) -> List[Entry]:
+        # 年级名称只在建索引时需要，避免导入 app 时的循环引用
+        from app import grade_to_text
+
+        subject_names = {subject.id: subject.name for subject in subjects}
+        teacher_subjects: Dict[int, List[str]] = {}
+        for teacher_id, subject_id in pairs:
+            if subject_id in subject_names:
+                teacher_subjects.setdefault(teacher_id, []).append(subject_names[subject_id])
+
+        entries = []
+        for teacher in teachers:
+            detail = ' '.join([teacher.staff_id or ''] + teacher_subjects.get(teacher.id, [])).strip()
+            entries.append(Entry('teacher', teacher.id, teacher.name, detail,
+                                 tuple(key for key in (teacher.name, teacher.staff_id) if key)))
+        for class_ in classes:
+            grade = grade_to_text(class_.grade)
+            entries.append(Entry('class', class_.id, class_.name, grade, (class_.name, grade)))
+        for subject in subjects:
+            entries.append(Entry('subject', subject.id, subject.name, '主科' if subject.is_major else '',
+                                 (subject.name,)))
+        return entries
+
+    def refresh(self):
+        """基础数据缓存重新加载过时重建索引"""
+        sources = (reference_cache.get_teachers(), reference_cache.get_classes(), reference_cache.get_subjects(),
+                   reference_cache.get_teacher_subject_pairs())
+        current = self._sources
+        if current is not None and all(new is old for new, old in zip(sources, current)):
+            return
+
+        pinyin = {}
+        entries = {}
+        terms = []
+        for entry in self._build_entries(*sources):
+            ref = (entry.type, entry.id)
+            entries[ref] = entry
+            for key in entry.keys:
+                terms.append((key.lower(), PREFIX, ref))
+                if key not in pinyin:
+                    pinyin[key] = self._pinyin.get(key)
+                    if pinyin[key] is None:
+                        pinyin[key] = pinyin_keys(key)
+                terms.extend((term, INITIALS, ref) for term in pinyin[key])
+        terms.sort()
+
+        with self._lock:
+            self._entries, self._terms, self._pinyin, self._sources = entries, terms, pinyin, sources
+
+    def search(self, query: str, types: Optional[Iterable[str]] = None, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """
+        搜索教师、班级和学科
+
+        Args:
+            query: 输入的内容，不区分大小写
+            types: 只搜索这些类型（teacher/class/subject），默认全部
+            limit: 最多返回的条数
+
+        Returns:
+            List[Dict]: type、id、label（名称）、detail（工号和任教学科、年级或"主科"）、match（匹配方式）
+        """
+        self.refresh()
+        text = (query or '').strip().lower()
+        if not text:
+            return []
+        wanted = set(types or TYPES)
+        with self._lock:
+            entries, terms = self._entries, self._terms
+
+        ranks: Dict[Tuple[str, int], int] = {}
+        position = bisect_left(terms, (text,))
+        while position < len(terms) and terms[position][0].startswith(text):
+            term, rank, ref = terms[position]
+            position += 1
+            if ref[0] not in wanted:
+                continue
+            if rank == PREFIX and term == text:
+                rank = EXACT
+            if rank < ranks.get(ref, SUBSTRING + 1):
+                ranks[ref] = rank
+
+        if len(ranks) < limit:
+            for ref, entry in entries.items():
+                if ref not in ranks and ref[0] in wanted and any(text in key.lower() for key in entry.keys):
+                    ranks[ref] = SUBSTRING
+
+        matches = ('exact', 'prefix', 'pinyin', 'substring')
+        ordered = sorted(ranks.items(), key=lambda item: (item[1], len(entries[item[0]].label),
+                                                          entries[item[0]].label, item[0]))
+        return [{'type': entries[ref].type, 'id': entries[ref].id, 'label': entries[ref].label,
+                 'detail': entries[ref].detail, 'match': matches[rank]}
+                for ref, rank in ordered[:limit]]
+
+
+index = SearchIndex()
+
+
+def search(query: str, types: Optional[Iterable[str]] = None, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+    """在全局索引中搜索，见 SearchIndex.search"""
+    return index.search(query, types, limit)
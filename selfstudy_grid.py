@@ -0,0 +1,313 @@
+"""
+早晚自习编辑网格
+交互式编辑早晚自习时（查看可交换/可安排的单元格、添加、交换、禁排），原来的接口逐个单元格查询
+SelfStudySchedule、SelfStudyBlock 和计划，并按需加载 plan.subject / plan.teacher。
+这里每个请求先用固定数量的查询一次性载入：
+
+- 每个班级的网格：(星期, 时段) -> 单元格（常规自习、公共课程）
+- 禁排单元格
+- 教师值班索引：(教师ID, 星期, 时段) -> 班级ID，早读/晚修和与之同时的正课都登记在这个索引里，
+  判断教师冲突只需要一次字典查找
+
+之后的判断都在内存中完成，写入也使用批量语句，每个操作的查询次数与班级数、单元格数无关
+"""
+
+from collections import defaultdict, namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import db
+from models import Schedule, SelfStudyPlan, SelfStudySchedule, SelfStudyBlock
+import reference_cache
+
+
+# 早晚自习的时段名称
+SELFSTUDY_PERIODS = ('早读1', '晚修1')
+DAYS = range(1, 8)
+
+# 与正课同一时间的早晚自习时段：时段名称 -> 正课节次。例如晚修1与第9节是同一时间时配置为 {'晚修1': (9,)}，
+# 教师在这些节次有正课时也不能安排对应的早晚自习
+REGULAR_PERIOD_OVERLAPS: Dict[str, Tuple[int, ...]] = {}
+
+Cell = namedtuple('Cell', ['id', 'plan_id', 'teacher_id', 'subject_id', 'is_common_course',
+                           'common_course_title', 'apply_to_all_classes'])
+PlanInfo = namedtuple('PlanInfo', ['id', 'class_id', 'subject_id', 'teacher_id', 'total_hours'])
+
+
+class SelfStudyGrid:
+    """早晚自习网格、禁排和教师值班索引的内存副本"""
+
+    def __init__(self, cells, blocks, plans, regular_duties=()):
+        # (班级ID, 星期, 时段) -> Cell
+        self.cells: Dict[Tuple[int, int, str], Cell] = {}
+        # (星期, 时段) -> 全校公共课程标题（apply_to_all_classes）
+        self.common_all: Dict[Tuple[int, str], str] = {}
+        # 有任何公共课程的 (星期, 时段)
+        self.common_any = set()
+        # (教师ID, 星期, 时段) -> 班级ID
+        self.teacher_duties: Dict[Tuple[int, int, object], int] = {}
+        self.blocks = set(blocks)
+        self.plans: Dict[int, PlanInfo] = {plan.id: plan for plan in plans}
+        self.scheduled_hours = defaultdict(int)
+
+        for class_id, day, period, cell in cells:
+            self.cells[(class_id, day, period)] = cell
+            if cell.is_common_course:
+                self.common_any.add((day, period))
+                if cell.apply_to_all_classes:
+                    self.common_all.setdefault((day, period), cell.common_course_title)
+            elif cell.plan_id:
+                self.scheduled_hours[cell.plan_id] += 1
+            if cell.teacher_id:
+                self.teacher_duties[(cell.teacher_id, day, period)] = class_id
+
+        for teacher_id, day, period, class_id in regular_duties:
+            self.teacher_duties.setdefault((teacher_id, day, period), class_id)
+
+    @classmethod
+    def load(cls, class_ids: Optional[Iterable[int]] = None) -> 'SelfStudyGrid':
+        """
+        载入网格：全校的早晚自习（教师值班需要跨班级判断）、指定班级的禁排和计划
+
+        Args:
+            class_ids: 要编辑的班级，为空表示全部班级
+        """
+        class_ids = None if class_ids is None else set(class_ids)
+
+        cells = [
+            (class_id, day, period, Cell(id_, plan_id, teacher_id, subject_id, bool(is_common), title, bool(apply_all)))
+            for id_, class_id, day, period, plan_id, is_common, title, apply_all, teacher_id, subject_id
+            in db.session.query(
+                SelfStudySchedule.id, SelfStudySchedule.class_id, SelfStudySchedule.day, SelfStudySchedule.period,
+                SelfStudySchedule.plan_id, SelfStudySchedule.is_common_course, SelfStudySchedule.common_course_title,
+                SelfStudySchedule.apply_to_all_classes, SelfStudyPlan.teacher_id, SelfStudyPlan.subject_id
+            ).outerjoin(SelfStudyPlan, SelfStudySchedule.plan_id == SelfStudyPlan.id)
+        ]
+
+        block_query = db.session.query(SelfStudyBlock.class_id, SelfStudyBlock.day, SelfStudyBlock.period)
+        plan_query = db.session.query(SelfStudyPlan.id, SelfStudyPlan.class_id, SelfStudyPlan.subject_id,
+                                      SelfStudyPlan.teacher_id, SelfStudyPlan.hours_per_week, SelfStudyPlan.extra_hours)
+        if class_ids is not None:
+            block_query = block_query.filter(SelfStudyBlock.class_id.in_(class_ids))
+            plan_query = plan_query.filter(SelfStudyPlan.class_id.in_(class_ids))
+        plans = [PlanInfo(id_, class_id, subject_id, teacher_id, (hours or 0) + (extra or 0))
+                 for id_, class_id, subject_id, teacher_id, hours, extra in plan_query]
+
+        regular_duties = []
+        regular_periods = {period: label for label, periods in REGULAR_PERIOD_OVERLAPS.items() for period in periods}
+        if regular_periods:
+            for teacher_id, day, period, class_id in db.session.query(
+                    Schedule.teacher_id, Schedule.day_of_week, Schedule.period, Schedule.class_id
+            ).filter(Schedule.period.in_(regular_periods), Schedule.teacher_id.isnot(None)):
+                regular_duties.append((teacher_id, day, regular_periods[period], class_id))
+
+        return cls(cells, block_query.all(), plans, regular_duties)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def cell(self, class_id: int, day: int, period: str) -> Optional[Cell]:
+        return self.cells.get((class_id, day, period))
+
+    def is_blocked(self, class_id: int, day: int, period: str) -> bool:
+        return (class_id, day, period) in self.blocks
+
+    def teacher_conflict(self, teacher_id: Optional[int], day: int, period: str, class_id: int) -> Optional[int]:
+        """教师在该时段是否已在其他班级值班（含同时的正课），返回冲突的班级ID"""
+        if not teacher_id:
+            return None
+        other = self.teacher_duties.get((teacher_id, day, period))
+        return other if other is not None and other != class_id else None
+
+    def plan_hours(self, plan_id: int) -> Tuple[int, int]:
+        """(已排课时, 计划课时)"""
+        plan = self.plans.get(plan_id)
+        return self.scheduled_hours.get(plan_id, 0), plan.total_hours if plan else 0
+
+    def describe(self, cell: Optional[Cell]) -> Dict:
+        """单元格的学科和教师名称（从基础数据缓存读取，不触发按需加载）"""
+        if cell is None or not cell.plan_id:
+            return {'has_subject': False}
+        subjects = {subject.id: subject.name for subject in reference_cache.get_subjects()}
+        teachers = {teacher.id: teacher.name for teacher in reference_cache.get_teachers()}
+        return {
+            'has_subject': True,
+            'subject': subjects.get(cell.subject_id, '未知学科'),
+            'teacher': teachers.get(cell.teacher_id, '未知教师')
+        }
+
+    def describe_plan(self, plan_id: int) -> Dict:
+        """计划的学科、教师名称和已排/计划课时"""
+        plan = self.plans[plan_id]
+        scheduled, total = self.plan_hours(plan_id)
+        info = self.describe(Cell(None, plan_id, plan.teacher_id, plan.subject_id, False, None, False))
+        return {'plan_id': plan_id, 'subject': info['subject'], 'teacher': info['teacher'],
+                'scheduled_count': scheduled, 'total_hours': total}
+
+    def class_grid(self, class_id: int) -> Dict:
+        """班级的完整网格，供编辑页面一次性渲染"""
+        subjects = {subject.id: subject.name for subject in reference_cache.get_subjects()}
+        teachers = {teacher.id: teacher.name for teacher in reference_cache.get_teachers()}
+        grid = {}
+        for day in DAYS:
+            for period in SELFSTUDY_PERIODS:
+                cell = self.cell(class_id, day, period)
+                entry = {'blocked': self.is_blocked(class_id, day, period)}
+                if cell and cell.is_common_course:
+                    entry.update(is_common_course=True, title=cell.common_course_title)
+                elif cell and cell.plan_id:
+                    entry.update(plan_id=cell.plan_id, subject=subjects.get(cell.subject_id),
+                                 teacher=teachers.get(cell.teacher_id))
+                elif (day, period) in self.common_all:
+                    entry.update(is_common_course=True, title=self.common_all[(day, period)])
+                grid[f'{day}-{period}'] = entry
+        return grid
+
+    def available_slots(self, class_id: int, plan: PlanInfo) -> List[Dict]:
+        """计划还可以安排的单元格：本班为空、未禁排、不是全校公共活动、教师在其他班级没有值班"""
+        return [
+            {'day': day, 'period': period}
+            for day in DAYS for period in SELFSTUDY_PERIODS
+            if (class_id, day, period) not in self.cells
+            and not self.is_blocked(class_id, day, period)
+            and (day, period) not in self.common_all
+            and self.teacher_conflict(plan.teacher_id, day, period, class_id) is None
+        ]
+
+    def swappable_slots(self, class_id: int, source_day: int, period: str, source: Cell) -> List[Dict]:
+        """与源单元格同一时段的其他日期中，可以交换（或移动到）的单元格"""
+        slots = []
+        for day in DAYS:
+            if day == source_day or self.is_blocked(class_id, day, period) or (day, period) in self.common_any:
+                continue
+            if self.teacher_conflict(source.teacher_id, day, period, class_id) is not None:
+                continue
+            target = self.cell(class_id, day, period)
+            if target and target.plan_id and \
+                    self.teacher_conflict(target.teacher_id, source_day, period, class_id) is not None:
+                continue
+            slots.append({'day': day, 'period': period, 'conflict_level': 0, **self.describe(target)})
+        return slots
+
+
+def add_lesson(grid: SelfStudyGrid, class_id: int, plan_id: int, day: int, period: str) -> Tuple[bool, str, Dict]:
+    """
+    在空单元格中安排早晚自习
+
+    Returns:
+        Tuple[bool, str, Dict]: (是否成功, 说明, 返回给前端的附加数据)
+    """
+    plan = grid.plans.get(plan_id)
+    if not plan or plan.class_id != class_id:
+        return False, '授课计划与班级不匹配!', {}
+
+    existing = grid.cell(class_id, day, period)
+    if existing:
+        if existing.is_common_course:
+            return False, f'该时段已安排公共活动: {existing.common_course_title}', {}
+        return False, '该时段已有早晚自习安排!', {}
+    if grid.is_blocked(class_id, day, period):
+        return False, '该时段已禁排!', {}
+    if (day, period) in grid.common_all:
+        return False, f'该时段已设置为全校公共活动 "{grid.common_all[(day, period)]}"!', {}
+
+    conflict_class_id = grid.teacher_conflict(plan.teacher_id, day, period, class_id)
+    if conflict_class_id is not None:
+        names = {item.id: item.name for item in reference_cache.get_classes()}
+        teachers = {teacher.id: teacher.name for teacher in reference_cache.get_teachers()}
+        return False, (f'教师 {teachers.get(plan.teacher_id)} 在该时段已在班级 {names.get(conflict_class_id)} '
+                       f'有早晚自习安排!'), {}
+
+    info = grid.describe_plan(plan_id)
+    if info['scheduled_count'] >= info['total_hours']:
+        return False, f'{info["subject"]} 的计划课时已满!', {}
+
+    lesson = SelfStudySchedule(class_id=class_id, plan_id=plan_id, day=day, period=period, is_common_course=False)
+    db.session.add(lesson)
+    db.session.commit()
+    return True, '添加早晚自习成功!', {
+        'subject_name': info['subject'],
+        'teacher_name': info['teacher'],
+        'scheduled_count': info['scheduled_count'] + 1,
+        'total_hours': info['total_hours'],
+        'schedule_id': lesson.id
+    }
+
+
+def swap_lesson(grid: SelfStudyGrid, class_id: int, source_day: int, source_period: str,
+                target_day: int, target_period: str) -> Tuple[bool, str, Dict]:
+    """交换两个单元格的早晚自习，目标单元格为空时移动"""
+    source = grid.cell(class_id, source_day, source_period)
+    if not source or source.is_common_course or not source.plan_id:
+        return False, '源单元格没有有效的课程!', {}
+    if grid.is_blocked(class_id, target_day, target_period):
+        return False, '目标单元格已被禁排!', {}
+
+    target = grid.cell(class_id, target_day, target_period)
+    if target and target.is_common_course:
+        return False, '不能与公共课程交换!', {}
+
+    names = {item.id: item.name for item in reference_cache.get_classes()}
+    conflict_class_id = grid.teacher_conflict(source.teacher_id, target_day, target_period, class_id)
+    if conflict_class_id is not None:
+        return False, (f'教师冲突: 源课程教师在目标时段已有其他班级（{names.get(conflict_class_id, "未知班级")}）'
+                       f'的课程安排!'), {}
+    if target and target.plan_id:
+        conflict_class_id = grid.teacher_conflict(target.teacher_id, source_day, source_period, class_id)
+        if conflict_class_id is not None:
+            return False, (f'教师冲突: 目标课程教师在源时段已有其他班级（{names.get(conflict_class_id, "未知班级")}）'
+                           f'的课程安排!'), {}
+
+    if target and target.plan_id:
+        SelfStudySchedule.query.filter_by(id=source.id).update({'plan_id': target.plan_id}, synchronize_session=False)
+        SelfStudySchedule.query.filter_by(id=target.id).update({'plan_id': source.plan_id}, synchronize_session=False)
+        moved_source, moved_target = target, source
+    elif target:
+        SelfStudySchedule.query.filter_by(id=target.id).update(
+            {'plan_id': source.plan_id, 'is_common_course': False}, synchronize_session=False)
+        SelfStudySchedule.query.filter_by(id=source.id).delete(synchronize_session=False)
+        moved_source, moved_target = None, source
+    else:
+        SelfStudySchedule.query.filter_by(id=source.id).update(
+            {'day': target_day, 'period': target_period}, synchronize_session=False)
+        moved_source, moved_target = None, source
+    db.session.commit()
+
+    return True, '课程交换成功!', {
+        'source': grid.describe(moved_source) if moved_source else {},
+        'target': grid.describe(moved_target)
+    }
+
+
+def toggle_block(grid: SelfStudyGrid, class_ids: List[int], day: int, period: str, block: bool,
+                 keep_common: bool) -> int:
+    """
+    为指定班级设置或取消禁排；设置禁排时删除这些单元格中的早晚自习
+
+    Args:
+        keep_common: 是否保留公共课程（全校禁排时保留）
+
+    Returns:
+        int: 发生变化的班级数
+    """
+    if block:
+        targets = [class_id for class_id in class_ids if not grid.is_blocked(class_id, day, period)]
+        if targets:
+            db.session.bulk_insert_mappings(SelfStudyBlock, [
+                {'class_id': class_id, 'day': day, 'period': period} for class_id in targets])
+            query = SelfStudySchedule.query.filter(
+                SelfStudySchedule.class_id.in_(targets), SelfStudySchedule.day == day,
+                SelfStudySchedule.period == period)
+            if keep_common:
+                query = query.filter(db.or_(SelfStudySchedule.is_common_course.is_(False),
+                                            SelfStudySchedule.is_common_course.is_(None)))
+            query.delete(synchronize_session=False)
+    else:
+        targets = [class_id for class_id in class_ids if grid.is_blocked(class_id, day, period)]
+        if targets:
+            SelfStudyBlock.query.filter(
+                SelfStudyBlock.class_id.in_(targets), SelfStudyBlock.day == day, SelfStudyBlock.period == period
+            ).delete(synchronize_session=False)
+
+    db.session.commit()
+    return len(targets)
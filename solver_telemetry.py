@@ -0,0 +1,148 @@
+"""
+自动排课的分阶段计时和计数
+自动排课慢的时候，需要知道时间花在了哪一步：读取数据、周六科目、合班课、主科上午、其余课程还是写回数据库。
+SolverTelemetry 记录每个阶段的耗时和求解过程中的计数（评估的候选时段、被各类约束排除的时段、
+无处可排的次数、主科上午排不下改排下午的次数、数据库语句数），随排课结果一起返回，并写入日志。
+
+需要进一步分析时，profile_run() 可以对一次排课做性能剖析并保存结果文件：
+cProfile（标准库，.prof 文件，可用 snakeviz 等工具查看）或 pyinstrument（需另外安装，.html 文件）
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import event
+
+logger = logging.getLogger('timetable_solver')
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+class SolverTelemetry:
+    """
+    一次排课的分阶段耗时（秒）和计数
+
+    Attributes:
+        phases: 阶段名称 -> 累计耗时（按第一次进入的顺序）
+        counters: 计数名称 -> 次数
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.counters = Counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录代码块的耗时，同一阶段多次进入时累加"""
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    @contextmanager
+    def statements(self, engine, name: str = 'db_statements'):
+        """统计代码块中当前线程在 engine 上执行的SQL语句数"""
+        thread_id = threading.get_ident()
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if threading.get_ident() == thread_id:
+                self.counters[name] += 1
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield self
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    def merge(self, other):
+        """合并另一次（如并行求解的一个子问题）的记录，other 可以是 SolverTelemetry 或 to_dict() 的结果"""
+        if isinstance(other, dict):
+            other = SolverTelemetry.from_dict(other)
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.counters.update(other.counters)
+        return self
+
+    def to_dict(self) -> Dict:
+        """可以JSON序列化的记录，耗时单位为毫秒"""
+        return {
+            'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            'total_ms': round(sum(self.phases.values()) * 1000, 1),
+            'counters': dict(self.counters)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SolverTelemetry':
+        telemetry = cls()
+        telemetry.phases = {name: ms / 1000 for name, ms in data.get('phases_ms', {}).items()}
+        telemetry.counters.update(data.get('counters', {}))
+        return telemetry
+
+    def log(self, title: str, level: int = logging.INFO):
+        """写一条汇总日志，完整记录放在日志记录的 telemetry 属性中，便于结构化日志处理"""
+        if not logger.isEnabledFor(level):
+            return
+        phases = ', '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in self.phases.items())
+        counters = ', '.join(f'{name}={value}' for name, value in sorted(self.counters.items()))
+        logger.log(level, '%s：%s；%s', title, phases or '-', counters or '-', extra={'telemetry': self.to_dict()})
+
+
+@contextmanager
+def profile_run(directory: str, profiler: str = 'cprofile', name: str = 'solve'):
+    """
+    对代码块做性能剖析，结束后把结果保存到 directory 中
+
+    Args:
+        directory: 保存目录，不存在时自动创建
+        profiler: cprofile 或 pyinstrument
+        name: 文件名前缀
+
+    Yields:
+        Dict: 结束后其中的 'path' 为保存的文件路径
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f'不支持的性能剖析工具: {profiler}')
+
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    result = {}
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        instrument = Profiler()
+        instrument.start()
+        try:
+            yield result
+        finally:
+            instrument.stop()
+            result['path'] = os.path.join(directory, f'{name}-{stamp}.html')
+            with open(result['path'], 'w', encoding='utf-8') as f:
+                f.write(instrument.output_html())
+    else:
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield result
+        finally:
+            profile.disable()
+            result['path'] = os.path.join(directory, f'{name}-{stamp}.prof')
+            profile.dump_stats(result['path'])
+    logger.info('性能剖析结果已保存到 %s', result['path'])
+
+
+def profile_directory(app) -> str:
+    """性能剖析结果的保存目录：配置项 SOLVER_PROFILE_DIR，相对路径相对于应用的 instance 目录"""
+    directory = app.config.get('SOLVER_PROFILE_DIR') or 'profiles'
+    return directory if os.path.isabs(directory) else os.path.join(app.instance_path, directory)
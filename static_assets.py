@@ -0,0 +1,173 @@
+"""
+静态资源指纹与缓存
+生产环境下运行 `flask build-assets`，把 static 目录中的样式、脚本、字体和图标复制为
+带内容哈希的文件名（如 css/style.3fa9b2c1d4.css），同时生成 gzip/brotli 预压缩版本和清单文件。
+
+开启 ASSET_FINGERPRINTS 后，模板中原有的 url_for('static', filename=...) 会自动指向带哈希的文件，
+这些文件以一年期的 immutable 缓存头返回，客户端支持时直接发送预压缩版本。
+未开启时（开发环境）静态文件的处理方式不变
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from typing import Dict
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只生成 gzip 版本
+    brotli = None
+
+
+# 生成的文件放在 static/dist 下，与源文件分开
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+FINGERPRINT_EXTENSIONS = {'.css', '.js', '.ico', '.png', '.jpg', '.jpeg', '.gif', '.svg',
+                          '.woff', '.woff2', '.ttf', '.eot', '.map'}
+# 只有文本类资源值得预压缩
+COMPRESS_EXTENSIONS = {'.css', '.js', '.svg', '.map', '.ttf', '.eot', '.ico'}
+COMPRESS_MIN_SIZE = 1024
+
+# 带哈希的文件内容永远不会变化，可以缓存一年
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def build_assets(static_folder: str) -> Dict[str, str]:
+    """
+    为静态资源生成带内容哈希的副本、预压缩版本和清单文件
+
+    Args:
+        static_folder: 静态文件目录
+
+    Returns:
+        Dict[str, str]: 清单，原文件名 -> 带哈希的文件名（均相对于静态文件目录，使用'/'分隔）
+    """
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist_folder):
+        shutil.rmtree(dist_folder)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist_folder)
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in FINGERPRINT_EXTENSIONS:
+                continue
+
+            source = os.path.join(root, name)
+            with open(source, 'rb') as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()[:10]
+
+            relative_dir = os.path.relpath(root, static_folder)
+            logical = name if relative_dir == '.' else f'{relative_dir}/{name}'.replace(os.sep, '/')
+            hashed = f'{DIST_DIR}/' + (f'{stem}.{digest}{ext}' if relative_dir == '.'
+                                       else f'{relative_dir}/{stem}.{digest}{ext}'.replace(os.sep, '/'))
+
+            target = os.path.join(static_folder, *hashed.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(content)
+
+            if ext.lower() in COMPRESS_EXTENSIONS and len(content) >= COMPRESS_MIN_SIZE:
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(content, quality=11))
+
+            manifest[logical] = hashed
+
+    os.makedirs(dist_folder, exist_ok=True)
+    with open(os.path.join(dist_folder, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder: str) -> Dict[str, str]:
+    """读取清单文件，未构建时返回空字典"""
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(filename: str, **values) -> str:
+    """
+    模板中使用的静态资源地址，用法与 url_for('static', filename=...) 相同
+
+    开启资源指纹时返回带哈希的文件地址，否则返回原地址
+    """
+    return url_for('static', filename=filename, **values)
+
+
+def init_assets(app):
+    """
+    注册资源相关的模板函数和命令；开启 ASSET_FINGERPRINTS 时接管 static 路由
+
+    Args:
+        app: Flask应用
+    """
+    app.add_template_global(asset_url, 'asset_url')
+    app.cli.add_command(build_assets_command)
+
+    if not app.config.get('ASSET_FINGERPRINTS') or not app.static_folder:
+        return
+
+    manifest = load_manifest(app.static_folder)
+    if not manifest:
+        app.logger.warning('已开启 ASSET_FINGERPRINTS，但未找到资源清单，请先运行 flask build-assets')
+        return
+
+    hashed_files = set(manifest.values())
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        # 让模板中已有的 url_for('static', filename=...) 自动指向带哈希的文件
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def send_static_asset(filename):
+        if filename not in hashed_files:
+            return send_from_directory(app.static_folder, filename)
+        return _send_immutable(app.static_folder, filename)
+
+    app.view_functions['static'] = send_static_asset
+
+
+def _send_immutable(static_folder: str, filename: str):
+    """发送带哈希的资源：客户端接受时优先发送预压缩版本，并设置一年期缓存"""
+    accepted = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[encoding] and os.path.isfile(os.path.join(static_folder, *(filename + suffix).split('/'))):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """生成带内容哈希的静态资源、预压缩版本和清单文件"""
+    manifest = build_assets(current_app.static_folder)
+    print(f'已生成 {len(manifest)} 个带哈希的静态资源' + ('' if brotli else '（未安装 brotli，只生成 gzip 版本）'))
@@ -0,0 +1,156 @@
+"""
+教师共同空闲时段
+为教研组、年级组安排会议时，找出一组教师都没有课（或至少K人没有课）的节次。
+
+- 教师可以直接指定，也可以用学科（任教该学科或有该学科授课计划的教师）、
+  年级（在该年级有授课计划的教师和班主任）展开
+- 正课和早晚自习各用一条查询载入这组教师占用的节次，每个节次记录一个"有课教师"位掩码（第 i 位对应第 i 位教师），
+  空闲人数就是教师总数减去位掩码中1的个数；查询次数是固定的，与教师人数无关
+- 单双周的课程按每周都有课计算
+- 指定日期时只查看当天，并计入当天的代课：临时代课、非常规代课和进行中的长期代课安排中，
+  代课教师在代课的节次视为有课（原任课教师的节次本来就有课，不做调整）
+"""
+
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import or_
+
+from database import db
+from models import (Class, NonRoutineSubstitution, Schedule, SelfStudyPlan, SelfStudySchedule,
+                    SubstitutionArrangement, TeachingPlan, TemporarySubstitution, teacher_subject)
+from schedule_grid import (DAY_NAMES, SELFSTUDY_PERIODS, build_time_rows, get_schedule_setting, load_print_options,
+                           selfstudy_virtual_period)
+import reference_cache
+
+# 一次查询的教师人数上限，避免误传全校教师时返回过大的结果
+MAX_TEACHERS = 300
+
+
+def expand_teacher_group(teacher_ids: Iterable[int] = (), subject_ids: Iterable[int] = (),
+                         grades: Iterable[int] = ()) -> List[int]:
+    """
+    展开教师组：指定的教师，加上任教指定学科的教师，加上在指定年级授课的教师和班主任
+
+    Returns:
+        List[int]: 存在的教师ID，按教师姓名排序
+    """
+    wanted = set(teacher_ids)
+    subject_ids, grades = list(subject_ids), list(grades)
+    if subject_ids:
+        wanted.update(row[0] for row in db.session.query(teacher_subject.c.teacher_id)
+                      .filter(teacher_subject.c.subject_id.in_(subject_ids)))
+        wanted.update(row[0] for row in db.session.query(TeachingPlan.teacher_id)
+                      .filter(TeachingPlan.subject_id.in_(subject_ids)))
+    if grades:
+        grade_classes = db.session.query(Class.id).filter(Class.grade.in_(grades))
+        wanted.update(row[0] for row in db.session.query(TeachingPlan.teacher_id)
+                      .filter(TeachingPlan.class_id.in_(grade_classes)))
+        wanted.update(row[0] for row in db.session.query(Class.head_teacher_id).filter(Class.grade.in_(grades)))
+    return [teacher.id for teacher in reference_cache.get_teachers() if teacher.id in wanted]
+
+
+def _substitution_slots(on_date: date, teacher_ids: List[int]):
+    """当天代课教师承担的 (教师ID, 节次)"""
+    day = on_date.isoweekday()
+    for model, inactive in ((TemporarySubstitution, ['cancelled', 'rejected']),
+                            (NonRoutineSubstitution, ['cancelled'])):
+        query = db.session.query(model.substitute_teacher_id, model.period) \
+            .filter(model.date == on_date, model.substitute_teacher_id.in_(teacher_ids),
+                    or_(model.status.is_(None), model.status.notin_(inactive)))
+        yield from query
+
+    # 长期代课安排：代课教师承担原任课教师在该班级、该学科当天的全部正课
+    query = db.session.query(SubstitutionArrangement.substitute_teacher_id, Schedule.period) \
+        .join(Schedule, (Schedule.teacher_id == SubstitutionArrangement.original_teacher_id)
+              & (Schedule.class_id == SubstitutionArrangement.class_id)
+              & (Schedule.subject_id == SubstitutionArrangement.subject_id)) \
+        .filter(SubstitutionArrangement.substitute_teacher_id.in_(teacher_ids),
+                SubstitutionArrangement.start_date <= on_date, SubstitutionArrangement.end_date >= on_date,
+                or_(SubstitutionArrangement.status.is_(None), SubstitutionArrangement.status != 'cancelled'),
+                Schedule.day_of_week == day)
+    yield from query
+
+
+def find_free_slots(teacher_ids: List[int], min_free: Optional[int] = None, on_date: Optional[date] = None,
+                    include_selfstudy: bool = True) -> Dict:
+    """
+    查找一组教师的共同空闲节次
+
+    Args:
+        teacher_ids: 教师ID（通常由 expand_teacher_group 得到）
+        min_free: 至少多少位教师空闲，默认为全部教师
+        on_date: 指定日期时只查看当天，并计入当天的代课
+        include_selfstudy: 是否包括早读、晚修
+
+    Returns:
+        Dict: teachers（教师列表）、slots（符合条件的节次，按空闲人数从多到少，其次按时间排序，
+              每项包含 day、day_name、period、label、time、free_count、busy（有课的教师ID））
+
+    Raises:
+        ValueError: 没有教师、教师过多或 min_free 超出范围
+    """
+    teacher_names = {teacher.id: teacher.name for teacher in reference_cache.get_teachers()}
+    teacher_ids = [teacher_id for teacher_id in dict.fromkeys(teacher_ids) if teacher_id in teacher_names]
+    if not teacher_ids:
+        raise ValueError('请至少选择一位教师')
+    if len(teacher_ids) > MAX_TEACHERS:
+        raise ValueError(f'一次最多查询{MAX_TEACHERS}位教师')
+    total = len(teacher_ids)
+    min_free = total if min_free is None else min_free
+    if not 1 <= min_free <= total:
+        raise ValueError(f'空闲人数应在1到{total}之间')
+
+    setting = get_schedule_setting()
+    _, period_times, _ = load_print_options()
+    days = list(range(1, (setting.days_per_week or 5) + 1))
+    if on_date is not None:
+        days = [day for day in days if day == on_date.isoweekday()]
+    rows = build_time_rows(setting, period_times, include_selfstudy)
+
+    bits = {teacher_id: 1 << position for position, teacher_id in enumerate(teacher_ids)}
+    busy: Dict[tuple, int] = {}
+
+    for teacher_id, day, period in db.session.query(Schedule.teacher_id, Schedule.day_of_week, Schedule.period) \
+            .filter(Schedule.teacher_id.in_(teacher_ids), Schedule.day_of_week.in_(days)):
+        busy[(day, period)] = busy.get((day, period), 0) | bits[teacher_id]
+
+    if include_selfstudy:
+        query = db.session.query(SelfStudyPlan.teacher_id, SelfStudySchedule.day, SelfStudySchedule.period) \
+            .join(SelfStudyPlan, SelfStudySchedule.plan_id == SelfStudyPlan.id) \
+            .filter(SelfStudyPlan.teacher_id.in_(teacher_ids), SelfStudySchedule.day.in_(days),
+                    SelfStudySchedule.period.in_(list(SELFSTUDY_PERIODS)))
+        for teacher_id, day, period_name in query:
+            slot = (day, selfstudy_virtual_period(period_name, setting))
+            busy[slot] = busy.get(slot, 0) | bits[teacher_id]
+
+    if on_date is not None and days:
+        for teacher_id, period in _substitution_slots(on_date, teacher_ids):
+            busy[(days[0], period)] = busy.get((days[0], period), 0) | bits[teacher_id]
+
+    slots = []
+    for day in days:
+        for period, label in rows:
+            mask = busy.get((day, period), 0)
+            free_count = total - mask.bit_count()
+            if free_count < min_free:
+                continue
+            slots.append({
+                'day': day,
+                'day_name': DAY_NAMES[day - 1],
+                'period': period,
+                'label': label.split('\n')[0],
+                'time': period_times.get(str(period)) or '',
+                'free_count': free_count,
+                'busy': [teacher_id for teacher_id in teacher_ids if mask & bits[teacher_id]],
+            })
+    # 同样空闲人数的节次保持时间顺序（排序是稳定的）
+    slots.sort(key=lambda slot: -slot['free_count'])
+
+    return {
+        'teachers': [{'id': teacher_id, 'name': teacher_names[teacher_id]} for teacher_id in teacher_ids],
+        'total': total,
+        'min_free': min_free,
+        'date': on_date.isoformat() if on_date else None,
+        'slots': slots,
+    }
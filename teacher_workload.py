@@ -0,0 +1,166 @@
+"""
+教师工作量统计
+用少量分组聚合查询（GROUP BY）一次性统计全部教师的：计划课时与已排课时、每天课时与每日上限、
+一天内课程之间的空节、早晚自习值班次数以及代课次数，查询次数与教师人数无关
+"""
+
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from database import db
+from models import (Schedule, TeachingPlan, SelfStudyPlan, SelfStudySchedule,
+                    TemporarySubstitution, NonRoutineSubstitution, SubstitutionArrangement)
+import reference_cache
+
+
+def _plan_hours(plan_model) -> Dict[int, int]:
+    """
+    每位教师每周的计划课时（含额外课时）
+
+    合班的授课计划在每个班级各有一条，同一合班只按一次计算
+    """
+    hours = plan_model.hours_per_week + func.coalesce(plan_model.extra_hours, 0)
+    result = defaultdict(int)
+
+    single = db.session.query(plan_model.teacher_id, func.sum(hours)) \
+        .filter(db.or_(plan_model.is_combined.is_(False), plan_model.is_combined.is_(None),
+                       plan_model.combination_id.is_(None))) \
+        .group_by(plan_model.teacher_id)
+    for teacher_id, total in single:
+        result[teacher_id] += int(total or 0)
+
+    combined = db.session.query(
+        plan_model.teacher_id.label('teacher_id'), func.max(hours).label('hours')
+    ).filter(plan_model.is_combined.is_(True), plan_model.combination_id.isnot(None)) \
+     .group_by(plan_model.teacher_id, plan_model.combination_id).subquery()
+    for teacher_id, total in db.session.query(combined.c.teacher_id, func.sum(combined.c.hours)) \
+            .group_by(combined.c.teacher_id):
+        result[teacher_id] += int(total or 0)
+
+    return result
+
+
+def _count_by(column, *criteria) -> Dict[int, int]:
+    """按指定列分组计数"""
+    query = db.session.query(column, func.count()).filter(column.isnot(None), *criteria).group_by(column)
+    return {key: count for key, count in query}
+
+
+def _substitution_counts(start: Optional[date], end: Optional[date]) -> Dict[str, Dict[int, int]]:
+    """统计代课次数：被代课（原任课教师）和代别人上课（代课教师）"""
+    counts = {}
+    for label, model in (('temporary', TemporarySubstitution), ('non_routine', NonRoutineSubstitution)):
+        criteria = [db.or_(model.status.is_(None), model.status.notin_(['cancelled', 'rejected']))]
+        if start:
+            criteria.append(model.date >= start)
+        if end:
+            criteria.append(model.date <= end)
+        counts[f'{label}_absent'] = _count_by(model.original_teacher_id, *criteria)
+        counts[f'{label}_covered'] = _count_by(model.substitute_teacher_id, *criteria)
+
+    # 长期代课安排按与统计区间有重叠的安排计数
+    criteria = [db.or_(SubstitutionArrangement.status.is_(None), SubstitutionArrangement.status != 'cancelled')]
+    if start:
+        criteria.append(SubstitutionArrangement.end_date >= start)
+    if end:
+        criteria.append(SubstitutionArrangement.start_date <= end)
+    counts['arrangement_absent'] = _count_by(SubstitutionArrangement.original_teacher_id, *criteria)
+    counts['arrangement_covered'] = _count_by(SubstitutionArrangement.substitute_teacher_id, *criteria)
+    return counts
+
+
+def compute_teacher_workload(start: Optional[date] = None, end: Optional[date] = None) -> Dict:
+    """
+    统计全部教师的工作量
+
+    Args:
+        start: 代课统计的开始日期，为空表示不限
+        end: 代课统计的结束日期，为空表示不限
+
+    Returns:
+        Dict: {'teachers': 每位教师的统计列表, 'summary': 全校汇总}
+    """
+    setting = reference_cache.get_schedule_setting()
+    days_per_week = setting.days_per_week or 5
+
+    planned = _plan_hours(TeachingPlan)
+    selfstudy_planned = _plan_hours(SelfStudyPlan)
+
+    # 已排课时按时间段去重：合班和单双周在同一时间段只算一次
+    slot = Schedule.day_of_week * 100 + Schedule.period
+    scheduled = {
+        teacher_id: count for teacher_id, count in db.session.query(
+            Schedule.teacher_id, func.count(func.distinct(slot))
+        ).filter(Schedule.teacher_id.isnot(None)).group_by(Schedule.teacher_id)
+    }
+
+    # 每天的课时数和空节：空节 = 当天最后一节与第一节之间的节数 - 已排节数
+    daily = defaultdict(dict)
+    for teacher_id, day, count, first, last in db.session.query(
+        Schedule.teacher_id, Schedule.day_of_week, func.count(func.distinct(Schedule.period)),
+        func.min(Schedule.period), func.max(Schedule.period)
+    ).filter(Schedule.teacher_id.isnot(None)).group_by(Schedule.teacher_id, Schedule.day_of_week):
+        daily[teacher_id][day] = {'hours': count, 'gaps': (last - first + 1) - count}
+
+    selfstudy_duties = {
+        teacher_id: count for teacher_id, count in db.session.query(
+            SelfStudyPlan.teacher_id, func.count(SelfStudySchedule.id)
+        ).join(SelfStudySchedule, SelfStudySchedule.plan_id == SelfStudyPlan.id)
+         .filter(SelfStudyPlan.teacher_id.isnot(None)).group_by(SelfStudyPlan.teacher_id)
+    }
+
+    substitutions = _substitution_counts(start, end)
+
+    teachers = []
+    for teacher in reference_cache.get_teachers():
+        max_per_day = teacher.max_hours_per_day or 6
+        days = daily.get(teacher.id, {})
+        per_day = [days.get(day, {'hours': 0, 'gaps': 0})['hours'] for day in range(1, days_per_week + 1)]
+        gaps = [days.get(day, {'hours': 0, 'gaps': 0})['gaps'] for day in range(1, days_per_week + 1)]
+        planned_hours = planned.get(teacher.id, 0)
+        scheduled_hours = scheduled.get(teacher.id, 0)
+        capacity = max_per_day * days_per_week
+
+        absent = sum(substitutions[f'{label}_absent'].get(teacher.id, 0)
+                     for label in ('temporary', 'non_routine', 'arrangement'))
+        covered = sum(substitutions[f'{label}_covered'].get(teacher.id, 0)
+                      for label in ('temporary', 'non_routine', 'arrangement'))
+
+        teachers.append({
+            'id': teacher.id,
+            'name': teacher.name,
+            'staff_id': teacher.staff_id,
+            'planned_hours': planned_hours,
+            'scheduled_hours': scheduled_hours,
+            'unscheduled_hours': max(planned_hours - scheduled_hours, 0),
+            'max_hours_per_day': max_per_day,
+            'hours_per_day': per_day,
+            'overloaded_days': [day for day, hours in enumerate(per_day, 1) if hours > max_per_day],
+            'gaps_per_day': gaps,
+            'total_gaps': sum(gaps),
+            'utilization': round(scheduled_hours / capacity, 3) if capacity else None,
+            'selfstudy_planned_hours': selfstudy_planned.get(teacher.id, 0),
+            'selfstudy_duties': selfstudy_duties.get(teacher.id, 0),
+            'substitutions_absent': absent,
+            'substitutions_covered': covered
+        })
+
+    return {'teachers': teachers, 'summary': _summarize(teachers)}
+
+
+def _summarize(teachers: List[Dict]) -> Dict:
+    """全校汇总：需要关注的教师数量和平均负荷"""
+    active = [t for t in teachers if t['planned_hours'] or t['scheduled_hours']]
+    return {
+        'teacher_count': len(teachers),
+        'active_teacher_count': len(active),
+        'planned_hours': sum(t['planned_hours'] for t in teachers),
+        'scheduled_hours': sum(t['scheduled_hours'] for t in teachers),
+        'teachers_with_unscheduled_hours': sum(1 for t in teachers if t['unscheduled_hours']),
+        'teachers_over_daily_limit': sum(1 for t in teachers if t['overloaded_days']),
+        'average_utilization': round(sum(t['utilization'] or 0 for t in active) / len(active), 3) if active else 0,
+        'total_gaps': sum(t['total_gaps'] for t in teachers)
+    }
@@ -0,0 +1,285 @@
+"""
+自动排课命令行
+网页上的自动排课受HTTP超时限制，随机数种子也无法指定，排出满意的课表后无法重现。
+这里提供 flask timetable 命令组，可以放在 cron 中夜间运行，每次运行都能用输出中的种子原样重现：
+
+    flask timetable generate [--scope all|grade|class] [--grade 7] [--class-id 1 ...] [--seed 42]
+                             [--constraint teacher_conflict ...] [--attempts 20] [--time-budget 600]
+                             [--workers 4] [--dry-run] [--no-snapshot]
+    flask timetable validate [--scope ...]
+    flask timetable score [--scope ...]
+
+结果以JSON格式输出。退出码：0 成功；1 没有排出符合约束条件的课表；2 参数错误；3 现有课表存在违反约束的问题
+"""
+
+import json
+import random
+import time
+from collections import defaultdict
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from database import db
+import db_audit
+from models import Class, Schedule, SubjectBlock, CommonCourse
+import reference_cache
+import schedule_decomposition
+import timetable_solver
+from solver_telemetry import SolverTelemetry
+
+EXIT_OK = 0
+EXIT_INFEASIBLE = 1
+EXIT_VIOLATIONS = 3  # 参数错误时 click 以退出码2退出
+
+# 同一时间段按单双周拆开检查：每周的课同时占用单周和双周
+WEEKS = {'all': ('s', 'd'), 's': ('s',), 'd': ('d',)}
+
+
+def _scope_class_ids(scope, grade, class_ids):
+    """
+    确定排课范围
+
+    Returns:
+        Optional[List[int]]: 班级ID列表，全校时为None
+    """
+    if scope == 'all':
+        return None
+    if scope == 'grade':
+        if grade is None:
+            raise click.UsageError('--scope grade 需要指定 --grade')
+        ids = [id_ for (id_,) in Class.query.with_entities(Class.id).filter_by(grade=grade)]
+        if not ids:
+            raise click.UsageError(f'未找到{grade}年级的班级')
+        return ids
+    if not class_ids:
+        raise click.UsageError('--scope class 需要指定 --class-id')
+    found = {id_ for (id_,) in Class.query.with_entities(Class.id).filter(Class.id.in_(class_ids))}
+    missing = sorted(set(class_ids) - found)
+    if missing:
+        raise click.UsageError(f'未找到班级: {", ".join(map(str, missing))}')
+    return sorted(found)
+
+
+def _echo(result, code=EXIT_OK):
+    click.echo(json.dumps(result, ensure_ascii=False, indent=2))
+    if code != EXIT_OK:
+        raise SystemExit(code)
+
+
+def _score(lessons, class_ids=None):
+    # 评分依赖 numpy，只在需要时导入
+    import timetable_score
+
+    rows = [(class_id, subject_id, teacher_id or 0, day, period)
+            for class_id, subject_id, teacher_id, day, period, *_ in lessons]
+    # 缺课只按排课范围内班级的授课计划计算
+    return timetable_score.score_lessons(timetable_score.lessons_array(rows),
+                                         planned=timetable_score.load_planned_hours(class_ids))
+
+
+def scope_options(command):
+    """排课范围参数，各命令通用"""
+    command = click.option('--class-id', 'class_ids', type=int, multiple=True,
+                           help='班级ID（--scope class 时使用，可多次指定）')(command)
+    command = click.option('--grade', type=int, help='年级（--scope grade 时使用）')(command)
+    command = click.option('--scope', type=click.Choice(['all', 'grade', 'class']), default='all',
+                           show_default=True, help='排课范围')(command)
+    return command
+
+
+@click.group('timetable')
+def timetable_cli():
+    """自动排课、检查和评分课表"""
+
+
+@timetable_cli.command('generate')
+@scope_options
+@click.option('--seed', type=int, help='随机数种子，默认随机生成；第 n 次尝试使用 seed + n - 1')
+@click.option('--constraint', 'constraints', type=click.Choice(timetable_solver.DEFAULT_CONSTRAINTS), multiple=True,
+              help='启用的约束条件（可多次指定），默认全部启用')
+@click.option('--attempts', type=click.IntRange(min=1), default=1, show_default=True,
+              help='最多尝试的次数，从成功的结果中选扣分最少的')
+@click.option('--time-budget', type=click.FloatRange(min=0), help='时间预算（秒），超出后不再开始新的尝试')
+@click.option('--workers', type=click.IntRange(min=0), help='并行求解的进程数，默认为配置项 SOLVER_WORKERS')
+@click.option('--dry-run', is_flag=True, help='只求解和评分，不写入数据库')
+@click.option('--snapshot/--no-snapshot', default=True, show_default=True, help='写入前自动保存当前课表的快照')
+@with_appcontext
+def generate_command(scope, grade, class_ids, seed, constraints, attempts, time_budget, workers, dry_run, snapshot):
+    """自动排课，成功时替换排课范围内班级的课表"""
+    started = time.perf_counter()
+    class_ids = _scope_class_ids(scope, grade, class_ids)
+    telemetry = SolverTelemetry()
+    problem = timetable_solver.load_problem(class_ids, telemetry)
+    if not problem.plans:
+        _echo({'success': False, 'message': '未找到任何授课计划，无法进行排课!'}, EXIT_INFEASIBLE)
+
+    seed = random.SystemRandom().randrange(2 ** 31) if seed is None else seed
+    constraints = list(constraints) or None
+    workers = workers or current_app.config.get('SOLVER_WORKERS')
+
+    runs, best = [], None
+    for attempt in range(attempts):
+        if attempt and time_budget is not None and time.perf_counter() - started >= time_budget:
+            break
+        result = schedule_decomposition.solve_parallel(problem, constraints, seed=seed + attempt, workers=workers)
+        run = {'seed': seed + attempt, 'success': result['success'], 'message': result['message'],
+               'mode': result['mode'], 'elapsed_ms': result['elapsed_ms']}
+        if result['success']:
+            run['penalty'] = _score(result['lessons'], class_ids)['penalty']
+            if best is None or run['penalty'] < best[0]['penalty']:
+                best = (run, result)
+        runs.append(run)
+
+    output = {
+        'success': best is not None,
+        'scope': scope,
+        'class_ids': class_ids,
+        'constraints': constraints or list(timetable_solver.DEFAULT_CONSTRAINTS),
+        'attempts': runs,
+        'dry_run': dry_run,
+    }
+    if best is None:
+        output['message'] = runs[-1]['message']
+        _echo(output, EXIT_INFEASIBLE)
+
+    run, result = best
+    telemetry.merge(result['telemetry'])
+    if not dry_run:
+        if snapshot:
+            import schedule_snapshots
+
+            backup = schedule_snapshots.take_snapshot(f'命令行自动排课前自动备份（种子 {run["seed"]}）', is_auto=True,
+                                                      created_by='cli')
+            output['snapshot_id'] = backup.id
+        timetable_solver.save_lessons(result['lessons'], class_ids, telemetry)
+    telemetry.log(f'命令行自动排课（种子 {run["seed"]}）')
+
+    output.update({
+        'message': result['message'],
+        'seed': run['seed'],
+        'lessons': len(result['lessons']),
+        'score': _score(result['lessons'], class_ids),
+        'components': result['components'],
+        'telemetry': telemetry.to_dict(),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+    _echo(output)
+
+
+def find_violations(class_ids=None):
+    """
+    检查现有课表违反约束条件的地方：班级或教师同一时间段有两节课（区分单双周，合班课除外）、
+    课程排在禁排时段或公共课程时段、教师某天的课时超过上限、已排课时与授课计划不一致
+
+    Args:
+        class_ids: 只报告涉及这些班级的问题，为空表示全校
+
+    Returns:
+        List[Dict]: 问题列表
+    """
+    scope = None if class_ids is None else set(class_ids)
+    lessons = db.session.query(Schedule.class_id, Schedule.subject_id, Schedule.teacher_id, Schedule.day_of_week,
+                               Schedule.period, Schedule.is_combined, Schedule.combination_id,
+                               Schedule.week_type).all()
+    violations = []
+
+    def in_scope(*ids):
+        return scope is None or any(id_ in scope for id_ in ids)
+
+    class_slots = defaultdict(list)
+    teacher_slots = defaultdict(set)
+    teacher_slot_classes = defaultdict(set)
+    teacher_day_slots = defaultdict(set)
+    for class_id, subject_id, teacher_id, day, period, is_combined, combination_id, week_type in lessons:
+        for week in WEEKS.get(week_type or 'all', WEEKS['all']):
+            class_slots[(class_id, day, period, week)].append(subject_id)
+            if teacher_id:
+                group = ('combination', combination_id) if is_combined and combination_id else ('class', class_id)
+                teacher_slots[(teacher_id, day, period, week)].add(group)
+                teacher_slot_classes[(teacher_id, day, period, week)].add(class_id)
+        if teacher_id:
+            teacher_day_slots[(teacher_id, day)].add(period)
+
+    # 单周和双周都冲突时合并为一条（week 为 all）
+    conflict_weeks = defaultdict(list)
+    for (class_id, day, period, week), subjects in class_slots.items():
+        if len(subjects) > 1 and in_scope(class_id):
+            conflict_weeks[('class_conflict', class_id, day, period, tuple(sorted(subjects)))].append(week)
+    for (teacher_id, day, period, week), groups in teacher_slots.items():
+        if len(groups) > 1 and in_scope(*teacher_slot_classes[(teacher_id, day, period, week)]):
+            members = tuple(sorted(f'{kind}:{id_}' for kind, id_ in groups))
+            conflict_weeks[('teacher_conflict', teacher_id, day, period, members)].append(week)
+    for (kind, id_, day, period, members), weeks in conflict_weeks.items():
+        violation = {'type': kind, 'day': day, 'period': period, 'week': 'all' if len(weeks) == 2 else weeks[0]}
+        if kind == 'class_conflict':
+            violation.update(class_id=id_, subject_ids=list(members))
+        else:
+            violation.update(teacher_id=id_, groups=list(members))
+        violations.append(violation)
+
+    blocks = db.session.query(SubjectBlock.day_of_week, SubjectBlock.period, SubjectBlock.subject_id,
+                              SubjectBlock.is_block_all).all()
+    commons = db.session.query(CommonCourse.day_of_week, CommonCourse.period, CommonCourse.apply_to_all_classes,
+                               CommonCourse.class_id, CommonCourse.name).all()
+    blocked = defaultdict(set)
+    for day, period, subject_id, is_block_all in blocks:
+        blocked[(day, period)].add(None if is_block_all else subject_id)
+    common_slots = defaultdict(list)
+    for day, period, apply_all, class_id, name in commons:
+        common_slots[(day, period)].append((apply_all, class_id, name))
+    for class_id, subject_id, teacher_id, day, period, *_ in lessons:
+        if not in_scope(class_id):
+            continue
+        slot_blocks = blocked.get((day, period), ())
+        if None in slot_blocks or subject_id in slot_blocks:
+            violations.append({'type': 'subject_block', 'class_id': class_id, 'subject_id': subject_id,
+                               'day': day, 'period': period})
+        for apply_all, common_class_id, name in common_slots.get((day, period), ()):
+            if apply_all or common_class_id == class_id:
+                violations.append({'type': 'common_course', 'class_id': class_id, 'subject_id': subject_id,
+                                   'day': day, 'period': period, 'common_course': name})
+
+    max_hours = {teacher.id: teacher.max_hours_per_day for teacher in reference_cache.get_teachers()}
+    for (teacher_id, day), periods in teacher_day_slots.items():
+        limit = max_hours.get(teacher_id) or 6
+        if len(periods) > limit:
+            violations.append({'type': 'teacher_max_hours', 'teacher_id': teacher_id, 'day': day,
+                               'hours': len(periods), 'max_hours': limit})
+
+    # 课时数与 flask audit-db 使用同一个检查：每条课程记录算一节，计划课时包括额外课时
+    _, plan_hours_mismatch = db_audit.CHECKS['plan_hours_mismatch']
+    rows = db.session.execute(plan_hours_mismatch()).mappings().all()
+    for row in sorted(rows, key=lambda row: (row['class_id'], row['subject_id'])):
+        if in_scope(row['class_id']):
+            violations.append({'type': 'plan_hours', 'class_id': row['class_id'], 'subject_id': row['subject_id'],
+                               'planned': row['planned'], 'scheduled': row['scheduled']})
+    return violations
+
+
+@timetable_cli.command('validate')
+@scope_options
+@with_appcontext
+def validate_command(scope, grade, class_ids):
+    """检查现有课表是否违反约束条件，存在问题时退出码为3"""
+    class_ids = _scope_class_ids(scope, grade, class_ids)
+    violations = find_violations(class_ids)
+    counts = defaultdict(int)
+    for violation in violations:
+        counts[violation['type']] += 1
+    _echo({'success': not violations, 'scope': scope, 'class_ids': class_ids, 'counts': dict(counts),
+           'violations': violations}, EXIT_VIOLATIONS if violations else EXIT_OK)
+
+
+@timetable_cli.command('score')
+@scope_options
+@with_appcontext
+def score_command(scope, grade, class_ids):
+    """计算现有课表的质量评分（扣分越少越好）"""
+    class_ids = _scope_class_ids(scope, grade, class_ids)
+    query = db.session.query(Schedule.class_id, Schedule.subject_id, Schedule.teacher_id, Schedule.day_of_week,
+                             Schedule.period)
+    if class_ids is not None:
+        query = query.filter(Schedule.class_id.in_(class_ids))
+    _echo({'success': True, 'scope': scope, 'class_ids': class_ids, 'score': _score(query.all(), class_ids)})
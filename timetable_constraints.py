@@ -0,0 +1,290 @@
+"""
+自动排课的约束条件
+每项约束是一个 Constraint 对象，登记在 CONSTRAINTS 中。每次求解开始时，启用的约束各编译（compile）一次，
+得到一个函数：传入授课计划，返回该计划当前允许使用的时段位掩码（时段 (星期, 节次) 对应第
+(星期 - 1) × 每天节数 + (节次 - 1) 位）。求解时候选时段也是位掩码，与各约束的掩码依次做与运算即可：
+
+- 没有启用的约束不参与编译，求解时没有任何开销；编译时发现用不到的约束（如没有合班课时的合班约束）也会跳过
+- 各约束按已排除的时段数从多到少排列，每排一定节数的课重新排序一次；候选时段为空后不再计算其余约束
+- 新增约束只需继承 Constraint 实现 compile()，再调用 register()，不需要修改求解器
+
+主科上午、科目固定排课日和第一节均衡决定的是排课的顺序和时段偏好，而不是排除时段，
+它们以 PreferenceConstraint 登记，求解器按名称判断是否启用。
+
+科目固定排课日取自学科的 fixed_day 列（如周六科目为6），不按科目名称判断，新建的学科默认不固定排课日；
+default_fixed_day() 只用于迁移5：把升级前按命名约定（带"1"后缀）排在周六的科目转换为 fixed_day
+"""
+
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 升级前按名称判断周六科目的约定：带"1"后缀的科目排在周六，这些科目除外（只用于迁移5）
+SATURDAY_SUFFIX_EXCEPTIONS = {'篮球1', '足球1'}
+SATURDAY = 6
+
+# 每排这么多节课，按各约束排除的时段数重新排序一次
+REORDER_INTERVAL = 64
+
+
+def default_fixed_day(name: str) -> Optional[int]:
+    """升级前的命名约定对应的固定排课日：带"1"后缀的科目（篮球1、足球1除外）为周六，其他科目不固定"""
+    if name and name.endswith('1') and name not in SATURDAY_SUFFIX_EXCEPTIONS:
+        return SATURDAY
+    return None
+
+
+class SlotState:
+    """
+    求解过程中各班级、教师、合班已占用的时段，全部用位掩码表示
+
+    Attributes:
+        full: 全部时段
+        day_masks: 星期 -> 这一天的全部时段
+        class_used / teacher_used / combo_used: 班级、教师、合班ID -> 已占用的时段
+        teacher_day_count: 教师ID -> 星期 -> 已安排的课时数
+    """
+
+    def __init__(self, days_per_week: int, periods_per_day: int):
+        self.days_per_week = days_per_week
+        self.periods_per_day = periods_per_day
+        self.full = (1 << (days_per_week * periods_per_day)) - 1
+        day_mask = (1 << periods_per_day) - 1
+        self.day_masks = {day: day_mask << ((day - 1) * periods_per_day) for day in range(1, days_per_week + 1)}
+        self.class_used = defaultdict(int)
+        self.teacher_used = defaultdict(int)
+        self.combo_used = defaultdict(int)
+        self.teacher_day_count = defaultdict(lambda: defaultdict(int))
+
+    def bit(self, day: int, period: int) -> int:
+        """时段对应的位，不在排课范围内（如周日、超过每天节数）的时段为0"""
+        if 1 <= day <= self.days_per_week and 1 <= period <= self.periods_per_day:
+            return 1 << ((day - 1) * self.periods_per_day + period - 1)
+        return 0
+
+    def mask(self, slots: Iterable[Tuple[int, int]]) -> int:
+        result = 0
+        for day, period in slots:
+            result |= self.bit(day, period)
+        return result
+
+    def slots(self, mask: int) -> List[Tuple[int, int]]:
+        """位掩码中的时段，按 (星期, 节次) 从小到大排列"""
+        result = []
+        periods = self.periods_per_day
+        while mask:
+            low = mask & -mask
+            index = low.bit_length() - 1
+            result.append((index // periods + 1, index % periods + 1))
+            mask ^= low
+        return result
+
+
+class Constraint:
+    """
+    排课约束
+
+    Attributes:
+        name: 约束名称，即接口和命令行中的 constraints 参数
+        description: 说明
+        required: 为True时总是启用（不能通过 constraints 参数关闭）
+    """
+
+    name = ''
+    description = ''
+    required = False
+
+    def compile(self, problem, state: SlotState) -> Optional[Callable]:
+        """
+        每次求解开始时调用一次
+
+        Args:
+            problem: SchedulingProblem
+            state: 求解过程中的占用情况，返回的函数在调用时读取它的当前值
+
+        Returns:
+            Optional[Callable]: 授课计划 -> 允许的时段位掩码；本次求解用不到这项约束时返回None
+        """
+        raise NotImplementedError
+
+
+class PreferenceConstraint(Constraint):
+    """决定排课顺序或时段偏好的约束，不排除时段，由求解器按名称判断是否启用"""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+
+    def compile(self, problem, state):
+        return None
+
+
+class BlockedSlots(Constraint):
+    name = 'blocked'
+    description = '学科禁排时段和公共课程时段'
+    required = True
+
+    def compile(self, problem, state):
+        if not problem.subject_blocks and not problem.common_courses:
+            return None
+        closed_all = 0
+        closed_subjects = defaultdict(int)
+        for (day, period), (all_blocked, subject_ids) in problem.subject_blocks.items():
+            bit = state.bit(day, period)
+            if all_blocked:
+                closed_all |= bit
+            for subject_id in subject_ids:
+                closed_subjects[subject_id] |= bit
+        closed_classes = defaultdict(int)
+        for (day, period), (apply_all, class_id) in problem.common_courses.items():
+            if apply_all:
+                closed_all |= state.bit(day, period)
+            else:
+                closed_classes[class_id] |= state.bit(day, period)
+
+        # 禁排和公共课程在求解过程中不变，每个 (班级, 学科) 只计算一次
+        allowed_masks = {}
+
+        def allowed(plan):
+            key = (plan.class_id, plan.subject_id)
+            mask = allowed_masks.get(key)
+            if mask is None:
+                mask = allowed_masks[key] = state.full & ~(
+                    closed_all | closed_subjects.get(plan.subject_id, 0) | closed_classes.get(plan.class_id, 0))
+            return mask
+
+        return allowed
+
+
+class ClassConflict(Constraint):
+    name = 'class_conflict'
+    description = '班级同一时段只上一节课'
+
+    def compile(self, problem, state):
+        class_used = state.class_used
+        return lambda plan: ~class_used[plan.class_id]
+
+
+class TeacherConflict(Constraint):
+    name = 'teacher_conflict'
+    description = '教师同一时段只上一节课（包括排课范围以外班级的课）'
+
+    def compile(self, problem, state):
+        teacher_used = state.teacher_used
+        return lambda plan: ~teacher_used[plan.teacher_id]
+
+
+class CombinedClass(Constraint):
+    name = 'combined_class'
+    description = '合班课的所有班级（包括排课范围以外的班级）在该时段都没有课'
+
+    def compile(self, problem, state):
+        if not any(plan.is_combined and plan.combination_id for plan in problem.plans):
+            return None
+        involved = problem.class_ids
+        # 排课范围以外的班级的课在求解过程中不变
+        outside = {class_id: state.mask(slots) for class_id, slots in problem.busy_class_slots.items()
+                   if class_id not in involved}
+        members = problem.combinations
+        class_used, combo_used = state.class_used, state.combo_used
+
+        def allowed(plan):
+            if not (plan.is_combined and plan.combination_id):
+                return state.full
+            busy = combo_used[plan.combination_id]
+            for class_id in members.get(plan.combination_id, ()):
+                busy |= class_used[class_id] | outside.get(class_id, 0)
+            return ~busy
+
+        return allowed
+
+
+class TeacherMaxHours(Constraint):
+    name = 'teacher_max_hours'
+    description = '教师每天的课时数不超过上限（未设置时为6）'
+
+    def compile(self, problem, state):
+        max_hours = problem.teacher_max_hours
+        day_count, day_masks = state.teacher_day_count, state.day_masks
+
+        def allowed(plan):
+            limit = max_hours.get(plan.teacher_id) or 6
+            full_days = 0
+            for day, count in day_count[plan.teacher_id].items():
+                if count >= limit:
+                    full_days |= day_masks.get(day, 0)
+            return ~full_days
+
+        return allowed
+
+
+# 全部约束：名称 -> 约束，登记顺序即排除时段数相同时的计算顺序
+CONSTRAINTS: Dict[str, Constraint] = {}
+
+
+def register(constraint: Constraint) -> Constraint:
+    """登记约束，名称相同时替换已登记的约束"""
+    CONSTRAINTS[constraint.name] = constraint
+    return constraint
+
+
+for _constraint in (BlockedSlots(), ClassConflict(), TeacherConflict(), CombinedClass(), TeacherMaxHours(),
+                    PreferenceConstraint('major_morning', '主科优先排在上午'),
+                    PreferenceConstraint('saturday_priority', '有固定排课日的科目（如周六科目）先排在这一天'),
+                    PreferenceConstraint('first_period_balance', '各学科在第一节的次数尽量均匀')):
+    register(_constraint)
+
+
+def optional_constraints() -> Tuple[str, ...]:
+    """可以通过 constraints 参数选择的约束名称"""
+    return tuple(name for name, constraint in CONSTRAINTS.items() if not constraint.required)
+
+
+class ConstraintPipeline:
+    """
+    一次求解中编译好的约束
+
+    Attributes:
+        stages: [(名称, 函数)]，按排除的时段数从多到少排列
+        rejected: 名称 -> 排除的时段数
+    """
+
+    def __init__(self, problem, state: SlotState, enabled: Iterable[str], counters):
+        enabled = set(enabled)
+        self.counters = counters
+        self.stages = []
+        for name, constraint in CONSTRAINTS.items():
+            if not (constraint.required or name in enabled):
+                continue
+            allowed = constraint.compile(problem, state)
+            if allowed is not None:
+                self.stages.append((name, allowed))
+                counters['rejected_' + name] += 0
+        self.rejected = {name: 0 for name, _ in self.stages}
+        self._calls = 0
+
+    def filter(self, plan, mask: int) -> int:
+        """
+        用各约束筛选候选时段，每项约束排除的时段数计入 rejected_<名称>
+
+        Args:
+            plan: 授课计划
+            mask: 候选时段
+
+        Returns:
+            int: 满足全部约束的时段
+        """
+        for name, allowed in self.stages:
+            narrowed = mask & allowed(plan)
+            if narrowed != mask:
+                count = (mask ^ narrowed).bit_count()
+                self.rejected[name] += count
+                self.counters['rejected_' + name] += count
+                mask = narrowed
+                if not mask:
+                    break
+
+        self._calls += 1
+        if self._calls % REORDER_INTERVAL == 0:
+            # 排序是稳定的，排除数相同的约束保持登记顺序，同样的种子得到同样的计数
+            self.stages.sort(key=lambda stage: -self.rejected[stage[0]])
+        return mask
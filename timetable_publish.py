@@ -0,0 +1,243 @@
+"""
+课表发布
+把全校每个班级、每位教师的课表（正课和早晚自习，课节时间取自打印设置）生成为静态的 HTML 和 JSON 文件，
+连同索引页一起写入发布目录。任何静态文件服务器（如 nginx）都可以直接提供这些文件，查看课表不再访问数据库。
+
+发布目录的结构：
+
+    index.html、index.json           全部班级和教师的索引
+    classes/<班级ID>.html、.json      班级课表
+    teachers/<教师ID>.html、.json     教师课表
+    manifest.json                    版本号、发布时间和每个文件的 SHA-256
+
+重新发布时只写入内容有变化的文件，并删除已不存在的班级、教师的文件；有文件变化时版本号加1，
+没有变化时不写入任何文件。每个文件都先写入临时文件再重命名，manifest.json 最后写入，
+静态服务器不会读到写了一半的文件
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import click
+from flask import current_app, render_template
+from flask.cli import with_appcontext
+
+import reference_cache
+from schedule_grid import DAY_NAMES, build_time_rows, get_schedule_setting, load_print_options, load_school_grids
+
+MANIFEST = 'manifest.json'
+
+_lock = threading.Lock()
+
+
+def publish_directory(app) -> str:
+    """发布目录：配置项 PUBLISH_DIR，相对路径相对于应用的 instance 目录"""
+    directory = app.config.get('PUBLISH_DIR') or 'published'
+    return directory if os.path.isabs(directory) else os.path.join(app.instance_path, directory)
+
+
+def read_manifest(directory: str) -> Optional[Dict]:
+    """读取发布目录中的 manifest.json，没有发布过或文件损坏时返回None"""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) and isinstance(manifest.get('files'), dict) else None
+
+
+def _cell_dict(cell: Optional[dict], view_type: str) -> Optional[Dict]:
+    if not cell:
+        return None
+    # 教师课表的单元格中 teacher 字段存储的是班级名称
+    return {
+        'subject': cell['subject'],
+        'class' if view_type == 'teacher' else 'teacher': cell['teacher'],
+        'is_combined': bool(cell.get('is_combined')),
+        'is_selfstudy': bool(cell.get('is_selfstudy')),
+        'is_common_course': bool(cell.get('is_common_course')),
+        'week_type': cell.get('week_type') or 'all',
+    }
+
+
+def _timetable(view_type: str, entity, info: str, grid: Dict[int, dict], rows, days: List[str],
+               print_settings, period_times: Dict, common_periods: Dict) -> Dict:
+    """一张课表的发布数据，HTML 和 JSON 文件都由它生成"""
+    grid = grid or {}
+    return {
+        'type': view_type,
+        'id': entity.id,
+        'name': entity.name,
+        'info': info,
+        'school_name': print_settings.school_name or '',
+        'semester': print_settings.semester or '',
+        'days': days,
+        'rows': [{
+            'period': period,
+            'label': label.split('\n')[0],
+            'time': period_times.get(str(period)) or '',
+            'cells': [_cell_dict(grid.get(day, {}).get(period), view_type) for day in range(1, len(days) + 1)],
+        } for period, label in rows],
+        'common_periods': [{'name': item.get('name', ''), 'time': item.get('time', '')}
+                           for _, item in sorted(common_periods.items()) if isinstance(item, dict)],
+    }
+
+
+def _json_bytes(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def build_files() -> Dict[str, bytes]:
+    """
+    生成全部班级、教师课表和 index.json 的内容（index.html 含版本号，由 publish 在确定版本后生成）
+
+    课表数据由 load_school_grids 用固定次数的查询一次载入，与班级、教师数量无关
+
+    Returns:
+        Dict[str, bytes]: 发布目录中的相对路径（使用 /）-> 文件内容
+    """
+    # 年级名称只在生成文件时需要，避免导入 app 时的循环引用
+    from app import grade_to_text
+
+    setting = get_schedule_setting()
+    print_settings, period_times, common_periods = load_print_options()
+    class_grids, teacher_grids = load_school_grids(setting)
+    rows = build_time_rows(setting, period_times)
+    days = DAY_NAMES[:setting.days_per_week or 5]
+
+    teachers = reference_cache.get_teachers()
+    teacher_names = {teacher.id: teacher.name for teacher in teachers}
+    subject_names = {subject.id: subject.name for subject in reference_cache.get_subjects()}
+    teacher_subjects: Dict[int, List[str]] = {}
+    for teacher_id, subject_id in reference_cache.get_teacher_subject_pairs():
+        if subject_id in subject_names:
+            teacher_subjects.setdefault(teacher_id, []).append(subject_names[subject_id])
+
+    files = {}
+    index = {'school_name': print_settings.school_name or '', 'semester': print_settings.semester or '',
+             'classes': [], 'teachers': []}
+    pages = []
+    for class_ in reference_cache.get_classes():
+        grade = grade_to_text(class_.grade)
+        info = f'年级: {grade}'
+        if class_.head_teacher_id in teacher_names:
+            info += f'  班主任: {teacher_names[class_.head_teacher_id]}'
+        data = _timetable('class', class_, info, class_grids.get(class_.id), rows, days,
+                          print_settings, period_times, common_periods)
+        pages.append((f'classes/{class_.id}', data))
+        index['classes'].append({'id': class_.id, 'name': class_.name, 'grade': grade,
+                                 'path': f'classes/{class_.id}.html'})
+    for teacher in teachers:
+        subjects = teacher_subjects.get(teacher.id, [])
+        info = f'教授科目: {", ".join(subjects)}' if subjects else ''
+        data = _timetable('teacher', teacher, info, teacher_grids.get(teacher.id), rows, days,
+                          print_settings, period_times, common_periods)
+        pages.append((f'teachers/{teacher.id}', data))
+        index['teachers'].append({'id': teacher.id, 'name': teacher.name, 'subjects': subjects,
+                                  'path': f'teachers/{teacher.id}.html'})
+
+    for path, data in pages:
+        files[f'{path}.json'] = _json_bytes(data)
+        files[f'{path}.html'] = render_template('publish/timetable.html', timetable=data,
+                                                font_size=print_settings.font_size or '14').encode('utf-8')
+    files['index.json'] = _json_bytes(index)
+    return files
+
+
+def _write_atomic(directory: str, path: str, content: bytes):
+    """先写入同一目录中的临时文件再重命名，读取方只会看到旧文件或完整的新文件"""
+    target = os.path.join(directory, *path.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def publish(directory: Optional[str] = None, force: bool = False) -> Dict:
+    """
+    生成静态课表并增量写入发布目录
+
+    Args:
+        directory: 发布目录，默认为 publish_directory(current_app)
+        force: 为True时忽略 manifest.json，重新写入全部文件
+
+    Returns:
+        Dict: version（版本号）、published_at、directory、files（文件总数）、written（写入的文件）、
+              removed（删除的文件）、changed（是否有变化）、elapsed_ms
+    """
+    started = time.perf_counter()
+    directory = os.path.abspath(directory or publish_directory(current_app))
+
+    with _lock:
+        files = build_files()
+        manifest = None if force else read_manifest(directory)
+        previous = manifest['files'] if manifest else {}
+
+        hashes = {path: _sha256(content) for path, content in files.items()}
+        written = sorted(path for path, digest in hashes.items()
+                         if previous.get(path) != digest or not os.path.exists(os.path.join(directory, path)))
+        removed = sorted(path for path in previous
+                         if path not in hashes and path != 'index.html')
+        changed = bool(written or removed or manifest is None)
+
+        if not changed:
+            return {'version': manifest['version'], 'published_at': manifest['published_at'],
+                    'directory': directory, 'files': len(previous), 'written': [], 'removed': [],
+                    'changed': False, 'elapsed_ms': round((time.perf_counter() - started) * 1000)}
+
+        version = (manifest or read_manifest(directory) or {}).get('version', 0) + 1
+        published_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        index = json.loads(files['index.json'])
+        grades: Dict[str, List[Dict]] = {}
+        for class_ in index['classes']:
+            grades.setdefault(class_['grade'], []).append(class_)
+        files['index.html'] = render_template('publish/index.html', index=index, grades=grades, version=version,
+                                              published_at=published_at).encode('utf-8')
+        hashes['index.html'] = _sha256(files['index.html'])
+        written.append('index.html')
+
+        for path in written:
+            _write_atomic(directory, path, files[path])
+        for path in removed:
+            try:
+                os.remove(os.path.join(directory, *path.split('/')))
+            except FileNotFoundError:
+                pass
+        _write_atomic(directory, MANIFEST, _json_bytes({
+            'version': version, 'published_at': published_at, 'files': hashes}))
+
+    return {'version': version, 'published_at': published_at, 'directory': directory, 'files': len(hashes),
+            'written': written, 'removed': removed, 'changed': True,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000)}
+
+
+@click.command('publish-timetables')
+@click.option('--output', type=click.Path(file_okay=False), default=None,
+              help='发布目录，默认为配置项 PUBLISH_DIR')
+@click.option('--force', is_flag=True, help='重新写入全部文件')
+@with_appcontext
+def publish_timetables_command(output, force):
+    """把全部班级和教师的课表发布为静态 HTML 和 JSON 文件"""
+    result = publish(output, force=force)
+    if result['changed']:
+        click.echo(f'已发布版本 {result["version"]}：写入 {len(result["written"])} 个文件，'
+                   f'删除 {len(result["removed"])} 个文件，用时{result["elapsed_ms"]}毫秒')
+    else:
+        click.echo(f'课表没有变化，仍为版本 {result["version"]}')
+    click.echo(result['directory'])
@@ -0,0 +1,215 @@
+"""
+课表质量评分
+把整张课表载入NumPy数组（班级×天×节次、教师×天×节次），用向量化运算计算各项质量指标，
+用于客观比较两张课表的好坏。所有指标都是"扣分项"，加权求和得到总扣分，越低越好：
+
+- teacher_gaps: 教师一天内第一节课与最后一节课之间的空节数
+- same_day_repeats: 同一班级同一天重复出现的学科节数
+- major_outside_morning: 安排在上午以外的主科节数
+- first_period_repeats: 各班第一节课重复安排同一学科的次数（first_period_balance 的目标是均匀分布）
+- class_daily_imbalance / teacher_daily_imbalance: 班级/教师每天课时数的标准差之和
+- saturday_misplaced: 周六科目（固定排课日为周六的学科）没有排在周六，或其他科目排在了周六的节数
+- unscheduled_hours: 各班级各学科授课计划总课时中还没有排的节数（与 flask audit-db 的课时检查使用同一个计划课时定义），
+  权重远高于其他指标：缺课的课表不会因为扣分项少而被评为更好
+
+结果中的 coverage 为已排课时占授课计划总课时的比例
+"""
+
+import time
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import db
+import db_audit
+from models import Schedule
+import reference_cache
+
+
+SATURDAY = 6
+
+# 课表的列顺序：(班级ID, 学科ID, 教师ID, 星期, 节次)
+LESSON_COLUMNS = ('class_id', 'subject_id', 'teacher_id', 'day', 'period')
+
+# 各项指标的权重
+WEIGHTS = {
+    'teacher_gaps': 1.0,
+    'same_day_repeats': 3.0,
+    'major_outside_morning': 2.0,
+    'first_period_repeats': 1.0,
+    'class_daily_imbalance': 2.0,
+    'teacher_daily_imbalance': 1.0,
+    'saturday_misplaced': 5.0,
+    'unscheduled_hours': 100.0,
+}
+
+
+def load_lessons() -> np.ndarray:
+    """
+    用一次只取列的查询载入当前课表
+
+    Returns:
+        np.ndarray: int32数组，每行为 (班级ID, 学科ID, 教师ID, 星期, 节次)
+    """
+    rows = db.session.query(
+        Schedule.class_id, Schedule.subject_id, Schedule.teacher_id,
+        Schedule.day_of_week, Schedule.period
+    ).all()
+    return lessons_array(rows)
+
+
+def lessons_array(rows: Iterable[Sequence[int]]) -> np.ndarray:
+    """把 (班级ID, 学科ID, 教师ID, 星期, 节次) 序列转换为课表数组，空值记为0"""
+    array = np.array([[value or 0 for value in row] for row in rows], dtype=np.int32)
+    return array.reshape(-1, len(LESSON_COLUMNS))
+
+
+def load_planned_hours(class_ids: Optional[Iterable[int]] = None) -> Dict[Tuple[int, int], int]:
+    """
+    授课计划的总课时
+
+    Args:
+        class_ids: 只取这些班级的计划，为空表示全校
+
+    Returns:
+        Dict: (班级ID, 学科ID) -> 总课时
+    """
+    scope = None if class_ids is None else set(class_ids)
+    return {(class_id or 0, subject_id or 0): int(hours or 0)
+            for class_id, subject_id, hours in db.session.execute(db_audit.planned_hours())
+            if scope is None or class_id in scope}
+
+
+def _dense_index(values: np.ndarray):
+    """把ID映射为从0开始的连续下标"""
+    ids, index = np.unique(values, return_inverse=True)
+    return ids, index
+
+
+def score_lessons(lessons: np.ndarray, setting=None, subjects=None,
+                  planned: Optional[Dict[Tuple[int, int], int]] = None) -> Dict:
+    """
+    计算课表的各项质量指标和加权总扣分
+
+    Args:
+        lessons: load_lessons / lessons_array 返回的课表数组
+        setting: 排课设置，默认读取当前设置
+        subjects: 学科列表（需要 id、name、is_major 属性），默认读取全部学科
+        planned: load_planned_hours 返回的计划课时，默认为全校的授课计划
+
+    Returns:
+        Dict: {'metrics': 各项指标, 'penalty': 加权总扣分, 'lessons': 节数,
+               'planned_hours': 计划总课时, 'coverage': 已排课时占计划课时的比例, 'elapsed_ms': 耗时}
+    """
+    started = time.perf_counter()
+    setting = setting or reference_cache.get_schedule_setting()
+    subjects = subjects if subjects is not None else reference_cache.get_subjects()
+    planned = planned if planned is not None else load_planned_hours()
+
+    days = max(setting.days_per_week or 5, int(lessons[:, 3].max()) if len(lessons) else 0)
+    periods = max(setting.periods_per_day or 8, int(lessons[:, 4].max()) if len(lessons) else 0)
+    morning = setting.morning_periods or 4
+
+    # 只评价正常节次（早晚自习不在 Schedule 表中）
+    lessons = lessons[(lessons[:, 3] >= 1) & (lessons[:, 4] >= 1)]
+    metrics = dict.fromkeys(WEIGHTS, 0.0)
+    metrics['saturday_lessons'] = 0
+
+    # 缺课：每个 (班级, 学科) 计划课时超出已排节数的部分，多排的课时不能抵消其他学科的缺课
+    pairs, counts = np.unique(lessons[:, :2], axis=0, return_counts=True)
+    scheduled = {(int(class_id), int(subject_id)): int(count) for (class_id, subject_id), count in zip(pairs, counts)}
+    metrics['unscheduled_hours'] = float(sum(max(0, hours - scheduled.get(key, 0)) for key, hours in planned.items()))
+    planned_total = sum(planned.values())
+
+    if len(lessons) == 0:
+        return _result(metrics, 0, planned_total, started)
+
+    class_ids, class_index = _dense_index(lessons[:, 0])
+    teacher_ids, teacher_index = _dense_index(lessons[:, 2])
+    subject_ids, subject_index = _dense_index(lessons[:, 1])
+    day = lessons[:, 3] - 1
+    period = lessons[:, 4] - 1
+
+    # 教师×天×节次：是否有课（合班、单双周在同一时间段只算一次）
+    teacher_busy = np.zeros((len(teacher_ids), days, periods), dtype=bool)
+    teacher_busy[teacher_index, day, period] = True
+    teaching = teacher_ids != 0
+    teacher_busy = teacher_busy[teaching]
+
+    # 空节：当天最后一节与第一节之间的节数 - 有课节数
+    daily_count = teacher_busy.sum(axis=2)
+    has_lessons = daily_count > 0
+    first = np.argmax(teacher_busy, axis=2)
+    last = periods - 1 - np.argmax(teacher_busy[:, :, ::-1], axis=2)
+    metrics['teacher_gaps'] = float(np.where(has_lessons, last - first + 1 - daily_count, 0).sum())
+
+    # 班级×天×学科：同一天重复出现的学科
+    class_day_subject = np.zeros((len(class_ids), days, len(subject_ids)), dtype=np.int16)
+    np.add.at(class_day_subject, (class_index, day, subject_index), 1)
+    metrics['same_day_repeats'] = float(np.clip(class_day_subject - 1, 0, None).sum())
+
+    # 主科不在上午
+    major_ids = np.array([s.id for s in subjects if s.is_major], dtype=np.int32)
+    metrics['major_outside_morning'] = float((np.isin(lessons[:, 1], major_ids) & (lessons[:, 4] > morning)).sum())
+
+    # 第一节课学科分布：每个班第一节同一学科出现多次的次数
+    first_period = period == 0
+    class_subject_first = np.zeros((len(class_ids), len(subject_ids)), dtype=np.int16)
+    np.add.at(class_subject_first, (class_index[first_period], subject_index[first_period]), 1)
+    metrics['first_period_repeats'] = float(np.clip(class_subject_first - 1, 0, None).sum())
+
+    # 每天课时数的均衡程度（只统计有课的上课日：周六只排少数科目，不计入均衡）
+    weekdays = min(days, SATURDAY - 1)
+    class_daily = np.zeros((len(class_ids), days), dtype=np.int16)
+    np.add.at(class_daily, (class_index, day), 1)
+    metrics['class_daily_imbalance'] = round(float(class_daily[:, :weekdays].std(axis=1).sum()), 3)
+    metrics['teacher_daily_imbalance'] = round(float(daily_count[:, :weekdays].std(axis=1).sum()), 3)
+
+    # 周六：周六科目必须在周六，其他科目不应占用周六
+    saturday_ids = np.array([s.id for s in subjects if s.fixed_day == SATURDAY], dtype=np.int32)
+    is_saturday_subject = np.isin(lessons[:, 1], saturday_ids)
+    on_saturday = lessons[:, 3] == SATURDAY
+    metrics['saturday_misplaced'] = float((is_saturday_subject != on_saturday).sum())
+    metrics['saturday_lessons'] = int(on_saturday.sum())
+
+    return _result(metrics, len(lessons), planned_total, started)
+
+
+def _result(metrics: Dict, lesson_count: int, planned_total: int, started: float) -> Dict:
+    penalty = sum(WEIGHTS[name] * metrics[name] for name in WEIGHTS)
+    coverage = (planned_total - metrics['unscheduled_hours']) / planned_total if planned_total else 1.0
+    return {
+        'metrics': metrics,
+        'penalty': round(penalty, 3),
+        'lessons': lesson_count,
+        'planned_hours': planned_total,
+        'coverage': round(coverage, 4),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+def compare_scores(current: Dict, other: Dict) -> Dict:
+    """
+    比较两张课表的评分
+
+    Returns:
+        Dict: 两者的评分、各项指标的差值（当前 - 对比）、节数和课时覆盖率的差值，以及哪一张更好
+              （总扣分包括缺课，缺课多的课表不会因为其他扣分项少而更好）
+    """
+    delta = {name: round(current['metrics'][name] - other['metrics'].get(name, 0), 3)
+             for name in current['metrics']}
+    penalty_delta = round(current['penalty'] - other['penalty'], 3)
+    return {
+        'current': current,
+        'other': other,
+        'delta': delta,
+        'lessons_delta': current['lessons'] - other['lessons'],
+        'coverage_delta': round(current['coverage'] - other['coverage'], 4),
+        'penalty_delta': penalty_delta,
+        'better': 'current' if penalty_delta < 0 else ('other' if penalty_delta > 0 else 'equal')
+    }
+
+
+def score_current(setting: Optional[object] = None) -> Dict:
+    """评价当前课表"""
+    return score_lessons(load_lessons(), setting)
@@ -0,0 +1,390 @@
+"""
+自动排课求解器
+与 routes/schedule.py 中 auto_schedule 的排课规则相同（固定排课日的科目 → 合班课 → 主科上午 → 其余课程），
+但不直接读写数据库：load_problem() 用少量查询把排课所需的数据一次性读成普通的元组和字典，
+solve() 只在内存中计算并返回课表，save_lessons() 再用一次批量删除 + 批量插入写回。
+三个函数都可以传入 SolverTelemetry，记录各阶段的耗时和计数（见 solver_telemetry.py）。
+因为问题数据可以序列化，同一个问题可以拆开后交给多个进程同时求解（见 schedule_decomposition.py）。
+约束条件的定义见 timetable_constraints.py
+"""
+
+import random
+from collections import defaultdict, namedtuple
+from typing import Iterable, List, Optional, Tuple
+
+from database import db
+from models import Schedule, TeachingPlan, SubjectBlock, CommonCourse, class_combination_detail
+import reference_cache
+from schedule_grid import DAY_NAMES
+from solver_telemetry import SolverTelemetry
+from timetable_constraints import ConstraintPipeline, SlotState, optional_constraints
+
+
+# 可以选择的约束条件（timetable_constraints.CONSTRAINTS 中登记的），未指定时默认全部启用
+DEFAULT_CONSTRAINTS = optional_constraints()
+
+# fixed_day 为学科的固定排课日（如周六科目为6），没有时为None
+PlanRow = namedtuple('PlanRow', ['id', 'class_id', 'subject_id', 'teacher_id', 'hours_per_week',
+                                 'is_combined', 'combination_id', 'is_major', 'fixed_day'])
+
+# 求解结果中的一节课：(班级ID, 学科ID, 教师ID, 星期, 节次, 是否合班, 合班ID)
+Lesson = Tuple[int, int, int, int, int, bool, Optional[int]]
+
+
+class SchedulingProblem:
+    """
+    一次排课所需的全部数据（只包含普通的元组、字典和集合，可以序列化后交给其他进程）
+
+    Attributes:
+        plans: 要排课的授课计划
+        combinations: 合班ID -> 合班中的班级ID
+        subject_blocks: (星期, 节次) -> (是否禁排所有学科, 禁排的学科ID)
+        common_courses: (星期, 节次) -> (是否适用于所有班级, 班级ID)
+        teacher_max_hours: 教师ID -> 每天最大课时数
+        busy_teacher_slots: 教师ID -> 在排课范围以外的班级中已占用的时间段
+        busy_class_slots: 排课范围以外的班级ID -> 已占用的时间段
+    """
+
+    def __init__(self, plans, days_per_week=5, periods_per_day=8, morning_periods=4, major_subjects_morning=True,
+                 combinations=None, subject_blocks=None, common_courses=None, teacher_max_hours=None,
+                 busy_teacher_slots=None, busy_class_slots=None, class_names=None, subject_names=None):
+        self.plans = tuple(plans)
+        self.days_per_week = days_per_week
+        self.periods_per_day = periods_per_day
+        self.morning_periods = morning_periods
+        self.major_subjects_morning = major_subjects_morning
+        self.combinations = combinations or {}
+        self.subject_blocks = subject_blocks or {}
+        self.common_courses = common_courses or {}
+        self.teacher_max_hours = teacher_max_hours or {}
+        self.busy_teacher_slots = busy_teacher_slots or {}
+        self.busy_class_slots = busy_class_slots or {}
+        self.class_names = class_names or {}
+        self.subject_names = subject_names or {}
+
+    @property
+    def class_ids(self):
+        return {plan.class_id for plan in self.plans}
+
+    def subset(self, plan_ids: Iterable[int]) -> 'SchedulingProblem':
+        """只包含指定授课计划的子问题，其余数据共用"""
+        plan_ids = set(plan_ids)
+        return SchedulingProblem(
+            [plan for plan in self.plans if plan.id in plan_ids],
+            self.days_per_week, self.periods_per_day, self.morning_periods, self.major_subjects_morning,
+            self.combinations, self.subject_blocks, self.common_courses, self.teacher_max_hours,
+            self.busy_teacher_slots, self.busy_class_slots, self.class_names, self.subject_names
+        )
+
+
+def load_problem(class_ids: Optional[Iterable[int]] = None,
+                 telemetry: Optional[SolverTelemetry] = None) -> SchedulingProblem:
+    """
+    从数据库读取排课问题
+
+    Args:
+        class_ids: 要排课的班级ID，为空表示全校
+        telemetry: 记录读取耗时（load 阶段）和SQL语句数
+
+    Returns:
+        SchedulingProblem: 排课问题
+    """
+    telemetry = telemetry or SolverTelemetry()
+    with telemetry.phase('load'), telemetry.statements(db.session.get_bind()):
+        problem = _read_problem(class_ids)
+    telemetry.count('plans', len(problem.plans))
+    return problem
+
+
+def _read_problem(class_ids: Optional[Iterable[int]]) -> SchedulingProblem:
+    setting = reference_cache.get_schedule_setting()
+    subjects = reference_cache.get_subjects()
+    subject_names = {subject.id: subject.name for subject in subjects}
+    major_ids = {subject.id for subject in subjects if subject.is_major}
+    fixed_days = {subject.id: subject.fixed_day for subject in subjects if subject.fixed_day}
+
+    query = db.session.query(
+        TeachingPlan.id, TeachingPlan.class_id, TeachingPlan.subject_id, TeachingPlan.teacher_id,
+        TeachingPlan.hours_per_week, TeachingPlan.is_combined, TeachingPlan.combination_id)
+    if class_ids is not None:
+        class_ids = set(class_ids)
+        query = query.filter(TeachingPlan.class_id.in_(class_ids))
+    plans = []
+    for plan_id, class_id, subject_id, teacher_id, hours, is_combined, combination_id in query:
+        plans.append(PlanRow(plan_id, class_id, subject_id, teacher_id, hours or 0, bool(is_combined),
+                             combination_id, subject_id in major_ids, fixed_days.get(subject_id)))
+
+    combinations = defaultdict(list)
+    for combination_id, class_id in db.session.query(
+            class_combination_detail.c.combination_id, class_combination_detail.c.class_id):
+        combinations[combination_id].append(class_id)
+
+    subject_blocks = {}
+    for day, period, subject_id, is_block_all in db.session.query(
+            SubjectBlock.day_of_week, SubjectBlock.period, SubjectBlock.subject_id, SubjectBlock.is_block_all):
+        all_blocked, blocked = subject_blocks.get((day, period), (False, frozenset()))
+        if is_block_all:
+            all_blocked = True
+        elif subject_id:
+            blocked = blocked | {subject_id}
+        subject_blocks[(day, period)] = (all_blocked, blocked)
+
+    common_courses = {
+        (day, period): (bool(apply_all), class_id)
+        for day, period, apply_all, class_id in db.session.query(
+            CommonCourse.day_of_week, CommonCourse.period, CommonCourse.apply_to_all_classes, CommonCourse.class_id)
+    }
+
+    # 排课范围以外的班级的现有课程：占用教师的时间段，合班时也占用这些班级的时间段
+    busy_teacher_slots = defaultdict(set)
+    busy_class_slots = defaultdict(set)
+    if class_ids is not None:
+        existing = db.session.query(Schedule.class_id, Schedule.teacher_id, Schedule.day_of_week, Schedule.period) \
+            .filter(Schedule.class_id.notin_(class_ids))
+        for class_id, teacher_id, day, period in existing:
+            busy_teacher_slots[teacher_id].add((day, period))
+            busy_class_slots[class_id].add((day, period))
+
+    return SchedulingProblem(
+        plans,
+        days_per_week=setting.days_per_week or 5,
+        periods_per_day=setting.periods_per_day or 8,
+        morning_periods=setting.morning_periods or 4,
+        major_subjects_morning=bool(setting.major_subjects_morning),
+        combinations={key: tuple(value) for key, value in combinations.items()},
+        subject_blocks=subject_blocks,
+        common_courses=common_courses,
+        teacher_max_hours={teacher.id: teacher.max_hours_per_day for teacher in reference_cache.get_teachers()},
+        busy_teacher_slots=dict(busy_teacher_slots),
+        busy_class_slots=dict(busy_class_slots),
+        class_names={item.id: item.name for item in reference_cache.get_classes()},
+        subject_names=subject_names
+    )
+
+
+def solve(problem: SchedulingProblem, constraints: Optional[Iterable[str]] = None,
+          seed: Optional[int] = None, telemetry: Optional[SolverTelemetry] = None) -> Tuple[bool, str, List[Lesson]]:
+    """
+    求解排课问题（不访问数据库）
+
+    候选时段和各班级、教师的占用情况都是位掩码，启用的约束在开始时编译为 ConstraintPipeline（见 timetable_constraints.py）
+
+    Args:
+        problem: 排课问题
+        constraints: 启用的约束条件，默认全部启用
+        seed: 随机数种子，相同的种子和问题得到相同的课表
+        telemetry: 记录各阶段（saturday、combined、major_morning、general）的耗时，以及评估的候选时段数
+            (candidate_slots)、被各类约束排除的时段数 (rejected_*)、无处可排的次数 (dead_ends)、
+            主科上午排不下改排下午的次数 (afternoon_retries) 和安排的课时数 (lessons)
+
+    Returns:
+        Tuple[bool, str, List[Lesson]]: (是否成功, 说明, 课表)
+    """
+    telemetry = telemetry or SolverTelemetry()
+    counters = telemetry.counters
+    enabled = set(DEFAULT_CONSTRAINTS if constraints is None else constraints)
+    rnd = random.Random(seed)
+    involved_class_ids = problem.class_ids
+    class_name = problem.class_names.get
+    subject_name = problem.subject_names.get
+
+    state = SlotState(problem.days_per_week, problem.periods_per_day)
+    pipeline = ConstraintPipeline(problem, state, enabled, counters)
+    all_slots = state.full
+    morning_slots = state.mask((day, period) for day in range(1, problem.days_per_week + 1)
+                               for period in range(1, problem.morning_periods + 1))
+    afternoon_slots = all_slots & ~morning_slots
+    first_period_slots = state.mask((day, 1) for day in range(1, problem.days_per_week + 1))
+
+    fixed_day_priority = 'saturday_priority' in enabled
+    fixed_day_plans = [plan for plan in problem.plans if fixed_day_priority and plan.fixed_day]
+    normal_plans = [plan for plan in problem.plans if not (fixed_day_priority and plan.fixed_day)]
+
+    # 主课优先、合班优先、课时少的优先，加入随机性以打破可能的死锁
+    def priority(plan):
+        return (-1 if plan.is_major else 0, -1 if plan.is_combined else 0, plan.hours_per_week, rnd.random())
+
+    sorted_fixed_day_plans = sorted(fixed_day_plans, key=priority)
+    sorted_normal_plans = sorted(normal_plans, key=priority)
+
+    combination_groups = defaultdict(list)
+    for plan in sorted_fixed_day_plans + sorted_normal_plans:
+        if plan.is_combined and plan.combination_id:
+            combination_groups[plan.combination_id].append(plan)
+
+    first_period_subject_count = defaultdict(lambda: defaultdict(int))
+    plan_hours_scheduled = defaultdict(int)
+    lessons: List[Lesson] = []
+
+    for teacher_id, busy in problem.busy_teacher_slots.items():
+        state.teacher_used[teacher_id] |= state.mask(busy)
+        for day, _ in busy:
+            state.teacher_day_count[teacher_id][day] += 1
+
+    def add_lesson(plan, day, period):
+        bit = state.bit(day, period)
+        combination_id = plan.combination_id if plan.is_combined else None
+        lessons.append((plan.class_id, plan.subject_id, plan.teacher_id, day, period, plan.is_combined, combination_id))
+
+        # 合班课为合班中在排课范围内的其他班级也安排相同的课程
+        if plan.is_combined and plan.combination_id:
+            for other_class_id in problem.combinations.get(plan.combination_id, ()):
+                if other_class_id != plan.class_id and other_class_id in involved_class_ids:
+                    lessons.append((other_class_id, plan.subject_id, plan.teacher_id, day, period, True,
+                                    plan.combination_id))
+                    state.class_used[other_class_id] |= bit
+                    if period == 1:
+                        first_period_subject_count[other_class_id][plan.subject_id] += 1
+            state.combo_used[plan.combination_id] |= bit
+
+        state.class_used[plan.class_id] |= bit
+        state.teacher_used[plan.teacher_id] |= bit
+        plan_hours_scheduled[plan.id] += 1
+        counters['lessons'] += 1
+        state.teacher_day_count[plan.teacher_id][day] += 1
+
+    def schedule_class(plan, available_slots):
+        if plan_hours_scheduled[plan.id] >= plan.hours_per_week:
+            return True
+
+        counters['candidate_slots'] += available_slots.bit_count()
+        valid_slots = pipeline.filter(plan, available_slots)
+        if not valid_slots:
+            counters['dead_ends'] += 1
+            return False
+
+        # 第一节课均匀分配：当前科目在第一节的次数低于平均值时优先安排第一节
+        if 'first_period_balance' in enabled and valid_slots & first_period_slots:
+            subject_counts = first_period_subject_count[plan.class_id]
+            if subject_counts:
+                average = sum(subject_counts.values()) / len(subject_counts)
+                if subject_counts.get(plan.subject_id, 0) < average:
+                    day, period = rnd.choice(state.slots(valid_slots & first_period_slots))
+                    add_lesson(plan, day, period)
+                    first_period_subject_count[plan.class_id][plan.subject_id] += 1
+                    return True
+
+        day, period = rnd.choice(state.slots(valid_slots))
+        add_lesson(plan, day, period)
+        if period == 1:
+            first_period_subject_count[plan.class_id][plan.subject_id] += 1
+        return True
+
+    def schedule_morning_first(plan):
+        """主科先排上午，上午没有可用时段时改排下午"""
+        if schedule_class(plan, morning_slots):
+            return True
+        counters['afternoon_retries'] += 1
+        return schedule_class(plan, afternoon_slots)
+
+    # 第一阶段：有固定排课日的科目（如周六科目）先排在这一天，这一天排不下的课时排在其他天
+    with telemetry.phase('saturday'):
+        if fixed_day_plans:
+            # 按班级检查固定排课日的时段是否足够（合班课在每个班级各有一条计划）
+            needed = defaultdict(int)
+            for plan in fixed_day_plans:
+                day_size = state.day_masks.get(plan.fixed_day, 0).bit_count()
+                needed[(plan.class_id, plan.fixed_day)] += min(plan.hours_per_week, day_size)
+            for (class_id, day), hours in needed.items():
+                day_size = state.day_masks.get(day, 0).bit_count()
+                if hours > day_size:
+                    return False, (f'错误：{DAY_NAMES[day - 1]}没有足够的时段安排 {class_name(class_id)} '
+                                   f'所有固定在{DAY_NAMES[day - 1]}的科目，需要至少 {hours} 个时段，'
+                                   f'但{DAY_NAMES[day - 1]}只有 {day_size} 个时段'), []
+
+            for plan in fixed_day_plans:
+                day_slots = state.day_masks.get(plan.fixed_day, 0)
+                hours_on_day = min(plan.hours_per_week, day_slots.bit_count())
+                for _ in range(hours_on_day):
+                    available = pipeline.filter(plan, day_slots)
+                    if not available:
+                        return False, (f'无法为 {class_name(plan.class_id)} 的 {subject_name(plan.subject_id)} '
+                                       f'在{DAY_NAMES[plan.fixed_day - 1]}安排课程，没有符合约束条件的时段'), []
+                    day, period = state.slots(available & -available)[0]
+                    add_lesson(plan, day, period)
+
+                for _ in range(plan.hours_per_week - hours_on_day):
+                    if not schedule_class(plan, all_slots & ~day_slots):
+                        return False, (f'无法为 {class_name(plan.class_id)} 的 {subject_name(plan.subject_id)} '
+                                       f'在其他天安排剩余课时'), []
+
+    morning_first = 'major_morning' in enabled and problem.major_subjects_morning
+
+    # 第二阶段：合班课，合班中的所有班级使用相同的时间段
+    with telemetry.phase('combined'):
+        skipped_combinations = []
+        for combination_id, combo_plans in combination_groups.items():
+            main_plan = combo_plans[0]
+            if fixed_day_priority and any(plan.fixed_day for plan in combo_plans) \
+                    and plan_hours_scheduled[main_plan.id] >= main_plan.hours_per_week:
+                continue
+
+            if not {plan.class_id for plan in combo_plans}.issubset(involved_class_ids):
+                skipped_combinations.append(combination_id)
+                continue
+
+            if morning_first and main_plan.is_major:
+                while plan_hours_scheduled[main_plan.id] < main_plan.hours_per_week:
+                    if not schedule_morning_first(main_plan):
+                        return False, f'无法为合班课 {subject_name(main_plan.subject_id)} 安排足够的课时', []
+            while plan_hours_scheduled[main_plan.id] < main_plan.hours_per_week:
+                if not schedule_class(main_plan, all_slots):
+                    return False, f'无法为合班课 {subject_name(main_plan.subject_id)} 安排足够的课时', []
+
+            for other_plan in combo_plans[1:]:
+                plan_hours_scheduled[other_plan.id] = main_plan.hours_per_week
+
+    # 第三阶段：其余课程，主科先排上午
+    remaining_plans = [
+        plan for plan in sorted_normal_plans
+        if plan_hours_scheduled[plan.id] < plan.hours_per_week
+        and not (plan.is_combined and plan.combination_id in combination_groups)
+    ]
+    if morning_first:
+        with telemetry.phase('major_morning'):
+            for plan in remaining_plans:
+                if plan.is_major:
+                    while plan_hours_scheduled[plan.id] < plan.hours_per_week:
+                        if not schedule_morning_first(plan):
+                            return False, f'无法为 {class_name(plan.class_id)} 的 {subject_name(plan.subject_id)} 安排足够的课时', []
+    with telemetry.phase('general'):
+        for plan in remaining_plans:
+            while plan_hours_scheduled[plan.id] < plan.hours_per_week:
+                if not schedule_class(plan, all_slots):
+                    return False, f'无法为 {class_name(plan.class_id)} 的 {subject_name(plan.subject_id)} 安排足够的课时', []
+
+    message = '排课成功'
+    if skipped_combinations:
+        message += f'（合班 {", ".join(map(str, skipped_combinations))} 的部分班级不在排课范围内，未自动排课）'
+    return True, message, lessons
+
+
+def save_lessons(lessons: List[Lesson], class_ids: Optional[Iterable[int]] = None,
+                 telemetry: Optional[SolverTelemetry] = None):
+    """
+    用求解结果替换课表：删除排课范围内班级的课程后批量插入，在一个事务中提交
+
+    Args:
+        lessons: solve() 返回的课表
+        class_ids: 排课范围内的班级ID，为空表示全校
+        telemetry: 记录写回耗时（save 阶段）和SQL语句数
+    """
+    telemetry = telemetry or SolverTelemetry()
+    with telemetry.phase('save'), telemetry.statements(db.session.get_bind()):
+        try:
+            query = Schedule.query
+            if class_ids is not None:
+                query = query.filter(Schedule.class_id.in_(set(class_ids)))
+            query.delete(synchronize_session=False)
+            db.session.bulk_insert_mappings(Schedule, [
+                {
+                    'class_id': class_id, 'subject_id': subject_id, 'teacher_id': teacher_id,
+                    'day_of_week': day, 'period': period, 'is_combined': is_combined,
+                    'combination_id': combination_id, 'week_type': 'all'
+                }
+                for class_id, subject_id, teacher_id, day, period, is_combined, combination_id in lessons
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise